@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+Netcup VPS ARM Availability Scraper - Polling diretto dell'API
+Interroga l'endpoint JSON di disponibilità scoperto dalla versione Selenium
+(python scraper_selenium.py → opzione 3) al posto di scaricare la pagina:
+pochi KB di JSON per controllo, senza browser e senza parsing HTML
+"""
+
+import json
+import os
+import sys
+import time
+from datetime import datetime
+import logging
+from urllib.parse import urlparse
+
+import requests
+
+from async_engine import AsyncFetchEngine
+from catalog_discovery import load_products
+from history_store import history_store_from_config
+from http_session import configure_from_config, get_session
+import metrics
+from metrics import record_error, stage, timed_check
+from structured_data import availability_from_json
+
+# Configurazione logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler('scraper.log'),
+        logging.StreamHandler(sys.stdout)
+    ]
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ENDPOINT_FILE = 'api_endpoint.json'
+SLUG_PLACEHOLDER = '{slug}'
+
+# Header della richiesta originale riusati dal poller (niente cookie né token di sessione)
+_REUSED_HEADERS = ('accept', 'accept-language', 'content-type')
+
+
+def product_slug(url):
+    """Ultimo segmento del percorso dell'URL prodotto (es. vps-1000-arm-g11-iv-mnz)"""
+    return urlparse(url).path.rstrip('/').rsplit('/', 1)[-1]
+
+
+class ApiEndpoint:
+    def __init__(self, method, url_template, headers=None, body_template=None,
+                 per_product=True, discovered_from=None, discovered_at=None):
+        """
+        Modello di richiesta: {slug} in URL e corpo viene sostituito con lo slug del prodotto.
+        per_product=False: una sola risposta contiene tutti i prodotti
+        """
+        self.method = method.upper()
+        self.url_template = url_template
+        self.headers = headers or {}
+        self.body_template = body_template
+        self.per_product = per_product
+        self.discovered_from = discovered_from
+        self.discovered_at = discovered_at or datetime.now().isoformat()
+
+    @classmethod
+    def from_request(cls, request, product):
+        """Crea il modello da una richiesta registrata dal browser (evento CDP Network.requestWillBeSent)"""
+        slug = product_slug(product['url'])
+        url = request['url']
+        body = request.get('postData')
+        per_product = bool(slug) and (slug in url or (body is not None and slug in body))
+        if per_product:
+            url = url.replace(slug, SLUG_PLACEHOLDER)
+            if body is not None:
+                body = body.replace(slug, SLUG_PLACEHOLDER)
+
+        headers = {
+            name: value for name, value in request.get('headers', {}).items()
+            if name.lower() in _REUSED_HEADERS
+        }
+        return cls(request.get('method', 'GET'), url, headers, body,
+                   per_product=per_product, discovered_from=product['url'])
+
+    @classmethod
+    def load(cls, path=DEFAULT_ENDPOINT_FILE):
+        """Carica il modello salvato; None se la scoperta non è ancora stata fatta"""
+        try:
+            with open(path, 'r') as f:
+                return cls(**json.load(f))
+        except FileNotFoundError:
+            return None
+
+    def to_dict(self):
+        return {
+            'method': self.method,
+            'url_template': self.url_template,
+            'headers': self.headers,
+            'body_template': self.body_template,
+            'per_product': self.per_product,
+            'discovered_from': self.discovered_from,
+            'discovered_at': self.discovered_at,
+        }
+
+    def save(self, path=DEFAULT_ENDPOINT_FILE):
+        """Salva il modello su file (scrittura atomica)"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+        os.replace(tmp_path, path)
+
+    def fetch(self, product=None):
+        """Esegue la richiesta per il prodotto e ritorna il JSON decodificato"""
+        # Sostituzione letterale: il corpo JSON contiene altre graffe
+        slug = product_slug(product['url']) if product else ''
+        url = self.url_template.replace(SLUG_PLACEHOLDER, slug)
+        body = self.body_template.replace(SLUG_PLACEHOLDER, slug) if self.body_template else None
+
+        response = get_session().request(
+            self.method, url, headers=self.headers,
+            data=body.encode('utf-8') if body is not None else None,
+        )
+        response.raise_for_status()
+        return response.json()
+
+
+class NetcupApiPoller:
+    def __init__(self, config_file='config.json'):
+        """Inizializza il poller con la configurazione e l'endpoint salvato"""
+        with open(config_file, 'r') as f:
+            self.config = json.load(f)
+
+        self.log_file = self.config['log_file']
+        self.products = load_products(self.config)
+
+        api_config = self.config.get('api', {})
+        self.endpoint_file = api_config.get('endpoint_file', DEFAULT_ENDPOINT_FILE)
+        self.check_interval = api_config.get('check_interval_seconds', 300)
+        self.endpoint = ApiEndpoint.load(self.endpoint_file)
+
+        # Sessione HTTP condivisa e stessi limiti per host della versione leggera
+        configure_from_config(self.config)
+        self.engine = AsyncFetchEngine(
+            max_per_host=self.config.get('max_concurrent_per_host', 2),
+            politeness_delay=self.config.get('politeness_delay_seconds', 1.0),
+        )
+
+        self.history = history_store_from_config(self.config)
+
+    def _result(self, product, details=None, error=None):
+        """Risultato nel formato degli altri scraper"""
+        result = {
+            'name': product['name'],
+            'url': product['url'],
+            'available': None,
+            'status': "UNKNOWN",
+            'timestamp': datetime.now().isoformat()
+        }
+        if error is not None:
+            result['status'] = "ERROR"
+            result['error'] = str(error)
+        elif details is not None:
+            result.update(details)
+        return result
+
+    @timed_check
+    def check_availability(self, product, payload=None):
+        """Controlla un prodotto con l'endpoint (payload già scaricato se condiviso)"""
+        try:
+            if payload is None:
+                payload = self.endpoint.fetch(product)
+        except (requests.RequestException, ValueError) as e:
+            logger.error(f"Errore API per {product['name']}: {e}")
+            record_error(e)
+            return self._result(product, error=e)
+
+        with stage('parse'):
+            details = availability_from_json(payload, product)
+        if details is None:
+            logger.warning(f"  {product['name']}: risposta API non conclusiva (rifare la scoperta?)")
+        else:
+            logger.info(f"  → {product['name']}: {details['status']} (API)")
+        return self._result(product, details)
+
+    def check_products(self, products):
+        """Controlla i prodotti tramite l'endpoint (risultati nello stesso ordine)"""
+        if self.endpoint is None:
+            error = f"nessun endpoint in {self.endpoint_file}: eseguire prima la scoperta (scraper_selenium.py)"
+            logger.error(error)
+            return [self._result(product, error=error) for product in products]
+
+        if self.endpoint.per_product:
+            return self.engine.run(products, self.check_availability)
+
+        # Endpoint condiviso: una sola richiesta per tutti i prodotti
+        try:
+            payload = self.endpoint.fetch()
+        except (requests.RequestException, ValueError) as e:
+            logger.error(f"Errore API: {e}")
+            record_error(e)
+            return [self._result(product, error=e) for product in products]
+        return [self.check_availability(product, payload) for product in products]
+
+    def save_results(self, results):
+        """Salva i risultati nello storico (una sola scrittura in append)"""
+        try:
+            with stage('history_write'):
+                self.history.append(results)
+            logger.info(f"Risultati salvati in {self.log_file}")
+
+        except Exception as e:
+            logger.error(f"Errore nel salvare i risultati: {e}")
+
+    def run_check(self):
+        """Esegue un singolo ciclo di controllo per tutti i prodotti"""
+        logger.info("=" * 60)
+        logger.info(f"Inizio controllo disponibilità (API) - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        logger.info("=" * 60)
+
+        results = self.check_products(self.products)
+        self.save_results(results)
+
+        # Mostra riepilogo
+        logger.info("\n" + "=" * 60)
+        logger.info("RIEPILOGO:")
+        for result in results:
+            status_emoji = "✅" if result['available'] else "❌" if result['available'] is False else "❓"
+            logger.info(f"  {status_emoji} {result['name']}: {result['status']}")
+        logger.info("=" * 60 + "\n")
+
+        return results
+
+    def run_continuous(self):
+        """Esegue controlli continui ogni intervallo specificato"""
+        server = metrics.start_from_config(self.config)
+        if server is not None:
+            logger.info(f"Metriche su http://localhost:{server.server_address[1]}/metrics")
+        logger.info(f"Avvio polling API (controllo ogni {self.check_interval} secondi)")
+        logger.info("Premi Ctrl+C per fermare\n")
+
+        try:
+            while True:
+                self.run_check()
+                time.sleep(self.check_interval)
+        except KeyboardInterrupt:
+            logger.info("\nMonitoraggio interrotto dall'utente")
+
+
+def main():
+    """Funzione principale"""
+    poller = NetcupApiPoller()
+
+    # Chiedi all'utente cosa vuole fare
+    print("\nNetcup VPS ARM Availability Scraper (API)")
+    print("=" * 50)
+    print("1. Controllo singolo")
+    print(f"2. Polling continuo (ogni {poller.check_interval} secondi)")
+    print("=" * 50)
+
+    choice = input("\nScegli un'opzione (1 o 2): ").strip()
+
+    if choice == "2":
+        poller.run_continuous()
+        return
+    if choice != "1":
+        print("Opzione non valida. Eseguo un controllo singolo.")
+    poller.run_check()
+    metrics.write_summary(poller.config)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Motore di fetch concorrente basato su asyncio
+Controlla tutti i prodotti in parallelo, limitando le connessioni simultanee
+e distanziando le richieste verso lo stesso host (pausa di cortesia)
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+
+class AsyncFetchEngine:
+    def __init__(self, max_per_host=2, politeness_delay=1.0, max_workers=8):
+        """
+        max_per_host: richieste contemporanee massime verso lo stesso host
+        politeness_delay: secondi minimi tra l'avvio di due richieste allo stesso host
+        max_workers: thread usati per eseguire le funzioni di controllo bloccanti
+        """
+        self.max_per_host = max(1, int(max_per_host))
+        self.politeness_delay = max(0.0, float(politeness_delay))
+        self.max_workers = max(1, int(max_workers))
+
+    async def _check_one(self, product, check_fn, state):
+        """Esegue il controllo di un prodotto rispettando i limiti del suo host"""
+        loop = asyncio.get_running_loop()
+        host = urlparse(product['url']).netloc
+
+        semaphore = state['semaphores'].setdefault(host, asyncio.Semaphore(self.max_per_host))
+        lock = state['locks'].setdefault(host, asyncio.Lock())
+
+        async with semaphore:
+            # Prenota il prossimo slot libero per l'host: le richieste partono
+            # distanziate di politeness_delay anche se eseguite in parallelo
+            async with lock:
+                wait = state['next_slot'].get(host, 0.0) - loop.time()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                state['next_slot'][host] = loop.time() + self.politeness_delay
+
+            return await loop.run_in_executor(state['executor'], check_fn, product)
+
+    async def check_all(self, products, check_fn):
+        """Controlla tutti i prodotti in parallelo, mantenendo l'ordine di input"""
+        workers = min(self.max_workers, max(1, len(products)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # Semafori e lock vanno creati dentro il loop che li usa
+            state = {
+                'executor': executor,
+                'semaphores': {},
+                'locks': {},
+                'next_slot': {},
+            }
+            results = await asyncio.gather(
+                *(self._check_one(product, check_fn, state) for product in products)
+            )
+        return list(results)
+
+    def run(self, products, check_fn):
+        """Punto d'ingresso sincrono: esegue check_all in un nuovo event loop"""
+        return asyncio.run(self.check_all(products, check_fn))
@@ -0,0 +1,444 @@
+#!/usr/bin/env python3
+"""
+Benchmark degli scraper su pagine salvate
+
+Uso:
+    python benchmark.py download pagine/          # salva le pagine dei prodotti in config.json
+    python benchmark.py classifier pagine/*.html  # confronta BeautifulSoup e classificatore in streaming
+    python benchmark.py lean [--rounds 3]         # Selenium: profilo standard contro profilo lean
+    python benchmark.py engines fixtures/netcup.json.gz [--rounds 3] [--variant deep-nesting]
+                                                  # motori a confronto sulle fixture registrate (fixtures.py)
+"""
+
+import argparse
+import json
+import math
+import os
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from bs4 import BeautifulSoup
+
+from classifier import PRECEDENCES, ClassifierRules, load_rules
+from stream_classifier import classify_html
+from structured_data import extract_availability
+
+
+# --- Implementazione di riferimento (percorso BeautifulSoup originale) ---
+
+def soup_classify(html, rules):
+    """
+    Classificazione originale con BeautifulSoup e un controllo 'in' per ogni
+    marcatore, parametrizzata con le stesse regole del classificatore in streaming
+    """
+    soup = BeautifulSoup(html, 'lxml')
+    page_text = soup.get_text().lower()
+    text_markers = rules.markers['text']
+
+    if any(m in page_text for m in text_markers['sold_out']):
+        text_verdict = (False, "SOLD OUT")
+    elif any(m in page_text for m in text_markers['available']):
+        text_verdict = (True, "AVAILABLE")
+    else:
+        text_verdict = None
+
+    # In modalità 'text' i button servono solo se il testo non ha marcatori
+    button_verdict = None
+    if rules.precedence == 'button' or text_verdict is None:
+        button_markers = rules.markers['button']
+        for button in soup.find_all('button'):
+            button_text = button.get_text().strip().lower()
+            if any(m in button_text for m in button_markers['sold_out']):
+                button_verdict = (False, "SOLD OUT")
+                break
+            elif any(m in button_text for m in button_markers['available']):
+                button_verdict = (True, "AVAILABLE")
+                break
+
+    return rules.combine(text_verdict, button_verdict)
+
+
+def structured_classify(html):
+    """Solo dati strutturati (JSON-LD / payload di idratazione), senza euristiche sul testo"""
+    details = extract_availability(html)
+    if details is None:
+        return None, "NO PAYLOAD"
+    return details['available'], details['status']
+
+
+def build_classifiers(rules):
+    """Classificatori da confrontare, per entrambe le precedenze, più i dati strutturati"""
+    classifiers = {}
+    for precedence in PRECEDENCES:
+        variant = ClassifierRules(dict(rules.to_dict(), precedence=precedence))
+        classifiers[f'soup-{precedence}'] = lambda html, r=variant: soup_classify(html, r)
+        classifiers[f'stream-{precedence}'] = lambda html, r=variant: classify_html(html, r)
+    classifiers['structured'] = structured_classify
+    return classifiers
+
+
+# --- Misure ---
+
+def measure(fn, html, repeat):
+    """Ritorna (risultato, tempo CPU medio in ms, picco di memoria in KiB)"""
+    start = time.process_time()
+    for _ in range(repeat):
+        result = fn(html)
+    cpu_ms = (time.process_time() - start) * 1000 / repeat
+
+    # Il picco di memoria si misura a parte: tracemalloc rallenta l'esecuzione.
+    # Conta le allocazioni Python (albero BeautifulSoup, stringhe di testo),
+    # non la memoria interna di libxml2
+    tracemalloc.start()
+    fn(html)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return result, cpu_ms, peak / 1024
+
+
+def run_classifier_benchmark(paths, repeat, rules):
+    """Confronta i classificatori su ogni pagina e verifica che diano lo stesso risultato"""
+    classifiers = build_classifiers(rules)
+    mismatches = 0
+    totals = {name: [0.0, 0.0] for name in classifiers}
+
+    print(f"{'Pagina':<40} {'Classificatore':<15} {'Risultato':<12} {'CPU ms':>9} {'Picco KiB':>10}")
+    print("-" * 90)
+    for path in paths:
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            html = f.read()
+
+        results = {}
+        for name, fn in classifiers.items():
+            result, cpu_ms, peak_kib = measure(fn, html, repeat)
+            results[name] = result
+            totals[name][0] += cpu_ms
+            totals[name][1] = max(totals[name][1], peak_kib)
+            print(f"{os.path.basename(path)[:40]:<40} {name:<15} {result[1]:<12} {cpu_ms:>9.2f} {peak_kib:>10.1f}")
+
+        for precedence in PRECEDENCES:
+            if results[f'soup-{precedence}'] != results[f'stream-{precedence}']:
+                mismatches += 1
+                print(f"  ⚠️ Risultato diverso con precedenza {precedence}: "
+                      f"{results[f'soup-{precedence}']} vs {results[f'stream-{precedence}']}")
+        print()
+
+    print("=" * 90)
+    print("TOTALE (CPU = somma dei tempi medi, picco = massimo tra le pagine)")
+    for name, (cpu_ms, peak_kib) in totals.items():
+        print(f"  {name:<15} CPU {cpu_ms:>9.2f} ms   picco {peak_kib:>10.1f} KiB")
+    print("=" * 90)
+
+    return mismatches
+
+
+def run_lean_benchmark(config_file, rounds):
+    """
+    Confronta il profilo Selenium standard con quello lean: byte trasferiti e
+    tempo alla decisione per prodotto (un browser, una scheda, nessun salvataggio)
+    """
+    from scraper_selenium import NetcupScraperSelenium
+
+    summary = {}
+    for label, lean_enabled in (('standard', False), ('lean', True)):
+        scraper = NetcupScraperSelenium(config_file)
+        scraper.lean = dict(scraper.lean, enabled=lean_enabled)
+        scraper.pool_size = 1
+        scraper.tabs_per_browser = 1
+        scraper.collect_network_stats = True
+        scraper._open_pool()
+
+        measures = []
+        try:
+            for round_number in range(1, rounds + 1):
+                for product in scraper.products:
+                    started = time.monotonic()
+                    result = scraper._check_batch([product])[0]
+                    elapsed = time.monotonic() - started
+                    measures.append((round_number, product['name'], result, elapsed))
+        finally:
+            scraper.close()
+
+        print(f"\n{label.upper()}")
+        print(f"{'Giro':<5} {'Prodotto':<25} {'Risultato':<12} {'KiB':>10} {'Decisione s':>12} {'Totale s':>9}")
+        for round_number, name, result, elapsed in measures:
+            kib = result.get('bytes_transferred', 0) / 1024
+            ready = result.get('page_ready_seconds', float('nan'))
+            print(f"{round_number:<5} {name[:25]:<25} {result['status']:<12} {kib:>10.1f} {ready:>12.2f} {elapsed:>9.2f}")
+
+        ok = [m for m in measures if m[2]['status'] != 'ERROR']
+        summary[label] = (
+            sum(m[2].get('bytes_transferred', 0) for m in ok) / max(1, len(ok)) / 1024,
+            sum(m[2].get('page_ready_seconds', 0) for m in ok) / max(1, len(ok)),
+        )
+
+    print("\n" + "=" * 60)
+    print("MEDIA PER PRODOTTO")
+    for label, (kib, ready) in summary.items():
+        print(f"  {label:<10} {kib:>10.1f} KiB   decisione in {ready:.2f}s")
+    print("=" * 60)
+
+
+# --- Motori a confronto sulle fixture registrate ---
+
+ENGINES = ('light', 'github', 'selenium')
+
+
+def percentile(values, fraction):
+    """Percentile con il metodo nearest-rank (0 se non ci sono valori)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def _engine_runner(engine, config_file, config, decided):
+    """
+    Ritorna (check_many(prodotti) → risultati, close()) per il motore indicato.
+    decided[nome] riceve l'istante (time.monotonic) in cui il prodotto è stato deciso
+    """
+    if engine == 'light':
+        from scraper_light import NetcupScraperLight
+
+        scraper = NetcupScraperLight(config_file)
+        check_one = scraper.check_availability
+
+        def timed(product):
+            result = check_one(product)
+            decided[product['name']] = time.monotonic()
+            return result
+
+        scraper.check_availability = timed
+        return scraper.check_products, lambda: None
+
+    if engine == 'github':
+        import scraper_github_actions
+        from classifier import rules_from_config
+        from response_cache import ResponseCache
+
+        rules = rules_from_config(config)
+        cache = ResponseCache(config.get('response_cache_file', 'response_cache.json'),
+                              rules_fingerprint=rules.fingerprint)
+
+        def check_many(products):
+            results = []
+            for product in products:
+                results.append(scraper_github_actions.check_availability(product, cache, rules))
+                decided[product['name']] = time.monotonic()
+            cache.save()
+            return results
+
+        return check_many, lambda: None
+
+    if engine == 'selenium':
+        from scraper_selenium import NetcupScraperSelenium
+
+        scraper = NetcupScraperSelenium(config_file)
+        check_batch = scraper._check_batch
+
+        def timed_batch(batch):
+            results = check_batch(batch)
+            now = time.monotonic()
+            for product in batch:
+                decided[product['name']] = now
+            return results
+
+        scraper._check_batch = timed_batch
+        return scraper.check_products, scraper.close
+
+    raise ValueError(f"Motore sconosciuto: {engine}")
+
+
+def run_engine_worker(engine, config_file, rounds, output):
+    """
+    Misura un motore (eseguito in un processo separato, così il picco di RSS è solo suo)
+    e scrive le metriche in JSON su output
+    """
+    from http_session import configure_from_config
+
+    with open(config_file, 'r') as f:
+        config = json.load(f)
+    configure_from_config(config)
+    products = config['products']
+
+    decided = {}
+    check_many, close = _engine_runner(engine, config_file, config, decided)
+    decisions = []
+    correct = mismatched = errors = 0
+
+    cpu_start = time.process_time()
+    wall_start = time.monotonic()
+    try:
+        for _ in range(rounds):
+            decided.clear()
+            started = time.monotonic()
+            results = check_many(products)
+            for product, result in zip(products, results):
+                decisions.append(decided.get(product['name'], time.monotonic()) - started)
+                if result['status'] == 'ERROR':
+                    errors += 1
+                elif (result['available'], result['status']) == (product['expected']['available'],
+                                                                 product['expected']['status']):
+                    correct += 1
+                else:
+                    mismatched += 1
+    finally:
+        close()
+    wall = time.monotonic() - wall_start
+
+    metrics = {
+        'engine': engine,
+        'checks': len(decisions),
+        'wall_seconds': wall,
+        'throughput': len(decisions) / wall if wall else 0.0,
+        'p50_seconds': percentile(decisions, 0.50),
+        'p95_seconds': percentile(decisions, 0.95),
+        'cpu_seconds': time.process_time() - cpu_start,
+        # ru_maxrss è in KiB su Linux
+        'peak_rss_mib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'correct': correct,
+        'mismatched': mismatched,
+        'errors': errors,
+    }
+    with open(output, 'w') as f:
+        json.dump(metrics, f)
+
+
+def run_engines_benchmark(archive_path, engines, rounds, variant='original', config_file='config.json',
+                          latency=0.0, rate_429=0.0, timeout_rate=0.0, politeness_delay=None, timeout=5):
+    """
+    Avvia il server di replay e misura ogni motore sulle stesse pagine, ognuno in un
+    processo separato e con la propria cache (il primo giro è a freddo).
+    Ritorna il numero di risultati diversi dallo stato atteso
+    """
+    from fixtures import ReplayServer, load_archive
+
+    with open(config_file, 'r') as f:
+        base_config = json.load(f)
+
+    server = ReplayServer(load_archive(archive_path), latency=latency, rate_429=rate_429,
+                          timeout_rate=timeout_rate, hang_seconds=timeout * 2, variant=variant, seed=0)
+    summary = []
+    with server, tempfile.TemporaryDirectory() as workdir:
+        for engine in engines:
+            engine_dir = os.path.join(workdir, engine)
+            os.makedirs(engine_dir)
+            config = dict(base_config, products=server.products(), history_backend='jsonl',
+                          log_file='availability_log.jsonl', response_cache_file='response_cache.json',
+                          http=dict(base_config.get('http', {}), timeout_seconds=timeout))
+            if politeness_delay is not None:
+                config['politeness_delay_seconds'] = politeness_delay
+            engine_config = os.path.join(engine_dir, 'config.json')
+            with open(engine_config, 'w') as f:
+                json.dump(config, f)
+
+            output = os.path.join(engine_dir, 'metrics.json')
+            process = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), 'engine-worker', engine,
+                 '--config', engine_config, '--rounds', str(rounds), '--output', output],
+                cwd=engine_dir, capture_output=True, text=True,
+            )
+            if process.returncode != 0:
+                reason = (process.stderr.strip().splitlines() or ['errore sconosciuto'])[-1]
+                print(f"⏭️  {engine}: non eseguito ({reason})")
+                continue
+            with open(output, 'r') as f:
+                summary.append(json.load(f))
+
+    print(f"\nFixture: {archive_path}  variante: {variant}  giri: {rounds}")
+    print(f"{'Motore':<10} {'Controlli':>9} {'Prod/s':>8} {'p50 s':>8} {'p95 s':>8} {'CPU s':>8} "
+          f"{'RSS MiB':>8} {'OK':>5} {'Diversi':>8} {'Errori':>7}")
+    print("-" * 90)
+    for m in summary:
+        print(f"{m['engine']:<10} {m['checks']:>9} {m['throughput']:>8.2f} {m['p50_seconds']:>8.3f} "
+              f"{m['p95_seconds']:>8.3f} {m['cpu_seconds']:>8.2f} {m['peak_rss_mib']:>8.1f} "
+              f"{m['correct']:>5} {m['mismatched']:>8} {m['errors']:>7}")
+    print("=" * 90)
+
+    return sum(m['mismatched'] for m in summary)
+
+
+def download_pages(directory, config_file='config.json'):
+    """Salva le pagine dei prodotti configurati per usarle nei benchmark"""
+    from http_session import get_session
+
+    with open(config_file, 'r') as f:
+        config = json.load(f)
+
+    os.makedirs(directory, exist_ok=True)
+    for product in config['products']:
+        response = get_session().get(product['url'], timeout=15)
+        response.raise_for_status()
+        filename = re.sub(r'[^a-z0-9]+', '-', product['name'].lower()).strip('-') + '.html'
+        path = os.path.join(directory, filename)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(response.text)
+        print(f"✅ {product['name']} → {path}")
+
+
+def main():
+    """Funzione principale"""
+    parser = argparse.ArgumentParser(description="Benchmark degli scraper Netcup")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    download = subparsers.add_parser('download', help="Salva le pagine prodotto correnti")
+    download.add_argument('directory')
+    download.add_argument('--config', default='config.json')
+
+    classifier = subparsers.add_parser('classifier', help="Confronta i classificatori HTML")
+    classifier.add_argument('pages', nargs='+', help="File HTML salvati")
+    classifier.add_argument('--repeat', type=int, default=20)
+    classifier.add_argument('--config', default='config.json', help="Regole di classificazione")
+
+    lean = subparsers.add_parser('lean', help="Confronta il profilo Selenium standard e lean")
+    lean.add_argument('--config', default='config.json')
+    lean.add_argument('--rounds', type=int, default=3,
+                      help="Giri ripetuti (dal secondo la cache su disco del profilo lean è calda)")
+
+    engines = subparsers.add_parser('engines', help="Confronta i motori sulle fixture registrate (fixtures.py)")
+    engines.add_argument('archive', help="Archivio creato con 'python fixtures.py record'")
+    engines.add_argument('--engines', nargs='+', choices=ENGINES, default=list(ENGINES))
+    engines.add_argument('--rounds', type=int, default=3, help="Giri ripetuti (dal secondo la cache è calda)")
+    engines.add_argument('--variant', default='original', help="Variante di layout servita (vedi fixtures.py)")
+    engines.add_argument('--config', default='config.json')
+    engines.add_argument('--latency', type=float, default=0.0, help="Latenza iniettata per risposta (secondi)")
+    engines.add_argument('--rate-429', type=float, default=0.0, help="Frazione di risposte 429")
+    engines.add_argument('--timeout-rate', type=float, default=0.0, help="Frazione di richieste senza risposta")
+    engines.add_argument('--politeness-delay', type=float, default=None,
+                         help="Sostituisce politeness_delay_seconds (default: quello di config.json)")
+    engines.add_argument('--timeout', type=float, default=5, help="Timeout delle richieste HTTP (secondi)")
+
+    # Usato internamente da 'engines': un processo per motore
+    worker = subparsers.add_parser('engine-worker')
+    worker.add_argument('engine', choices=ENGINES)
+    worker.add_argument('--config', required=True)
+    worker.add_argument('--rounds', type=int, default=3)
+    worker.add_argument('--output', required=True)
+
+    args = parser.parse_args()
+
+    if args.command == 'download':
+        download_pages(args.directory, args.config)
+    elif args.command == 'classifier':
+        mismatches = run_classifier_benchmark(args.pages, args.repeat, load_rules(args.config))
+        sys.exit(1 if mismatches else 0)
+    elif args.command == 'lean':
+        run_lean_benchmark(args.config, args.rounds)
+    elif args.command == 'engines':
+        mismatches = run_engines_benchmark(
+            args.archive, args.engines, args.rounds, args.variant, args.config, args.latency,
+            args.rate_429, args.timeout_rate, args.politeness_delay, args.timeout,
+        )
+        sys.exit(1 if mismatches else 0)
+    elif args.command == 'engine-worker':
+        run_engine_worker(args.engine, args.config, args.rounds, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+Scoperta automatica del catalogo ARM
+Scandisce la sitemap e la pagina della categoria arm-server, estrae gli URL di
+tutti i prodotti (varianti comprese), li confronta con quelli già noti e salva
+il catalogo in catalog.json: gli scraper controllano i prodotti di config.json
+più quelli scoperti, senza modificare a mano l'elenco.
+Ogni sorgente viene scaricata con una GET condizionale (ETag/Last-Modified e
+hash del contenuto): un elenco invariato costa un 304 e nessun parsing.
+La scansione gira al massimo ogni refresh_hours ore, fuori dal budget orario
+dei controlli
+
+Uso:
+    python catalog_discovery.py [--config config.json] [--force]
+"""
+
+import argparse
+import functools
+import gzip
+import hashlib
+import html
+import json
+import os
+import re
+import time
+from datetime import datetime, timedelta
+from urllib.parse import urljoin, urlparse, urlunparse
+
+import requests
+
+from http_session import get_session
+
+DEFAULT_CATALOG_FILE = 'catalog.json'
+DEFAULT_SITEMAP_URL = 'https://www.netcup.com/sitemap.xml'
+DEFAULT_CATEGORY_URLS = ['https://www.netcup.com/en/server/arm-server']
+# Pagine prodotto: un solo segmento dopo la categoria (la categoria stessa è esclusa)
+DEFAULT_PRODUCT_PATTERN = r'^/en/server/arm-server/[a-z0-9-]+$'
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.5',
+}
+
+_HREF = re.compile(r'href\s*=\s*["\']([^"\'#]+)', re.IGNORECASE)
+_LOC = re.compile(r'<loc>\s*([^<\s]+)\s*</loc>', re.IGNORECASE)
+_SITEMAP_INDEX = re.compile(r'<sitemapindex\b', re.IGNORECASE)
+
+
+def normalize_url(url):
+    """URL senza query, frammento e "/" finale (stesso prodotto, stessa chiave)"""
+    parts = urlparse(url.strip())
+    path = parts.path.rstrip('/') or '/'
+    return urlunparse((parts.scheme.lower(), parts.netloc.lower(), path, '', '', ''))
+
+
+def product_from_url(url):
+    """
+    Prodotto scoperto: nome ricavato dallo slug dell'URL. Nessun 'group': come per i prodotti
+    di config.json il gruppo delle raffiche è la categoria nell'URL (scheduler.product_group)
+    """
+    slug = urlparse(url).path.rstrip('/').rsplit('/', 1)[-1]
+    return {'name': ' '.join(slug.split('-')).upper(), 'url': url}
+
+
+def extract_product_links(page, base_url, pattern):
+    """URL delle pagine prodotto linkate da una pagina HTML (normalizzati, senza duplicati)"""
+    urls = []
+    for href in _HREF.findall(page):
+        url = normalize_url(urljoin(base_url, html.unescape(href)))
+        if pattern.match(urlparse(url).path) and url not in urls:
+            urls.append(url)
+    return urls
+
+
+def parse_sitemap(content):
+    """Ritorna (sitemap figlie, URL) di una sitemap o di un indice di sitemap"""
+    locs = [html.unescape(loc) for loc in _LOC.findall(content)]
+    if _SITEMAP_INDEX.search(content):
+        return locs, []
+    return [], locs
+
+
+class CatalogCrawler:
+    def __init__(self, config):
+        """Scansione del catalogo secondo la sezione "discovery" di config.json"""
+        settings = config.get('discovery', {})
+        self.enabled = settings.get('enabled', False)
+        self.catalog_file = settings.get('catalog_file', DEFAULT_CATALOG_FILE)
+        self.sitemap_url = settings.get('sitemap_url', DEFAULT_SITEMAP_URL)
+        self.category_urls = settings.get('category_urls', DEFAULT_CATEGORY_URLS)
+        self.pattern = re.compile(settings.get('product_pattern', DEFAULT_PRODUCT_PATTERN))
+        self.refresh_interval = settings.get('refresh_hours', 24) * 3600
+        self.max_sitemaps = settings.get('max_sitemaps', 20)
+        self.politeness_delay = config.get('politeness_delay_seconds', 1.0)
+        self.known_urls = {normalize_url(p['url']) for p in config.get('products', [])}
+        self.catalog = load_catalog(self.catalog_file)
+
+    def is_due(self, now=None):
+        now = time.time() if now is None else now
+        return self.enabled and now - self.catalog.get('last_crawl', 0) >= self.refresh_interval
+
+    def _fetch(self, url):
+        """
+        GET condizionale di una sorgente: ritorna il contenuto se è cambiato,
+        None se è invariato (304 o stesso hash) e va riusato l'elenco salvato
+        """
+        source = self.catalog['sources'].get(url, {})
+        cached = 'found' in source
+        headers = dict(HEADERS)
+        # Senza un elenco salvato da riusare serve la risposta completa, non un 304
+        if cached:
+            if source.get('etag'):
+                headers['If-None-Match'] = source['etag']
+            if source.get('last_modified'):
+                headers['If-Modified-Since'] = source['last_modified']
+
+        response = get_session().get(url, headers=headers)
+        time.sleep(self.politeness_delay)
+        if response.status_code == 304 and not cached:
+            # 304 senza niente da riusare (catalogo azzerato, cache intermedia): si riscarica tutto
+            response = get_session().get(url, headers=dict(HEADERS, **{'Cache-Control': 'no-cache'}))
+            time.sleep(self.politeness_delay)
+            if response.status_code == 304:
+                raise requests.HTTPError(f"304 senza un elenco salvato da riusare: {url}", response=response)
+        if response.status_code == 304:
+            return None
+        response.raise_for_status()
+
+        body = response.content
+        if url.endswith('.gz') and body[:2] == b'\x1f\x8b':
+            body = gzip.decompress(body)
+        digest = hashlib.sha256(body).hexdigest()
+        source.update({
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+        })
+        self.catalog['sources'][url] = source
+        if digest == source.get('hash') and 'found' in source:
+            return None
+        source['hash'] = digest
+        source.pop('found', None)
+        return body.decode(response.encoding or 'utf-8', errors='replace')
+
+    def _crawl_source(self, url, parse):
+        """URL trovati in una sorgente (dal catalogo se la sorgente è invariata)"""
+        content = self._fetch(url)
+        source = self.catalog['sources'][url]
+        if content is not None:
+            source['found'] = parse(content)
+        return source['found']
+
+    def _crawl_category(self, url):
+        """Pagine prodotto linkate da una pagina di categoria"""
+        return self._crawl_source(url, lambda content: extract_product_links(content, url, self.pattern))
+
+    def _parse_sitemap(self, content):
+        """Sitemap figlie e pagine prodotto di una sitemap (gli altri URL non vengono salvati)"""
+        sitemaps, urls = parse_sitemap(content)
+        urls = [url for url in map(normalize_url, urls) if self.pattern.match(urlparse(url).path)]
+        return {'sitemaps': sitemaps, 'urls': urls}
+
+    def _crawl_sitemaps(self):
+        """Pagine prodotto elencate nella sitemap (e nelle sitemap figlie, fino a max_sitemaps)"""
+        pending, seen, urls = [self.sitemap_url], set(), []
+        while pending and len(seen) < self.max_sitemaps:
+            sitemap_url = pending.pop(0)
+            seen.add(sitemap_url)
+            found = self._crawl_source(sitemap_url, self._parse_sitemap)
+            pending.extend(s for s in found['sitemaps'] if s not in seen and s not in pending)
+            urls.extend(found['urls'])
+        return urls
+
+    def crawl(self, now=None):
+        """
+        Scandisce sitemap e categorie e aggiorna il catalogo.
+        Ritorna (prodotti nuovi, prodotti non più elencati)
+        """
+        now = time.time() if now is None else now
+        timestamp = datetime.fromtimestamp(now).isoformat()
+        found, complete = [], True
+
+        sources = [self._crawl_sitemaps] if self.sitemap_url else []
+        sources += [functools.partial(self._crawl_category, url) for url in self.category_urls]
+        for crawl_fn in sources:
+            try:
+                found.extend(url for url in crawl_fn() if url not in found)
+            except requests.RequestException as e:
+                # Una sorgente irraggiungibile non deve far sparire i suoi prodotti
+                print(f"⚠️ Sorgente del catalogo non raggiungibile: {e}")
+                complete = False
+
+        products = {p['url']: p for p in self.catalog['products']}
+        new, missing = [], []
+        for url in found:
+            if url in products:
+                products[url]['last_seen'] = timestamp
+                products[url].pop('missing_since', None)
+            else:
+                products[url] = dict(product_from_url(url), first_seen=timestamp, last_seen=timestamp)
+                if url not in self.known_urls:
+                    new.append(products[url])
+        if complete:
+            for url, product in products.items():
+                if url not in found and 'missing_since' not in product:
+                    product['missing_since'] = timestamp
+                    missing.append(product)
+
+        self.catalog['products'] = sorted(products.values(), key=lambda p: p['url'])
+        # Anche una scansione incompleta conta: una sorgente giù non va ritentata a ogni esecuzione
+        self.catalog['last_crawl'] = now
+        save_catalog(self.catalog, self.catalog_file)
+        return new, missing
+
+    def refresh(self, force=False):
+        """Scansione se è passato refresh_hours dall'ultima (o se forzata); None se non necessaria"""
+        if not (force or self.is_due()):
+            return None
+        return self.crawl()
+
+
+def load_catalog(path=DEFAULT_CATALOG_FILE):
+    try:
+        with open(path, 'r') as f:
+            catalog = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        catalog = {}
+    catalog.setdefault('products', [])
+    catalog.setdefault('sources', {})
+    return catalog
+
+
+def save_catalog(catalog, path=DEFAULT_CATALOG_FILE):
+    """Salva il catalogo (scrittura atomica)"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(catalog, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def load_products(config):
+    """
+    Prodotti da controllare: quelli di config.json (nomi e impostazioni prevalgono)
+    più quelli scoperti, esclusi i prodotti spariti dagli elenchi da più di drop_after_days
+    """
+    products = list(config.get('products', []))
+    settings = config.get('discovery', {})
+    if not settings.get('enabled', False):
+        return products
+
+    known = {normalize_url(p['url']) for p in products}
+    cutoff = (datetime.now() - timedelta(days=settings.get('drop_after_days', 30))).isoformat()
+    for product in load_catalog(settings.get('catalog_file', DEFAULT_CATALOG_FILE))['products']:
+        # I prodotti esauriti possono sparire dalla categoria: restano controllati per un po'
+        if product['url'] in known or product.get('missing_since', cutoff) < cutoff:
+            continue
+        # Un 'group' salvato da versioni precedenti del catalogo non viene più usato
+        products.append({key: product[key] for key in ('name', 'url')})
+    return products
+
+
+def main():
+    """Funzione principale"""
+    parser = argparse.ArgumentParser(description="Scoperta automatica dei prodotti ARM di netcup")
+    parser.add_argument('--config', default='config.json')
+    parser.add_argument('--force', action='store_true', help="Scansiona anche se non è ancora il momento")
+    args = parser.parse_args()
+
+    with open(args.config, 'r') as f:
+        config = json.load(f)
+    crawler = CatalogCrawler(config)
+    if not crawler.enabled and not args.force:
+        print("⏭️  Scoperta del catalogo disattivata (sezione \"discovery\" di config.json)")
+        return
+
+    diff = crawler.refresh(force=args.force)
+    if diff is None:
+        last_crawl = datetime.fromtimestamp(crawler.catalog['last_crawl'])
+        print(f"⏭️  Catalogo aggiornato il {last_crawl.strftime('%Y-%m-%d %H:%M')}, nessuna scansione")
+        return
+
+    new, missing = diff
+    print(f"📚 Catalogo: {len(crawler.catalog['products'])} prodotti ({len(crawler.catalog['sources'])} sorgenti)")
+    for product in new:
+        print(f"🆕 {product['name']}: {product['url']}")
+    for product in missing:
+        print(f"👻 Non più elencato: {product['name']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Regole di classificazione condivise da tutti gli scraper
+Le liste di marcatori e la precedenza tra testo e button sono dichiarate una
+volta sola (sezione "classifier" di config.json) e compilate in un'unica
+espressione regolare per categoria: il testo viene scandito in un solo
+passaggio, qualunque sia il numero di marcatori o di lingue configurate
+"""
+
+import hashlib
+import json
+import re
+
+SOLD_OUT = 'sold_out'
+AVAILABLE = 'available'
+
+# Verdetti nel formato usato dagli scraper: (available, status)
+VERDICTS = {
+    SOLD_OUT: (False, "SOLD OUT"),
+    AVAILABLE: (True, "AVAILABLE"),
+}
+UNKNOWN_VERDICT = (None, "UNKNOWN")
+
+# 'button' → il primo button decisivo prevale sul testo della pagina
+# 'text'   → il testo della pagina prevale, i button servono solo se il testo
+#            non contiene marcatori
+PRECEDENCES = ('button', 'text')
+
+# Unione dei marcatori usati finora dalle tre versioni degli scraper
+DEFAULT_RULES = {
+    'precedence': 'button',
+    'text': {
+        SOLD_OUT: ['sold out', 'product is sold out'],
+        AVAILABLE: ['add to shopping cart', 'add to cart', 'order now'],
+    },
+    'button': {
+        SOLD_OUT: ['sold out'],
+        AVAILABLE: ['add to', 'cart'],
+    },
+}
+
+# Marcatori in più per i button della versione Selenium: lì un button conta solo se è
+# cliccabile (cursor calcolato dal CSS), quindi un generico "order" non basta a dare falsi
+# positivi. Nelle versioni HTTP un pulsante "order" accanto a "sold out" prevarrebbe sul testo
+SELENIUM_BUTTON_MARKERS = {AVAILABLE: ['order']}
+
+
+class MarkerMatcher:
+    """Cerca più marcatori in un solo passaggio con un'espressione regolare combinata"""
+
+    def __init__(self, markers):
+        """markers: dizionario categoria → lista di marcatori (minuscoli)"""
+        # L'ordine conta: a parità di posizione vince la prima categoria (sold_out)
+        self.categories = [category for category in (SOLD_OUT, AVAILABLE) if markers.get(category)]
+        self.markers = {category: sorted(set(markers[category]), key=len, reverse=True)
+                        for category in self.categories}
+        self.max_length = max((len(m) for ms in self.markers.values() for m in ms), default=0)
+
+        self._combined = self._compile(self.categories)
+        self._single = {category: self._compile([category]) for category in self.categories}
+
+    def _compile(self, categories):
+        if not categories:
+            return None
+        return re.compile('|'.join(
+            f"(?P<{category}>{'|'.join(re.escape(m) for m in self.markers[category])})"
+            for category in categories
+        ))
+
+    def scan(self, text):
+        """
+        Ritorna l'insieme delle categorie presenti nel testo (già minuscolo).
+        Si ferma appena trova sold_out, che prevale sempre all'interno del testo
+        """
+        found = set()
+        regex = self._combined
+        pos = 0
+        while regex is not None:
+            match = regex.search(text, pos)
+            if match is None:
+                break
+            found.add(match.lastgroup)
+            if match.lastgroup == SOLD_OUT:
+                break
+            # Trovata la disponibilità resta da cercare solo sold_out, anche in
+            # sovrapposizione con il marcatore appena trovato
+            regex = self._single.get(SOLD_OUT)
+            pos = match.start() + 1
+        return found
+
+    def verdict(self, text):
+        """Verdetto del testo: sold_out prevale su available, None se nessun marcatore"""
+        found = self.scan(text)
+        for category in (SOLD_OUT, AVAILABLE):
+            if category in found:
+                return VERDICTS[category]
+        return None
+
+
+class ClassifierRules:
+    """Regole dichiarative: marcatori del testo, marcatori dei button e precedenza"""
+
+    def __init__(self, rules=None):
+        """rules: dizionario nel formato di DEFAULT_RULES (le chiavi mancanti usano i default)"""
+        rules = rules or {}
+        self.precedence = rules.get('precedence', DEFAULT_RULES['precedence'])
+        if self.precedence not in PRECEDENCES:
+            raise ValueError(f"Precedenza non valida: {self.precedence} (attese: {', '.join(PRECEDENCES)})")
+
+        self.markers = {}
+        for scope in ('text', 'button'):
+            scope_rules = rules.get(scope, {})
+            self.markers[scope] = {
+                category: [m.lower() for m in scope_rules.get(category, DEFAULT_RULES[scope][category])]
+                for category in (SOLD_OUT, AVAILABLE)
+            }
+
+        self.text = MarkerMatcher(self.markers['text'])
+        self.button = MarkerMatcher(self.markers['button'])
+
+    @property
+    def fingerprint(self):
+        """Hash delle regole: cambia se cambiano marcatori o precedenza"""
+        data = json.dumps({'precedence': self.precedence, 'markers': self.markers}, sort_keys=True)
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()[:16]
+
+    def combine(self, text_verdict, button_verdict):
+        """Applica la precedenza: ritorna (available, status)"""
+        if self.precedence == 'button':
+            order = (button_verdict, text_verdict)
+        else:
+            order = (text_verdict, button_verdict)
+        for verdict in order:
+            if verdict is not None:
+                return verdict
+        return UNKNOWN_VERDICT
+
+    def with_button_markers(self, extra):
+        """Copia delle regole con marcatori aggiuntivi per i button (categoria → lista)"""
+        rules = self.to_dict()
+        rules['button'] = {
+            category: markers + [m for m in extra.get(category, []) if m not in markers]
+            for category, markers in rules['button'].items()
+        }
+        return ClassifierRules(rules)
+
+    def to_dict(self):
+        """Regole in forma serializzabile (es. da passare allo script nel browser)"""
+        return {'precedence': self.precedence, 'text': self.markers['text'], 'button': self.markers['button']}
+
+
+def rules_from_config(config):
+    """Crea le regole dalla sezione "classifier" della configurazione"""
+    return ClassifierRules(config.get('classifier'))
+
+
+def load_rules(config_file='config.json'):
+    """Carica le regole da un file di configurazione (default se il file manca)"""
+    try:
+        with open(config_file, 'r') as f:
+            config = json.load(f)
+    except FileNotFoundError:
+        config = {}
+    return rules_from_config(config)
+
+
+DEFAULT_CLASSIFIER_RULES = ClassifierRules()
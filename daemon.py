@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+Netcup VPS ARM Availability Scraper - Demone
+Un solo processo sempre attivo: long polling dei comandi Telegram (getUpdates)
+e controlli pianificati dallo scheduler adattivo nello stesso event loop.
+Sessione HTTP, cache delle risposte, regole e stato restano caldi in memoria:
+/check risponde in pochi secondi invece di aspettare il workflow
+
+Uso:
+    python daemon.py [--config config.json]
+"""
+
+import argparse
+import asyncio
+import functools
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import metrics
+from http_session import close_session, open_circuits
+from recent_results import DEFAULT_CHECK_TTL, RecentResults
+from scheduler import AdaptiveScheduler
+from scraper_github_actions import format_telegram_message, notify_transitions
+from scraper_light import NetcupScraperLight
+from subscribers import notifier_from_config, registry_from_config
+from telegram_command_handler import (HELP_MESSAGE, TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID, batch_messages,
+                                      get_last_update_id, get_new_messages, group_commands, is_authorized,
+                                      parse_command, save_last_update_id, send_telegram_message,
+                                      subscription_reply)
+
+logger = logging.getLogger(__name__)
+
+
+class NetcupDaemon:
+    def __init__(self, config_file='config.json'):
+        """Prepara scraper, scheduler e bot: restano in memoria per tutta la vita del processo"""
+        self.scraper = NetcupScraperLight(config_file)
+        self.config = self.scraper.config
+        self.products = self.scraper.products
+
+        daemon_config = self.config.get('daemon', {})
+        self.poll_timeout = daemon_config.get('poll_timeout_seconds', 25)
+        self.retry_delay = daemon_config.get('retry_delay_seconds', 5)
+
+        self.scheduler = AdaptiveScheduler.from_config(self.config, self.products, self.scraper.history)
+
+        # Ultimo risultato di ogni prodotto: /check risponde da qui finché è più giovane del TTL
+        ttl = self.config.get('telegram', {}).get('check_ttl_seconds', DEFAULT_CHECK_TTL)
+        self.recent = RecentResults.from_history(self.scraper.history, ttl)
+
+        # Iscritti con i loro filtri e invio in parallelo con i limiti di Telegram
+        self.registry = registry_from_config(self.config, self.products, TELEGRAM_CHAT_ID)
+        self.notifier = notifier_from_config(self.config, send_telegram_message)
+        self.last_update_id = get_last_update_id()
+        self.started = datetime.now()
+
+        # Thread per le chiamate bloccanti: long polling, controlli e invio dei messaggi
+        self.executor = ThreadPoolExecutor(max_workers=4)
+        # Creati dentro il loop che li usa
+        self._check_lock = None
+        self._wakeup = None
+        self._tasks = set()
+        # Controllo su richiesta in corso, condiviso da tutti i /check che arrivano nel frattempo
+        self._flight = None
+
+    async def _call(self, fn, *args, **kwargs):
+        """Esegue una funzione bloccante in un thread senza fermare l'event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(fn, *args, **kwargs))
+
+    async def _send(self, message, chat_id=None):
+        return await self._call(send_telegram_message, message, chat_id=chat_id)
+
+    async def check(self, products=None, stale_only=False):
+        """
+        Esegue un controllo alla volta e aggiorna lo scheduler.
+        products=None: solo i prodotti in scadenza secondo lo scheduler.
+        stale_only: salta i prodotti con un risultato più giovane del TTL
+        (ricalcolato dopo l'attesa, un controllo appena concluso può bastare).
+        Ritorna (risultati, cambi di stato)
+        """
+        async with self._check_lock:
+            if products is None:
+                products = self.scheduler.due()
+            if stale_only:
+                _, products = self.recent.fresh(products)
+            if not products:
+                return [], []
+            results = await self._call(self.scraper.run_check, products)
+            self.recent.update(results)
+            transitions = self.scheduler.record(results)
+            await self._call(self.scheduler.save)
+        # Lo scheduler ricalcola l'attesa (un /check sposta i prossimi controlli)
+        self._wakeup.set()
+        for result, previous_status in transitions:
+            logger.warning(f"🔔 {result['name']}: {previous_status} → {result['status']}")
+        return results, transitions
+
+    # --- Controlli pianificati ---
+
+    async def _scheduled_loop(self):
+        """Controlla i prodotti in scadenza e dorme fino al prossimo (o fino a un /check)"""
+        while True:
+            await self._refresh_catalog()
+            results, transitions = await self.check()
+            if results:
+                await self._notify_scheduled(results, transitions)
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), max(1.0, self.scheduler.seconds_until_next()))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _refresh_catalog(self):
+        """Scansione periodica del catalogo: i prodotti nuovi entrano subito nella pianificazione"""
+        if not await self._call(self.scraper.refresh_catalog):
+            return
+        self.products = self.scraper.products
+        self.scheduler.set_products(self.products)
+        self.registry.products = list(self.products)
+
+    async def _notify_scheduled(self, results, transitions):
+        """
+        Notifica ogni cambio di stato agli iscritti che seguono il prodotto; con prodotti
+        disponibili ripete il riepilogo ogni base_interval
+        """
+        if transitions:
+            await self._call(notify_transitions, self.notifier, self.registry, transitions)
+
+        now = time.time()
+        reminder_due = now - self.scheduler.meta.get('last_available_notice', 0) >= self.scheduler.base_interval
+        available = [r for r in results if r['available']]
+        if available and (transitions or reminder_due):
+            if not transitions:
+                messages = {chat_id: [format_telegram_message(subset)[0]]
+                            for chat_id, subset in self.registry.split(available).items()}
+                await self._call(self.notifier.send, messages)
+            self.scheduler.meta['last_available_notice'] = now
+            await self._call(self.scheduler.save)
+
+    # --- Comandi Telegram ---
+
+    async def _telegram_loop(self):
+        """Long polling di getUpdates: ogni comando viene gestito appena arriva"""
+        if not TELEGRAM_BOT_TOKEN:
+            logger.warning("⚠️ TELEGRAM_BOT_TOKEN non configurato: comandi disattivati, solo controlli pianificati")
+            return
+
+        while True:
+            updates = await self._call(get_new_messages, self.last_update_id, self.poll_timeout)
+            if updates is None:
+                await asyncio.sleep(self.retry_delay)
+                continue
+            if not updates:
+                continue
+            # Comandi ripetuti nella stessa pagina di update contano una volta per chat
+            commands, self.last_update_id = group_commands(updates, self.last_update_id)
+            for chat_id, texts in commands.items():
+                self._handle_commands(chat_id, texts)
+            await self._call(save_last_update_id, self.last_update_id)
+
+    def _handle_commands(self, chat_id, texts):
+        """Risponde ai comandi di una chat: /check gira in un task separato, le altre risposte partono insieme"""
+        replies = []
+        for text in texts:
+            command, args = parse_command(text)
+            if not is_authorized(chat_id, command, self.registry):
+                logger.warning(f"⚠️ Comando {command} ignorato da chat non iscritta: {chat_id}")
+                replies.append("🔒 Usa /subscribe per iscriverti alle notifiche e usare gli altri comandi.")
+            elif command == '/check':
+                self._spawn(self._on_check(chat_id))
+            elif command in ('/help', '/start'):
+                replies.append(HELP_MESSAGE)
+            elif command == '/status':
+                replies.append(self._status_message())
+            else:
+                reply = subscription_reply(self.registry, chat_id, command, args)
+                replies.append(reply or f"❓ Comando '{text}' non riconosciuto.\n\nUsa /help per vedere i comandi disponibili.")
+        for message in batch_messages(replies):
+            self._spawn(self._send(message, chat_id))
+
+    def _spawn(self, coroutine):
+        """Avvia un task tenendone un riferimento fino alla fine"""
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _on_check(self, chat_id):
+        """Controllo su richiesta: risponde dalla cache se recente, altrimenti si unisce al volo in corso"""
+        followed = [p for p in self.products if self.registry.wants(chat_id, p['name'])] or self.products
+        fresh, stale = self.recent.fresh(followed)
+        if not stale:
+            message, _, _ = format_telegram_message(fresh, manual_check=True)
+            age = self.recent.oldest_age(fresh)
+            await self._send(message + f"\n\n♻️ Risultati di {age:.0f} secondi fa", chat_id)
+            return
+
+        await self._send("🔍 Controllo disponibilità in corso...\nRiceverai i risultati tra pochi secondi.", chat_id)
+        previous_results, results = await self._refresh()
+        results = [r for r in results if any(p['name'] == r['name'] for p in followed)]
+        message, _, _ = format_telegram_message(results, previous_results, manual_check=True)
+        await self._send(message, chat_id)
+
+    async def _refresh(self):
+        """
+        Single-flight: un solo controllo su richiesta alla volta, i /check che
+        arrivano mentre è in corso ne attendono il risultato invece di ripeterlo
+        """
+        if self._flight is None or self._flight.done():
+            self._flight = asyncio.create_task(self._refresh_stale())
+        # shield: se un'attesa viene cancellata il controllo continua per gli altri
+        return await asyncio.shield(self._flight)
+
+    async def _refresh_stale(self):
+        """Ricontrolla i prodotti senza un risultato recente; ritorna (risultati precedenti, risultati attuali)"""
+        previous_results = list(self.recent.results.values())
+        await self.check(self.products, stale_only=True)
+        results = [self.recent.results[p['name']] for p in self.products if p['name'] in self.recent.results]
+        return previous_results, results
+
+    def _status_message(self):
+        """Stato del demone e prossimi controlli pianificati"""
+        message = (
+            "📊 <b>Status del Bot</b>\n\n"
+            f"✅ Demone attivo dal {self.started.strftime('%Y-%m-%d %H:%M:%S')}\n"
+            "🔔 Notifiche: attive\n\n"
+            "⏰ Prossimi controlli:\n"
+        )
+        for name, seconds in self.scheduler.describe().items():
+            message += f"   {name}: tra {seconds / 60:.1f} minuti\n"
+        for host, until in open_circuits().items():
+            message += f"\n⛔ {host} in pausa fino alle {datetime.fromtimestamp(until).strftime('%H:%M:%S')}\n"
+        message += "\nUsa /check per un controllo immediato."
+        return message
+
+    # --- Avvio e arresto ---
+
+    async def run(self):
+        """Event loop principale: polling dei comandi e controlli pianificati insieme"""
+        self._check_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        server = metrics.start_from_config(self.config)
+        if server is not None:
+            logger.info(f"Metriche su http://localhost:{server.server_address[1]}/metrics")
+        logger.info(f"Avvio demone (budget {self.scheduler.hourly_budget} controlli/ora, "
+                    f"long polling {self.poll_timeout}s)")
+        logger.info("Premi Ctrl+C per fermare\n")
+        await asyncio.gather(self._scheduled_loop(), self._telegram_loop())
+
+    def close(self):
+        """Salva stato, cache e offset dei comandi e chiude le connessioni"""
+        self.scheduler.save()
+        self.scraper.cache.save()
+        if self.last_update_id > get_last_update_id():
+            save_last_update_id(self.last_update_id)
+        # Non aspetta il long polling in corso: l'offset è già salvato
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        close_session()
+
+
+def main():
+    """Funzione principale"""
+    parser = argparse.ArgumentParser(description="Demone Netcup: comandi Telegram e controlli pianificati")
+    parser.add_argument('--config', default='config.json')
+    args = parser.parse_args()
+
+    daemon = NetcupDaemon(args.config)
+    try:
+        asyncio.run(daemon.run())
+    except KeyboardInterrupt:
+        logger.info("\nDemone interrotto dall'utente")
+    finally:
+        daemon.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Pool di WebDriver persistenti per la versione Selenium
+Tiene aperti i browser tra un ciclo e l'altro, li ricicla dopo N pagine o se
+non rispondono più, e permette di usarne più di uno in parallelo
+"""
+
+import logging
+import queue
+import threading
+from contextlib import contextmanager
+
+from selenium.common.exceptions import WebDriverException
+
+logger = logging.getLogger(__name__)
+
+
+class DriverPool:
+    def __init__(self, driver_factory, size=1, max_pages_per_driver=50, on_discard=None):
+        """
+        driver_factory: funzione senza argomenti che crea un nuovo WebDriver
+        size: browser aperti contemporaneamente al massimo
+        max_pages_per_driver: pagine dopo cui il browser viene chiuso e ricreato
+        on_discard: funzione chiamata con il driver dopo la sua chiusura (opzionale)
+        """
+        self.driver_factory = driver_factory
+        self.on_discard = on_discard
+        self.size = max(1, int(size))
+        self.max_pages_per_driver = max(1, int(max_pages_per_driver))
+
+        self._idle = queue.LifoQueue()
+        self._pages = {}
+        self._created = 0
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _is_healthy(self, driver):
+        """Verifica che il browser risponda ancora (un solo round trip)"""
+        try:
+            driver.execute_script("return 1")
+            return True
+        except WebDriverException:
+            return False
+
+    def _discard(self, driver):
+        """Chiude un browser e libera il suo posto nel pool"""
+        try:
+            driver.quit()
+        except WebDriverException as e:
+            logger.warning(f"Errore nella chiusura del browser: {e}")
+        with self._lock:
+            self._pages.pop(id(driver), None)
+            self._created -= 1
+        if self.on_discard is not None:
+            self.on_discard(driver)
+
+    def acquire(self):
+        """Prende un browser libero, creandone uno nuovo se non ce ne sono"""
+        # Il semaforo limita i browser in uso; quelli inattivi restano nella coda
+        self._slots.acquire()
+        try:
+            while True:
+                try:
+                    driver = self._idle.get_nowait()
+                except queue.Empty:
+                    driver = self.driver_factory()
+                    with self._lock:
+                        self._pages[id(driver)] = 0
+                        self._created += 1
+                    logger.info(f"Browser avviato ({self._created}/{self.size})")
+                    return driver
+
+                if self._is_healthy(driver):
+                    return driver
+                logger.warning("Browser non più raggiungibile: verrà ricreato")
+                self._discard(driver)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, driver, pages=1, broken=False):
+        """Restituisce un browser al pool, riciclandolo se ha servito troppe pagine"""
+        with self._lock:
+            self._pages[id(driver)] = self._pages.get(id(driver), 0) + pages
+            used = self._pages[id(driver)]
+
+        try:
+            if broken or self._closed or used >= self.max_pages_per_driver:
+                if not broken and not self._closed:
+                    logger.info(f"Browser riciclato dopo {used} pagine")
+                self._discard(driver)
+            else:
+                self._idle.put(driver)
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def driver(self):
+        """
+        Context manager: acquisisce un browser e lo rilascia (chiudendolo se va in crash
+        o se chi lo usa imposta usage['broken'])
+        """
+        driver = self.acquire()
+        usage = {'pages': 0, 'broken': False}
+        broken = False
+        try:
+            yield driver, usage
+        except WebDriverException:
+            broken = True
+            raise
+        finally:
+            # Un browser andato in crash viene individuato dal controllo in acquire()
+            self.release(driver, pages=max(1, usage['pages']), broken=broken or usage['broken'])
+
+    def close(self):
+        """Chiude tutti i browser inattivi; quelli in uso vengono chiusi al rilascio"""
+        self._closed = True
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(driver)
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+Fixture HTTP registrate e server di replay locale
+Registra le risposte reali delle pagine prodotto in un archivio compresso
+(JSON gzip) e le riserve da un server HTTP locale al posto di netcup.com,
+con latenza, 429, timeout e varianti di layout iniettabili: benchmark e
+verifiche dei classificatori senza toccare il sito
+
+Uso:
+    python fixtures.py record fixtures/netcup.json.gz [--config config.json]
+    python fixtures.py serve fixtures/netcup.json.gz [--port 8080] [--latency 0.2] [--rate-429 0.1]
+                                                     [--timeout-rate 0.05] [--variant no-structured-data]
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+DEFAULT_ARCHIVE = os.path.join('fixtures', 'netcup.json.gz')
+
+# Header della risposta originale conservati nell'archivio
+_RECORDED_HEADERS = ('content-type', 'etag', 'last-modified', 'cache-control')
+
+
+# --- Varianti di layout: stessa disponibilità, markup diverso ---
+
+def _strip_structured_data(html):
+    """Toglie JSON-LD e payload di idratazione: resta solo il testo della pagina"""
+    return re.sub(
+        r'<script\b[^>]*(?:application/ld\+json|__NEXT_DATA__|__NUXT_DATA__)[^>]*>.*?</script\s*>',
+        '', html, flags=re.IGNORECASE | re.DOTALL,
+    )
+
+
+def _buttons_as_links(html):
+    """I pulsanti diventano link (il classificatore deve basarsi sul testo)"""
+    return re.sub(r'<(/?)button\b', r'<\1a', html, flags=re.IGNORECASE)
+
+
+def _deep_nesting(html):
+    """Avvolge il body in molti div annidati (stress per i parser)"""
+    depth = 200
+    return re.sub(
+        r'(<body\b[^>]*>)(.*)(</body\s*>)',
+        lambda m: m.group(1) + '<div>' * depth + m.group(2) + '</div>' * depth + m.group(3),
+        html, count=1, flags=re.IGNORECASE | re.DOTALL,
+    )
+
+
+# Payload estranei al prodotto: lingue del sito e un'offerta di un altro prodotto
+_UNRELATED_PAYLOADS = (
+    '<script id="__NEXT_DATA__" type="application/json">'
+    '{"props": {"pageProps": {"locales": [{"code": "en", "available": true}, {"code": "de", "available": true}]}}}'
+    '</script>'
+    '<script type="application/ld+json">'
+    '{"@context": "https://schema.org", "@type": "ItemList", "itemListElement": [{"@type": "ListItem",'
+    ' "item": {"@type": "Product", "name": "Webhosting 4000", "offers": {"@type": "Offer",'
+    ' "availability": "https://schema.org/InStock", "price": "4.99", "priceCurrency": "EUR"}}}]}'
+    '</script>'
+)
+
+
+def _unrelated_structured_data(html):
+    """
+    Solo payload che non riguardano il prodotto: non devono decidere lo stato
+    (la pagina va classificata dal testo, un esaurito resta esaurito)
+    """
+    html, inserted = re.subn(r'(</head\s*>)', lambda m: _UNRELATED_PAYLOADS + m.group(1),
+                             _strip_structured_data(html), count=1, flags=re.IGNORECASE)
+    return html if inserted else _UNRELATED_PAYLOADS + html
+
+
+VARIANTS = {
+    'original': lambda html: html,
+    'no-structured-data': _strip_structured_data,
+    'buttons-as-links': _buttons_as_links,
+    'deep-nesting': _deep_nesting,
+    'unrelated-structured-data': _unrelated_structured_data,
+}
+
+
+# --- Archivio ---
+
+def load_archive(path=DEFAULT_ARCHIVE):
+    """Legge l'archivio delle fixture"""
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_archive(archive, path=DEFAULT_ARCHIVE):
+    """Salva l'archivio compresso (scrittura atomica)"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+        json.dump(archive, f)
+    os.replace(tmp_path, path)
+
+
+def record(path=DEFAULT_ARCHIVE, config_file='config.json'):
+    """
+    Scarica le pagine dei prodotti configurati e le salva nell'archivio.
+    Per ogni pagina salva anche lo stato atteso (classificazione al momento della registrazione,
+    modificabile a mano) usato dal benchmark per verificare i risultati
+    """
+    from catalog_discovery import load_products
+    from classifier import rules_from_config
+    from http_session import get_session
+    from stream_classifier import classify_html
+    from structured_data import extract_availability
+
+    with open(config_file, 'r') as f:
+        config = json.load(f)
+    rules = rules_from_config(config)
+
+    pages = []
+    for product in load_products(config):
+        response = get_session().get(product['url'], timeout=15)
+        response.raise_for_status()
+        details = extract_availability(response.text, product)
+        if details is not None:
+            available, status = details['available'], details['status']
+        else:
+            available, status = classify_html(response.text, rules)
+        pages.append({
+            'name': product['name'],
+            'url': product['url'],
+            'status_code': response.status_code,
+            'headers': {name: value for name, value in response.headers.items()
+                        if name.lower() in _RECORDED_HEADERS},
+            'body': response.text,
+            'expected': {'available': available, 'status': status},
+        })
+        print(f"✅ {product['name']}: {status} ({len(response.content) / 1024:.1f} KiB)")
+
+    archive = {'recorded_at': datetime.now().isoformat(), 'pages': pages}
+    save_archive(archive, path)
+    print(f"💾 {len(pages)} pagine salvate in {path}")
+    return archive
+
+
+# --- Server di replay ---
+
+class _ReplayHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        page = server.pages.get(urlparse(self.path).path)
+        fault = server.next_fault()
+
+        if server.latency or server.jitter:
+            time.sleep(server.latency + random.uniform(0, server.jitter))
+
+        if fault == 'timeout':
+            # Nessuna risposta: il client va in timeout
+            time.sleep(server.hang_seconds)
+            self.close_connection = True
+            return
+        if fault == '429':
+            self._send(429, b'Too Many Requests', {'Retry-After': str(server.retry_after)})
+            return
+        if page is None:
+            self._send(404, b'Not Found')
+            return
+
+        body = VARIANTS[server.variant](page['body']).encode('utf-8')
+        headers = {name: value for name, value in page['headers'].items()
+                   if name.lower() not in ('etag', 'content-length')}
+        # ETag della variante servita: permette di provare anche le GET condizionali
+        etag = '"' + hashlib.sha1(body).hexdigest()[:16] + '"'
+        headers['ETag'] = etag
+        if self.headers.get('If-None-Match') == etag:
+            self._send(304, b'', headers)
+            return
+        self._send(page['status_code'], body, headers)
+
+    def _send(self, status, body, headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ReplayServer:
+    def __init__(self, archive, host='127.0.0.1', port=0, latency=0.0, jitter=0.0,
+                 rate_429=0.0, timeout_rate=0.0, hang_seconds=30, retry_after=1,
+                 variant='original', seed=None):
+        """
+        archive: archivio caricato con load_archive.
+        latency/jitter: ritardo di ogni risposta (secondi, più una parte casuale fino a jitter).
+        rate_429/timeout_rate: frazione di richieste che ricevono 429 o nessuna risposta.
+        variant: variante di layout (chiave di VARIANTS)
+        """
+        if variant not in VARIANTS:
+            raise ValueError(f"Variante sconosciuta: {variant} (disponibili: {', '.join(VARIANTS)})")
+        self.archive = archive
+        self.httpd = ThreadingHTTPServer((host, port), _ReplayHandler)
+        self.httpd.daemon_threads = True
+
+        httpd = self.httpd
+        httpd.pages = {urlparse(page['url']).path: page for page in archive['pages']}
+        httpd.latency = latency
+        httpd.jitter = jitter
+        httpd.hang_seconds = hang_seconds
+        httpd.retry_after = retry_after
+        httpd.variant = variant
+
+        rng = random.Random(seed)
+        lock = threading.Lock()
+
+        def next_fault():
+            with lock:
+                roll = rng.random()
+            if roll < timeout_rate:
+                return 'timeout'
+            if roll < timeout_rate + rate_429:
+                return '429'
+            return None
+
+        httpd.next_fault = next_fault
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def url_for(self, url):
+        """URL del server locale che riserve la pagina registrata per url"""
+        return self.base_url + urlparse(url).path
+
+    def products(self):
+        """Prodotti dell'archivio con gli URL del server locale (e lo stato atteso)"""
+        return [
+            {'name': page['name'], 'url': self.url_for(page['url']), 'expected': page['expected']}
+            for page in self.archive['pages']
+        ]
+
+    def start(self):
+        """Avvia il server in un thread in background"""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    """Funzione principale"""
+    parser = argparse.ArgumentParser(description="Fixture registrate e server di replay")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    record_parser = subparsers.add_parser('record', help="Registra le pagine prodotto correnti")
+    record_parser.add_argument('archive', nargs='?', default=DEFAULT_ARCHIVE)
+    record_parser.add_argument('--config', default='config.json')
+
+    serve = subparsers.add_parser('serve', help="Riserve le pagine registrate da un server locale")
+    serve.add_argument('archive', nargs='?', default=DEFAULT_ARCHIVE)
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=8080)
+    serve.add_argument('--latency', type=float, default=0.0, help="Ritardo di ogni risposta (secondi)")
+    serve.add_argument('--jitter', type=float, default=0.0, help="Ritardo casuale aggiuntivo massimo (secondi)")
+    serve.add_argument('--rate-429', type=float, default=0.0, help="Frazione di risposte 429")
+    serve.add_argument('--timeout-rate', type=float, default=0.0, help="Frazione di richieste senza risposta")
+    serve.add_argument('--variant', default='original', choices=sorted(VARIANTS))
+
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        record(args.archive, args.config)
+    elif args.command == 'serve':
+        server = ReplayServer(
+            load_archive(args.archive), host=args.host, port=args.port, latency=args.latency,
+            jitter=args.jitter, rate_429=args.rate_429, timeout_rate=args.timeout_rate, variant=args.variant,
+        )
+        print(f"🚀 Replay di {len(server.archive['pages'])} pagine su {server.base_url} (variante {args.variant})")
+        for product in server.products():
+            print(f"   {product['name']}: {product['url']}")
+        try:
+            server.httpd.serve_forever()
+        except KeyboardInterrupt:
+            print("\n⏹️  Server fermato")
+        finally:
+            server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,449 @@
+#!/usr/bin/env python3
+"""
+Storico dei controlli di disponibilità
+Backend intercambiabili con scrittura O(1) per controllo:
+- 'jsonl'       → un controllo per riga (availability_log.jsonl)
+- 'sqlite'      → tabella indicizzata (availability_log.db)
+- 'transitions' → solo i cambi di stato per prodotto, run-length (availability_history.db)
+Include la migrazione dal vecchio formato (array JSON in availability_log.json)
+
+Uso da riga di comando:
+    python history_store.py migrate availability_log.json --backend sqlite --output availability_log.db
+    python history_store.py state availability_history.db "VPS 1000 ARM G11" [--at 2025-01-01T12:00:00]
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+from contextlib import closing
+from datetime import datetime
+
+BACKENDS = ('jsonl', 'sqlite', 'transitions')
+LEGACY_LOG_FILE = 'availability_log.json'
+
+_TAIL_BLOCK_SIZE = 4096
+
+
+def _make_entry(results, check_time=None):
+    """Crea una voce di storico nello stesso formato del vecchio log"""
+    return {
+        'check_time': check_time or datetime.now().isoformat(),
+        'results': results
+    }
+
+
+def read_legacy_log(path):
+    """Legge un vecchio log in formato array JSON (lista vuota se assente o illeggibile)"""
+    try:
+        with open(path, 'r') as f:
+            data = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return []
+    return data if isinstance(data, list) else []
+
+
+class JsonlHistoryStore:
+    def __init__(self, path):
+        """Apre (o crea) lo storico JSONL; converte al volo un file in formato array JSON"""
+        self.path = path
+        self._convert_legacy_in_place()
+
+    def _convert_legacy_in_place(self):
+        """Se il file contiene ancora un array JSON lo riscrive una riga per controllo"""
+        try:
+            with open(self.path, 'r') as f:
+                head = f.read(64).lstrip()
+        except FileNotFoundError:
+            return
+        if not head.startswith('['):
+            return
+
+        entries = read_legacy_log(self.path)
+        tmp_file = f"{self.path}.tmp"
+        with open(tmp_file, 'w') as f:
+            for entry in entries:
+                f.write(json.dumps(entry) + '\n')
+        os.replace(tmp_file, self.path)
+
+    def is_empty(self):
+        try:
+            return os.path.getsize(self.path) == 0
+        except FileNotFoundError:
+            return True
+
+    def append(self, results, check_time=None):
+        """Aggiunge un controllo in fondo al file (una sola riga)"""
+        entry = _make_entry(results, check_time)
+        line = (json.dumps(entry) + '\n').encode('utf-8')
+        with open(self.path, 'a+b') as f:
+            # Se l'ultima scrittura è stata interrotta, la riga troncata resta isolata
+            f.seek(0, os.SEEK_END)
+            if f.tell() > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    line = b'\n' + line
+            f.write(line)
+        return entry
+
+    def latest(self):
+        """Legge solo l'ultima riga valida partendo dalla fine del file"""
+        try:
+            f = open(self.path, 'rb')
+        except FileNotFoundError:
+            return None
+
+        with f:
+            f.seek(0, os.SEEK_END)
+            position = f.tell()
+            buffer = b''
+            while position > 0:
+                step = min(_TAIL_BLOCK_SIZE, position)
+                position -= step
+                f.seek(position)
+                buffer = f.read(step) + buffer
+
+                # Le righe complete sono quelle precedute da un '\n' (o dall'inizio del file)
+                lines = buffer.split(b'\n')
+                complete = lines if position == 0 else lines[1:]
+                for line in reversed(complete):
+                    entry = self._parse_line(line)
+                    if entry is not None:
+                        return entry
+                # Nessuna riga valida nel blocco: tieni solo la riga incompleta
+                buffer = lines[0] if position > 0 else b''
+        return None
+
+    @staticmethod
+    def _parse_line(line):
+        line = line.strip()
+        if not line:
+            return None
+        try:
+            return json.loads(line)
+        except json.JSONDecodeError:
+            # Riga troncata (es. processo interrotto durante la scrittura)
+            return None
+
+    def iter_entries(self):
+        """Scorre tutti i controlli dal più vecchio"""
+        try:
+            with open(self.path, 'rb') as f:
+                for line in f:
+                    entry = self._parse_line(line)
+                    if entry is not None:
+                        yield entry
+        except FileNotFoundError:
+            return
+
+
+class SqliteHistoryStore:
+    def __init__(self, path):
+        """Apre (o crea) il database dello storico"""
+        self.path = path
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS checks ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " check_time TEXT NOT NULL,"
+                " results TEXT NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_checks_time ON checks (check_time)")
+
+    def _connect(self):
+        # Una connessione per operazione: lo store è usato anche da più thread
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def is_empty(self):
+        with closing(self._connect()) as conn:
+            return conn.execute("SELECT 1 FROM checks LIMIT 1").fetchone() is None
+
+    def append(self, results, check_time=None):
+        """Inserisce un controllo (una riga)"""
+        entry = _make_entry(results, check_time)
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT INTO checks (check_time, results) VALUES (?, ?)",
+                (entry['check_time'], json.dumps(entry['results']))
+            )
+        return entry
+
+    def latest(self):
+        """Ultimo controllo tramite la chiave primaria (nessuna scansione)"""
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT check_time, results FROM checks ORDER BY id DESC LIMIT 1"
+            ).fetchone()
+        if row is None:
+            return None
+        return {'check_time': row[0], 'results': json.loads(row[1])}
+
+    def iter_entries(self):
+        """Scorre tutti i controlli dal più vecchio"""
+        with closing(self._connect()) as conn:
+            for check_time, results in conn.execute(
+                    "SELECT check_time, results FROM checks ORDER BY id"):
+                yield {'check_time': check_time, 'results': json.loads(results)}
+
+
+class TransitionHistoryStore:
+    """
+    Storico compatto: per ogni prodotto salva solo i periodi (run) con lo stesso
+    status, con primo/ultimo avvistamento e numero di controlli.
+    Un controllo che non cambia stato aggiorna solo la run corrente
+    """
+
+    def __init__(self, path):
+        """Apre (o crea) il database delle transizioni"""
+        self.path = path
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS runs ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " product TEXT NOT NULL,"
+                " status TEXT NOT NULL,"
+                " available INTEGER,"
+                " first_seen TEXT NOT NULL,"
+                " last_seen TEXT NOT NULL,"
+                " checks INTEGER NOT NULL,"
+                " last_result TEXT NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_runs_product_time ON runs (product, first_seen)")
+            # Puntatore alla run corrente di ogni prodotto: lo stato attuale è un lookup diretto
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS products ("
+                " name TEXT PRIMARY KEY,"
+                " current_run INTEGER NOT NULL)"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    @staticmethod
+    def _run_to_dict(row):
+        if row is None:
+            return None
+        return {
+            'product': row['product'],
+            'status': row['status'],
+            'available': None if row['available'] is None else bool(row['available']),
+            'first_seen': row['first_seen'],
+            'last_seen': row['last_seen'],
+            'checks': row['checks'],
+        }
+
+    def is_empty(self):
+        with closing(self._connect()) as conn:
+            return conn.execute("SELECT 1 FROM meta WHERE key = 'last_check'").fetchone() is None
+
+    def append(self, results, check_time=None):
+        """Registra un controllo: estende la run corrente o ne apre una nuova se lo status cambia"""
+        entry = _make_entry(results, check_time)
+        check_time = entry['check_time']
+
+        with closing(self._connect()) as conn, conn:
+            # Lock di scrittura subito: più processi (worker) possono scrivere sullo stesso storico
+            conn.execute("BEGIN IMMEDIATE")
+            for result in results:
+                run = conn.execute(
+                    "SELECT runs.id, runs.status FROM products"
+                    " JOIN runs ON runs.id = products.current_run"
+                    " WHERE products.name = ?",
+                    (result['name'],)
+                ).fetchone()
+
+                if run is not None and run['status'] == result['status']:
+                    conn.execute(
+                        "UPDATE runs SET last_seen = ?, checks = checks + 1, last_result = ? WHERE id = ?",
+                        (check_time, json.dumps(result), run['id'])
+                    )
+                    continue
+
+                available = result.get('available')
+                cursor = conn.execute(
+                    "INSERT INTO runs (product, status, available, first_seen, last_seen, checks, last_result)"
+                    " VALUES (?, ?, ?, ?, ?, 1, ?)",
+                    (result['name'], result['status'], None if available is None else int(available),
+                     check_time, check_time, json.dumps(result))
+                )
+                conn.execute(
+                    "INSERT INTO products (name, current_run) VALUES (?, ?)"
+                    " ON CONFLICT(name) DO UPDATE SET current_run = excluded.current_run",
+                    (result['name'], cursor.lastrowid)
+                )
+
+            # Ultimo controllo: orario e ordine dei prodotti, per ricostruire latest().
+            # Con lo scheduler un controllo può riguardare solo alcuni prodotti:
+            # quelli dei controlli precedenti restano con il loro ultimo risultato
+            row = conn.execute("SELECT value FROM meta WHERE key = 'last_check'").fetchone()
+            products = json.loads(row['value'])['products'] if row is not None else []
+            products += [r['name'] for r in results if r['name'] not in products]
+            last_check = {'check_time': check_time, 'products': products}
+            conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('last_check', ?)",
+                (json.dumps(last_check),)
+            )
+        return entry
+
+    def latest(self):
+        """Ricostruisce l'ultimo controllo dalle run correnti dei prodotti"""
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'last_check'").fetchone()
+            if row is None:
+                return None
+            last_check = json.loads(row['value'])
+
+            results = []
+            for name in last_check['products']:
+                run = conn.execute(
+                    "SELECT runs.last_result FROM products"
+                    " JOIN runs ON runs.id = products.current_run"
+                    " WHERE products.name = ?",
+                    (name,)
+                ).fetchone()
+                if run is not None:
+                    results.append(json.loads(run['last_result']))
+        return {'check_time': last_check['check_time'], 'results': results}
+
+    def current_state(self, product):
+        """Stato attuale del prodotto (run corrente), None se mai controllato"""
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT runs.* FROM products JOIN runs ON runs.id = products.current_run"
+                " WHERE products.name = ?",
+                (product,)
+            ).fetchone()
+        return self._run_to_dict(row)
+
+    def last_transition(self, product):
+        """
+        Ultimo cambio di stato del prodotto:
+        {'time', 'from', 'to'} con 'from' None se il prodotto ha una sola run
+        """
+        current = self.current_state(product)
+        if current is None:
+            return None
+        with closing(self._connect()) as conn:
+            previous = conn.execute(
+                "SELECT * FROM runs WHERE product = ? AND first_seen < ?"
+                " ORDER BY first_seen DESC LIMIT 1",
+                (product, current['first_seen'])
+            ).fetchone()
+        return {
+            'time': current['first_seen'],
+            'from': self._run_to_dict(previous),
+            'to': current,
+        }
+
+    def state_at(self, product, when):
+        """Stato del prodotto all'istante 'when' (datetime o stringa ISO), None se non ancora controllato"""
+        if isinstance(when, datetime):
+            when = when.isoformat()
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT * FROM runs WHERE product = ? AND first_seen <= ?"
+                " ORDER BY first_seen DESC LIMIT 1",
+                (product, when)
+            ).fetchone()
+        return self._run_to_dict(row)
+
+    def iter_runs(self, product=None):
+        """Scorre le run (di un prodotto o di tutti) in ordine cronologico"""
+        with closing(self._connect()) as conn:
+            if product is None:
+                rows = conn.execute("SELECT * FROM runs ORDER BY first_seen, id").fetchall()
+            else:
+                rows = conn.execute(
+                    "SELECT * FROM runs WHERE product = ? ORDER BY first_seen, id", (product,)
+                ).fetchall()
+        for row in rows:
+            yield self._run_to_dict(row)
+
+
+def open_history_store(backend='jsonl', path=None):
+    """Crea lo store per il backend richiesto"""
+    if backend == 'jsonl':
+        return JsonlHistoryStore(path or 'availability_log.jsonl')
+    elif backend == 'sqlite':
+        return SqliteHistoryStore(path or 'availability_log.db')
+    elif backend == 'transitions':
+        return TransitionHistoryStore(path or 'availability_history.db')
+    raise ValueError(f"Backend storico non valido: {backend} (attesi: {', '.join(BACKENDS)})")
+
+
+def migrate_json_log(legacy_path, store):
+    """
+    Importa un vecchio log (array JSON o JSONL) nello store;
+    ritorna il numero di controlli importati
+    """
+    try:
+        with open(legacy_path, 'r') as f:
+            is_array = f.read(64).lstrip().startswith('[')
+    except FileNotFoundError:
+        return 0
+
+    if is_array:
+        entries = read_legacy_log(legacy_path)
+    else:
+        entries = JsonlHistoryStore(legacy_path).iter_entries()
+
+    count = 0
+    for entry in entries:
+        store.append(entry.get('results', []), entry.get('check_time'))
+        count += 1
+    return count
+
+
+def history_store_from_config(config):
+    """
+    Apre lo storico configurato in config.json ('history_backend', 'log_file').
+    Se lo store è vuoto e c'è ancora il vecchio log JSON, lo importa
+    """
+    store = open_history_store(config.get('history_backend', 'jsonl'), config.get('log_file'))
+    legacy_path = config.get('legacy_log_file', LEGACY_LOG_FILE)
+    if (legacy_path and os.path.abspath(legacy_path) != os.path.abspath(store.path)
+            and os.path.exists(legacy_path) and store.is_empty()):
+        migrate_json_log(legacy_path, store)
+    return store
+
+
+def main():
+    """Migrazione manuale del vecchio log e consultazione delle transizioni"""
+    parser = argparse.ArgumentParser(description="Gestione dello storico dei controlli")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    migrate = subparsers.add_parser('migrate', help="Importa un log in formato array JSON o JSONL")
+    migrate.add_argument('legacy_file')
+    migrate.add_argument('--backend', choices=BACKENDS, default='jsonl')
+    migrate.add_argument('--output', help="File di destinazione")
+
+    state = subparsers.add_parser('state', help="Stato di un prodotto nello storico a transizioni")
+    state.add_argument('history_file')
+    state.add_argument('product')
+    state.add_argument('--at', help="Istante ISO (default: stato attuale)")
+
+    args = parser.parse_args()
+
+    if args.command == 'migrate':
+        store = open_history_store(args.backend, args.output)
+        count = migrate_json_log(args.legacy_file, store)
+        print(f"✅ Importati {count} controlli in {store.path}")
+    elif args.command == 'state':
+        store = TransitionHistoryStore(args.history_file)
+        if args.at:
+            print(json.dumps(store.state_at(args.product, args.at), indent=2))
+        else:
+            print(json.dumps({
+                'current': store.current_state(args.product),
+                'last_transition': store.last_transition(args.product),
+            }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
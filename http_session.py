@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Sessione HTTP condivisa con connection pooling e keep-alive
+Usata dagli scraper e dal bot Telegram per riutilizzare le connessioni TCP/TLS.
+Ogni richiesta passa dalla politica di resilienza dell'host (resilience.py) e
+ne vengono misurati connessione, TTFB e download (metrics.HTTP_STAGE_SECONDS)
+"""
+
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from metrics import HTTP_STAGE_SECONDS
+from resilience import ResiliencePolicy, policy_from_config
+
+DEFAULT_POOL_CONNECTIONS = 10   # Numero di host diversi tenuti nel pool
+DEFAULT_POOL_MAXSIZE = 10       # Connessioni aperte massime per singolo host
+DEFAULT_TIMEOUT = 15            # Timeout (secondi) se la chiamata non ne specifica uno
+
+_settings = {
+    'pool_connections': DEFAULT_POOL_CONNECTIONS,
+    'pool_maxsize': DEFAULT_POOL_MAXSIZE,
+    'timeout': DEFAULT_TIMEOUT,
+    # Condivisa tra le sessioni del processo: i circuit breaker sopravvivono a configure()
+    'resilience': ResiliencePolicy(),
+}
+_session = None
+_lock = threading.Lock()
+
+# Tempo di connessione accumulato dalla richiesta in corso nel thread
+_local = threading.local()
+
+
+class _TimedConnectionMixin:
+    """Misura l'apertura delle nuove connessioni del pool (DNS + TCP + TLS)"""
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            elapsed = time.perf_counter() - started
+            _local.connect_seconds = getattr(_local, 'connect_seconds', 0.0) + elapsed
+            HTTP_STAGE_SECONDS.observe(elapsed, stage='connect', host=self.host)
+
+
+class _TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class _TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """
+    HTTPAdapter che applica un timeout di default a ogni richiesta, la ripete
+    secondo la politica di resilienza dell'host e ne misura le fasi
+    """
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, resilience=None, **kwargs):
+        self.timeout = timeout
+        self.resilience = resilience
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _TimedHTTPConnectionPool,
+            'https': _TimedHTTPSConnectionPool,
+        }
+
+    def _timed_send(self, request, host, **kwargs):
+        _local.connect_seconds = 0.0
+        started = time.perf_counter()
+        response = super().send(request, **kwargs)
+        # Header ricevuti: TTFB al netto dell'eventuale apertura di una nuova connessione
+        ttfb = time.perf_counter() - started - _local.connect_seconds
+        HTTP_STAGE_SECONDS.observe(max(0.0, ttfb), stage='ttfb', host=host)
+        return response
+
+    def send(self, request, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        host = urlparse(request.url).hostname
+        if self.resilience is None:
+            response = self._timed_send(request, host, **kwargs)
+        else:
+            response = self.resilience.send(
+                host, request.method, lambda: self._timed_send(request, host, **kwargs))
+        if not kwargs.get('stream'):
+            # Lettura del corpo qui invece che in Session.send, per misurarla
+            with HTTP_STAGE_SECONDS.time(stage='download', host=host):
+                response.content
+        return response
+
+
+def create_session(pool_connections=DEFAULT_POOL_CONNECTIONS, pool_maxsize=DEFAULT_POOL_MAXSIZE,
+                   timeout=DEFAULT_TIMEOUT, resilience=None):
+    """Crea una nuova Session con pool di connessioni per host (e politica di resilienza, se data)"""
+    session = requests.Session()
+    adapter = TimeoutHTTPAdapter(
+        timeout=timeout,
+        resilience=resilience,
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def configure(pool_connections=None, pool_maxsize=None, timeout=None, resilience=None):
+    """
+    Aggiorna le impostazioni della sessione condivisa.
+    Se la sessione esiste già viene chiusa e ricreata al prossimo get_session()
+    """
+    global _session
+    with _lock:
+        if pool_connections is not None:
+            _settings['pool_connections'] = int(pool_connections)
+        if pool_maxsize is not None:
+            _settings['pool_maxsize'] = int(pool_maxsize)
+        if timeout is not None:
+            _settings['timeout'] = timeout
+        if resilience is not None:
+            _settings['resilience'] = resilience
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+def configure_from_config(config):
+    """Applica la sezione 'http' di config.json (se presente)"""
+    http_config = config.get('http', {})
+    configure(
+        pool_connections=http_config.get('pool_connections'),
+        pool_maxsize=http_config.get('pool_maxsize'),
+        timeout=http_config.get('timeout_seconds'),
+        resilience=policy_from_config(config) if 'resilience' in http_config else None,
+    )
+
+
+def get_session():
+    """Ritorna la sessione condivisa del processo, creandola al primo utilizzo"""
+    global _session
+    with _lock:
+        if _session is None:
+            _session = create_session(**_settings)
+        return _session
+
+
+def open_circuits():
+    """Host messi in pausa dal circuit breaker: host → fine della pausa (epoch)"""
+    return _settings['resilience'].open_circuits()
+
+
+def close_session():
+    """Chiude la sessione condivisa e tutte le connessioni nel pool"""
+    global _session
+    with _lock:
+        if _session is not None:
+            _session.close()
+            _session = None
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Metriche dei controlli: tempi per fase e contatori
+Istogrammi dei tempi (connessione, TTFB, download, parsing, classificazione,
+scrittura dello storico, invio Telegram) e contatori (controlli per esito,
+errori per tipo, cambi di stato, cache hit), senza dipendenze esterne.
+In monitoraggio continuo sono esposti in formato Prometheus su /metrics;
+alla fine di un controllo singolo vengono riassunti in JSON
+"""
+
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+DEFAULT_SUMMARY_FILE = 'metrics_summary.json'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class Counter:
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+    def summary(self):
+        with self._lock:
+            return {'/'.join(key) or 'total': value for key, value in sorted(self._values.items())}
+
+
+class Histogram:
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per ogni combinazione di etichette: conteggi per bucket, somma, numero e massimo
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0, 'max': 0.0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['buckets'][i] += 1
+                    break
+            series['sum'] += value
+            series['count'] += 1
+            series['max'] = max(series['max'], value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Misura la durata del blocco (anche se solleva un'eccezione)"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                # I bucket Prometheus sono cumulativi
+                cumulative = 0
+                for bound, count in zip(self.buckets, series['buckets']):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', bound)])} {cumulative}")
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', '+Inf')])} {series['count']}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {series['sum']}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {series['count']}")
+        return lines
+
+    def summary(self):
+        with self._lock:
+            return {
+                '/'.join(key) or 'total': {
+                    'count': series['count'],
+                    'total_seconds': round(series['sum'], 6),
+                    'mean_seconds': round(series['sum'] / series['count'], 6),
+                    'max_seconds': round(series['max'], 6),
+                }
+                for key, series in sorted(self._series.items())
+            }
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, help_text, labelnames, **kwargs):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = cls(name, help_text, labelnames, **kwargs)
+            return self._metrics[name]
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._get_or_create(Counter, name, help_text, labelnames)
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, help_text, labelnames, buckets=buckets)
+
+    def render(self):
+        """Tutte le metriche nel formato testuale di Prometheus"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        """Riepilogo JSON: per gli istogrammi numero, totale, media e massimo"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric.summary() for metric in metrics}
+
+
+REGISTRY = MetricsRegistry()
+
+# Metriche condivise da scraper, bot e demone
+STAGE_SECONDS = REGISTRY.histogram(
+    'netcup_stage_seconds', "Durata delle fasi di un controllo (parse, classify, history_write, telegram_send)",
+    ('stage',))
+HTTP_STAGE_SECONDS = REGISTRY.histogram(
+    'netcup_http_stage_seconds', "Durata delle fasi HTTP (connect = DNS+TCP+TLS, ttfb, download) per host",
+    ('stage', 'host'))
+CHECK_SECONDS = REGISTRY.histogram(
+    'netcup_check_seconds', "Durata complessiva del controllo di un prodotto")
+CHECKS = REGISTRY.counter('netcup_checks_total', "Controlli eseguiti per esito", ('status',))
+ERRORS = REGISTRY.counter('netcup_errors_total', "Errori per tipo di eccezione", ('type',))
+TRANSITIONS = REGISTRY.counter('netcup_transitions_total', "Cambi di stato rilevati", ('previous', 'status'))
+CACHE_HITS = REGISTRY.counter('netcup_cache_hits_total', "Controlli risolti dalla cache delle risposte")
+RETRIES = REGISTRY.counter('netcup_retries_total', "Richieste ripetute per host e motivo", ('host', 'reason'))
+CIRCUITS_OPENED = REGISTRY.counter('netcup_circuits_opened_total', "Host messi in pausa dal circuit breaker", ('host',))
+TELEGRAM_MESSAGES = REGISTRY.counter('netcup_telegram_messages_total', "Messaggi Telegram per esito", ('outcome',))
+
+
+def stage(name):
+    """Context manager che misura una fase del controllo: with stage('parse'): ..."""
+    return STAGE_SECONDS.time(stage=name)
+
+
+def record_result(result):
+    """Conta un controllo concluso (esito e cache hit)"""
+    CHECKS.inc(status=result.get('status', 'UNKNOWN'))
+    if result.get('cache_hit'):
+        CACHE_HITS.inc()
+
+
+def timed_check(check_fn):
+    """
+    Decoratore per le funzioni che controllano un prodotto e ritornano il risultato:
+    misura la durata complessiva e conta l'esito
+    """
+    @functools.wraps(check_fn)
+    def wrapper(*args, **kwargs):
+        with CHECK_SECONDS.time():
+            result = check_fn(*args, **kwargs)
+        record_result(result)
+        return result
+    return wrapper
+
+
+def record_error(error):
+    """Conta un errore per tipo di eccezione (es. ConnectTimeout, HTTPError)"""
+    ERRORS.inc(type=type(error).__name__)
+
+
+def record_telegram(sent):
+    TELEGRAM_MESSAGES.inc(outcome='sent' if sent else 'failed')
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = REGISTRY.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port, host='0.0.0.0'):
+    """Espone /metrics in un thread in background; ritorna il server"""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def start_from_config(config):
+    """Avvia /metrics se la sezione "metrics" di config.json indica una porta (None altrimenti)"""
+    metrics_config = config.get('metrics', {})
+    port = metrics_config.get('port')
+    if not port:
+        return None
+    return start_metrics_server(port, metrics_config.get('host', '0.0.0.0'))
+
+
+def write_summary(config=None, path=None):
+    """Salva il riepilogo JSON delle metriche (controllo singolo); ritorna il riepilogo"""
+    path = path or (config or {}).get('metrics', {}).get('summary_file', DEFAULT_SUMMARY_FILE)
+    summary = REGISTRY.summary()
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(summary, f, indent=2)
+    os.replace(tmp_path, path)
+    return summary
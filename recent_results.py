@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Ultimi risultati di ogni prodotto, con scadenza (TTL)
+Servono a rispondere subito a /check quando esiste già un controllo recente:
+la cache parte dall'ultima voce dello storico e si aggiorna dopo ogni controllo
+"""
+
+import sqlite3
+import time
+from datetime import datetime
+
+DEFAULT_CHECK_TTL = 120
+
+
+def result_time(result):
+    """Istante del controllo (epoch) dal timestamp del risultato, None se assente"""
+    try:
+        return datetime.fromisoformat(result['timestamp']).timestamp()
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class RecentResults:
+    def __init__(self, ttl=DEFAULT_CHECK_TTL, clock=time.time):
+        """ttl: secondi per cui un risultato vale come risposta a /check"""
+        self.ttl = ttl
+        self.clock = clock
+        self.results = {}
+
+    @classmethod
+    def from_history(cls, history, ttl=DEFAULT_CHECK_TTL, clock=time.time):
+        """Cache inizializzata con l'ultima voce dello storico"""
+        recent = cls(ttl, clock)
+        try:
+            entry = history.latest()
+        except (OSError, ValueError, sqlite3.Error):
+            entry = None
+        if entry:
+            recent.update(entry.get('results', []))
+        return recent
+
+    def update(self, results):
+        """Registra i risultati di un controllo appena eseguito"""
+        for result in results:
+            self.results[result['name']] = result
+
+    def is_fresh(self, result, now=None):
+        """True se il risultato è più giovane del TTL (gli errori non valgono mai)"""
+        checked_at = result_time(result)
+        if checked_at is None or result.get('status') == 'ERROR':
+            return False
+        now = self.clock() if now is None else now
+        return now - checked_at < self.ttl
+
+    def fresh(self, products=None, now=None):
+        """
+        Divide i prodotti in (risultati ancora validi, prodotti da ricontrollare).
+        products=None: tutti i prodotti di cui si conosce un risultato
+        """
+        now = self.clock() if now is None else now
+        if products is None:
+            products = list(self.results.values())
+        fresh, stale = [], []
+        for product in products:
+            result = self.results.get(product['name'])
+            if result is not None and self.is_fresh(result, now):
+                fresh.append(result)
+            else:
+                stale.append(product)
+        return fresh, stale
+
+    def oldest_age(self, results, now=None):
+        """Età in secondi del risultato più vecchio tra quelli indicati"""
+        now = self.clock() if now is None else now
+        times = [result_time(r) for r in results]
+        return max((now - t for t in times if t is not None), default=0.0)
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+Resilienza delle richieste HTTP per host
+Tentativi limitati con backoff esponenziale e jitter, rispetto di Retry-After
+(429/503, anche nel corpo JSON delle risposte di Telegram) e un circuit breaker
+per host: dopo troppi errori consecutivi (5xx, timeout, connessioni rifiutate)
+l'host viene messo in pausa e segnalato, invece di essere martellato alla
+cadenza normale. Un 429 rallenta l'host ma non conta come guasto.
+Usata dall'adapter della sessione condivisa (http_session): scraper e bot
+Telegram passano tutti da qui
+
+Uso:
+    python resilience.py    # verifica le sequenze del circuit breaker (senza rete)
+"""
+
+import logging
+import random
+import threading
+import time
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+
+import requests
+
+from metrics import CIRCUITS_OPENED, RETRIES
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Metodi che si possono ripetere senza effetti collaterali (un POST a Telegram no:
+# si ripete solo dopo un 429 o se la connessione non è mai partita)
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Host in pausa: il circuito è aperto e la richiesta non viene inviata"""
+
+
+def retry_after(response, now=None):
+    """
+    Secondi indicati dal server prima di riprovare: header Retry-After (secondi o data HTTP)
+    oppure parameters.retry_after nel JSON di Telegram. None se assenti
+    """
+    value = response.headers.get('Retry-After')
+    if value:
+        value = value.strip()
+        if value.isdigit():
+            return float(value)
+        try:
+            when = parsedate_to_datetime(value).timestamp()
+        except (TypeError, ValueError):
+            return None
+        return max(0.0, when - (time.time() if now is None else now))
+
+    if 'json' in response.headers.get('Content-Type', ''):
+        try:
+            seconds = response.json().get('parameters', {}).get('retry_after')
+        except (ValueError, AttributeError):
+            return None
+        if isinstance(seconds, (int, float)):
+            return float(seconds)
+    return None
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=5, reset_timeout=300, clock=time.time):
+        """
+        failure_threshold: errori consecutivi dopo cui il circuito si apre.
+        reset_timeout: secondi di pausa prima di una richiesta di prova (half-open)
+        """
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.open_until = None
+        self.paused_until = 0.0
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.open_until is None:
+            return 'closed'
+        return 'open' if self.clock() < self.open_until else 'half-open'
+
+    def allow(self):
+        """True se la richiesta può partire; a circuito scaduto passa una sola richiesta di prova"""
+        with self._lock:
+            if self.open_until is None:
+                return True
+            if self.clock() < self.open_until or self._trial:
+                return False
+            self._trial = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.open_until = None
+            self._trial = False
+
+    def record_failure(self):
+        """Conta un errore; ritorna True se il circuito si è appena aperto"""
+        with self._lock:
+            self.failures += 1
+            # Una prova fallita riapre subito il circuito
+            if self._trial or (self.open_until is None and self.failures >= self.failure_threshold):
+                self._trial = False
+                self.open_until = self.clock() + self.reset_timeout
+                return True
+            return False
+
+    def cancel_trial(self):
+        """La richiesta di prova non è arrivata all'host (errore locale): un'altra potrà riprovare"""
+        with self._lock:
+            self._trial = False
+
+    def pause(self, seconds):
+        """Sospende le richieste all'host per seconds secondi (Retry-After)"""
+        with self._lock:
+            self.paused_until = max(self.paused_until, self.clock() + seconds)
+
+    def pause_remaining(self):
+        return max(0.0, self.paused_until - self.clock())
+
+
+class ResiliencePolicy:
+    def __init__(self, max_retries=2, backoff_base=1.0, backoff_max=60.0, max_retry_after=120.0,
+                 failure_threshold=5, reset_timeout=300, retry_statuses=RETRY_STATUSES,
+                 clock=time.time, sleep=time.sleep, rng=None):
+        """
+        max_retries: tentativi aggiuntivi dopo il primo.
+        backoff_base / backoff_max: attesa tra i tentativi, esponenziale con jitter pieno.
+        max_retry_after: Retry-After più lunghi non vengono attesi (la risposta torna al chiamante).
+        failure_threshold / reset_timeout: parametri del circuit breaker di ogni host
+        """
+        self.max_retries = max(0, int(max_retries))
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_retry_after = max_retry_after
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.retry_statuses = tuple(retry_statuses)
+        self.clock = clock
+        self.sleep = sleep
+        self.rng = rng or random.Random()
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def breaker(self, host):
+        with self._lock:
+            if host not in self._breakers:
+                self._breakers[host] = CircuitBreaker(self.failure_threshold, self.reset_timeout, self.clock)
+            return self._breakers[host]
+
+    def backoff(self, attempt):
+        """Attesa prima del tentativo attempt + 1: jitter pieno su base * 2^attempt"""
+        return self.rng.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def open_circuits(self):
+        """Host in pausa: host → fine della pausa (epoch)"""
+        with self._lock:
+            breakers = dict(self._breakers)
+        return {host: b.open_until for host, b in breakers.items() if b.state == 'open'}
+
+    def _failed(self, host, breaker):
+        if breaker.record_failure():
+            CIRCUITS_OPENED.inc(host=host)
+            until = datetime.fromtimestamp(breaker.open_until).strftime('%H:%M:%S')
+            logger.warning(f"⛔ {host}: {breaker.failures} errori consecutivi, richieste sospese fino alle {until}")
+
+    def send(self, host, method, send_fn):
+        """
+        Esegue send_fn() (una richiesta verso host) con tentativi, backoff e circuit breaker.
+        Ritorna l'ultima risposta (anche se di errore: decide il chiamante) o solleva
+        l'ultima eccezione; CircuitOpenError se l'host è in pausa
+        """
+        breaker = self.breaker(host)
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                until = datetime.fromtimestamp(breaker.open_until).strftime('%H:%M:%S')
+                raise CircuitOpenError(f"{host} in pausa dopo troppi errori consecutivi (fino alle {until})")
+            pause = breaker.pause_remaining()
+            if pause > 0:
+                self.sleep(min(pause, self.max_retry_after))
+
+            try:
+                response = send_fn()
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                self._failed(host, breaker)
+                # ConnectTimeout: la richiesta non è mai partita, si può ripetere anche un POST
+                retriable = idempotent or isinstance(e, requests.exceptions.ConnectTimeout)
+                if attempt >= self.max_retries or not retriable:
+                    raise
+                RETRIES.inc(host=host, reason=type(e).__name__)
+                self.sleep(self.backoff(attempt))
+                attempt += 1
+                continue
+            except Exception:
+                breaker.cancel_trial()
+                raise
+
+            if response.status_code not in self.retry_statuses:
+                breaker.record_success()
+                return response
+
+            delay = retry_after(response)
+            if response.status_code == 429:
+                # Rallentamento richiesto, non un guasto: pausa senza avvicinare il circuito all'apertura.
+                # Se era la richiesta di prova va liberata, altrimenti allow() resterebbe False per sempre
+                breaker.cancel_trial()
+                if delay is None:
+                    delay = self.backoff(attempt)
+            else:
+                self._failed(host, breaker)
+            if delay is not None and delay <= self.max_retry_after:
+                # Vale per tutte le richieste all'host, non solo per questa
+                breaker.pause(delay)
+            retriable = idempotent or response.status_code == 429
+            if (attempt >= self.max_retries or not retriable or breaker.state == 'open'
+                    or (delay is not None and delay > self.max_retry_after)):
+                return response
+
+            response.close()
+            RETRIES.inc(host=host, reason=str(response.status_code))
+            if delay is None:
+                self.sleep(self.backoff(attempt))
+            # Con Retry-After l'attesa è la pausa dell'host, all'inizio del prossimo tentativo
+            attempt += 1
+
+
+def self_check():
+    """
+    Verifica le sequenze più delicate con orologio e risposte simulate (niente rete).
+    Ritorna la lista dei controlli falliti
+    """
+    class FakeResponse:
+        def __init__(self, status_code):
+            self.status_code = status_code
+            self.headers = {}
+
+        def close(self):
+            pass
+
+    now = [0.0]
+    failures = []
+
+    def clock():
+        return now[0]
+
+    def sleep(seconds):
+        now[0] += seconds
+
+    def send(policy, status_code):
+        try:
+            return policy.send('example.com', 'GET', lambda: FakeResponse(status_code)).status_code
+        except CircuitOpenError:
+            return 'open'
+
+    # 429 sulla richiesta di prova (half-open): il circuito non deve restare bloccato
+    policy = ResiliencePolicy(max_retries=0, failure_threshold=2, reset_timeout=10, clock=clock, sleep=sleep)
+    steps = [send(policy, 503), send(policy, 503), send(policy, 200)]
+    now[0] += 11
+    steps += [send(policy, 429), send(policy, 200)]
+    now[0] += 1000
+    steps.append(send(policy, 200))
+    if steps != [503, 503, 'open', 429, 200, 200]:
+        failures.append(f"429 sulla richiesta di prova: {steps}")
+    if policy.breaker('example.com').state != 'closed':
+        failures.append(f"429 sulla richiesta di prova: circuito {policy.breaker('example.com').state}")
+
+    # Prova fallita con un 5xx: il circuito si riapre e viene segnalato
+    now[0] = 0.0
+    policy = ResiliencePolicy(max_retries=0, failure_threshold=2, reset_timeout=10, clock=clock, sleep=sleep)
+    send(policy, 503), send(policy, 503)
+    now[0] += 11
+    steps = [send(policy, 503), send(policy, 200)]
+    if steps != [503, 'open'] or 'example.com' not in policy.open_circuits():
+        failures.append(f"5xx sulla richiesta di prova: {steps}, aperti {policy.open_circuits()}")
+    return failures
+
+
+def policy_from_config(config):
+    """ResiliencePolicy dalla sottosezione "resilience" della sezione "http" di config.json"""
+    settings = config.get('http', {}).get('resilience', {})
+    return ResiliencePolicy(
+        max_retries=settings.get('max_retries', 2),
+        backoff_base=settings.get('backoff_base_seconds', 1.0),
+        backoff_max=settings.get('backoff_max_seconds', 60.0),
+        max_retry_after=settings.get('max_retry_after_seconds', 120.0),
+        failure_threshold=settings.get('failure_threshold', 5),
+        reset_timeout=settings.get('reset_timeout_seconds', 300),
+    )
+
+
+if __name__ == "__main__":
+    failed = self_check()
+    for failure in failed:
+        print(f"❌ {failure}")
+    print("✅ Sequenze del circuit breaker verificate" if not failed else f"{len(failed)} controlli falliti")
+    raise SystemExit(1 if failed else 0)
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Cache delle risposte per le pagine prodotto
+Salva ETag/Last-Modified e un hash della parte rilevante della pagina, così
+una pagina invariata (304 o stesso hash) non viene ri-analizzata
+"""
+
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+from datetime import datetime
+
+# Script, stili, template e commenti non contribuiscono a get_text(): li escludiamo
+# dall'hash insieme agli attributi dei tag (token, nonce, id generati a ogni richiesta)
+_IGNORED_BLOCKS = re.compile(
+    r'<(script|style|template)\b[^>]*>.*?</\1\s*>|<!--.*?-->',
+    re.IGNORECASE | re.DOTALL,
+)
+_TAG_ATTRIBUTES = re.compile(r'<(/?[a-zA-Z][a-zA-Z0-9-]*)\b[^>]*>')
+
+
+def page_region_hash(html):
+    """Calcola l'hash della parte di pagina da cui dipende la classificazione"""
+    region = _IGNORED_BLOCKS.sub('', html)
+    region = _TAG_ATTRIBUTES.sub(r'<\1>', region).lower()
+    return hashlib.sha256(region.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, cache_file='response_cache.json', rules_fingerprint=None):
+        """
+        Carica la cache dal file (se esiste).
+        rules_fingerprint: impronta delle regole di classificazione; le voci
+        classificate con regole diverse non vengono riusate
+        """
+        self.cache_file = cache_file
+        self.rules_fingerprint = rules_fingerprint
+        self._lock = threading.Lock()
+        try:
+            with open(cache_file, 'r') as f:
+                self.entries = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.entries = {}
+
+    def conditional_headers(self, url):
+        """Ritorna gli header If-None-Match / If-Modified-Since per l'URL"""
+        with self._lock:
+            entry = self.entries.get(url)
+        # Senza una classificazione riusabile serve la pagina completa, non un 304
+        if not entry or entry.get('rules') != self.rules_fingerprint:
+            return {}
+
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def lookup(self, url, response, region_hash=None):
+        """
+        Ritorna la classificazione salvata se la pagina non è cambiata:
+        risposta 304 oppure hash della regione uguale a quello in cache
+        """
+        with self._lock:
+            entry = self.entries.get(url)
+        if not entry:
+            return None
+        if entry.get('rules') != self.rules_fingerprint:
+            return None
+
+        if response.status_code == 304:
+            return entry
+        if region_hash is not None and region_hash == entry.get('region_hash'):
+            return entry
+        return None
+
+    def store(self, url, response, region_hash, available, status, details=None):
+        """
+        Aggiorna la voce di cache con validatori, hash e classificazione.
+        details: dati aggiuntivi da restituire insieme alla classificazione (es. prezzo)
+        """
+        entry = {
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'region_hash': region_hash,
+            'available': available,
+            'status': status,
+            'rules': self.rules_fingerprint,
+            'details': details or {},
+            'updated': datetime.now().isoformat(),
+        }
+        with self._lock:
+            self.entries[url] = entry
+
+    def touch(self, url, response):
+        """Aggiorna i validatori di una voce ancora valida (es. nuovo ETag con stesso contenuto)"""
+        with self._lock:
+            entry = self.entries.get(url)
+            if not entry:
+                return
+            entry['etag'] = response.headers.get('ETag') or entry.get('etag')
+            entry['last_modified'] = response.headers.get('Last-Modified') or entry.get('last_modified')
+            entry['updated'] = datetime.now().isoformat()
+
+    def save(self):
+        """
+        Salva la cache su file (scrittura atomica). Il file temporaneo ha un nome unico:
+        più processi (es. i worker) possono salvare la stessa cache insieme, vince l'ultimo
+        """
+        with self._lock:
+            data = json.dumps(self.entries, indent=2)
+        fd, tmp_file = tempfile.mkstemp(prefix=f"{os.path.basename(self.cache_file)}.",
+                                        suffix='.tmp', dir=os.path.dirname(self.cache_file) or '.')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(data)
+            os.replace(tmp_file, self.cache_file)
+        except BaseException:
+            if os.path.exists(tmp_file):
+                os.unlink(tmp_file)
+            raise
@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+"""
+Scheduler adattivo dei controlli
+Ogni prodotto ha il suo prossimo controllo: più frequente nelle fasce orarie in
+cui lo storico mostra dei restock, più rado per i prodotti stabili da giorni,
+con jitter, backoff sugli errori e un budget globale di richieste all'ora.
+Dopo un cambio di stato parte una "raffica": per burst_window secondi i prodotti
+correlati vengono controllati ogni burst_interval secondi, fuori dal budget
+"""
+
+import json
+import os
+import random
+import time
+from collections import Counter
+from datetime import datetime
+from urllib.parse import urlparse
+
+from metrics import TRANSITIONS
+
+DEFAULT_STATE_FILE = 'schedule_state.json'
+
+# Status che contano come stato "reale" del prodotto (gli errori non sono cambi di stato)
+_DEFINITE_STATUSES = ('AVAILABLE', 'SOLD OUT')
+
+
+def _timestamp(iso_time):
+    return datetime.fromisoformat(iso_time).timestamp()
+
+
+def product_group(product):
+    """
+    Gruppo di prodotti correlati (che tendono a tornare disponibili insieme):
+    la chiave 'group' del prodotto o, in mancanza, la categoria nell'URL
+    """
+    if product.get('group'):
+        return product['group']
+    parsed = urlparse(product['url'])
+    return parsed.netloc + parsed.path.rstrip('/').rsplit('/', 1)[0]
+
+
+def _status_changes(history):
+    """
+    Genera (prodotto, orario ISO, status precedente, nuovo status) per la prima
+    osservazione di ogni prodotto (status precedente None) e per ogni cambio tra
+    AVAILABLE e SOLD OUT registrato nello storico
+    """
+    previous = {}
+    if hasattr(history, 'iter_runs'):
+        # Storico a transizioni: ogni run è già un cambio di status
+        observations = ((run['product'], run['first_seen'], run['status']) for run in history.iter_runs())
+    else:
+        observations = (
+            (result['name'], result.get('timestamp') or entry['check_time'], result['status'])
+            for entry in history.iter_entries()
+            for result in entry.get('results', [])
+        )
+
+    for product, when, status in observations:
+        if status not in _DEFINITE_STATUSES:
+            continue
+        before = previous.get(product)
+        if before != status:
+            yield product, when, before, status
+        previous[product] = status
+
+
+class AdaptiveScheduler:
+    def __init__(self, products, base_interval=3600, min_interval=300, max_interval=6 * 3600,
+                 hourly_budget=12, jitter=0.1, stable_after_hours=72, hot_window_min_restocks=1,
+                 burst_window=20 * 60, burst_interval=30,
+                 history=None, state_file=None, clock=time.time, rng=None):
+        """
+        products: prodotti da pianificare (dizionari con 'name' e 'url')
+        base_interval / min_interval / max_interval: secondi tra due controlli
+        hourly_budget: controlli massimi nell'ultima ora, per tutti i prodotti insieme
+        jitter: variazione casuale relativa dell'intervallo (0.1 = ±10%)
+        stable_after_hours: ore senza cambi di stato dopo cui l'intervallo si allunga
+        hot_window_min_restocks: restock nella stessa ora del giorno perché sia una fascia "calda"
+        burst_window / burst_interval: durata della raffica dopo un cambio di stato e secondi
+        tra due controlli durante la raffica (burst_window=0 la disattiva)
+        history: storico da cui ricavare fasce orarie dei restock e ultimo cambio di stato
+        state_file: file in cui salvare lo stato tra un'esecuzione e l'altra (opzionale)
+        """
+        self.products = list(products)
+        self.base_interval = base_interval
+        self.min_interval = min(min_interval, base_interval)
+        self.max_interval = max(max_interval, base_interval)
+        self.hourly_budget = max(1, int(hourly_budget))
+        self.jitter = max(0.0, float(jitter))
+        self.stable_after = stable_after_hours * 3600
+        self.hot_window_min_restocks = max(1, int(hot_window_min_restocks))
+        self.burst_window = max(0, burst_window)
+        self.burst_interval = max(1, burst_interval)
+        self.groups = {p['name']: product_group(p) for p in self.products}
+        self.state_file = state_file
+        self.clock = clock
+        self.rng = rng or random.Random()
+
+        # Stato per prodotto: prossimo controllo, errori consecutivi, ultimo status e cambio
+        self.state = {}
+        self.recent_checks = []
+        # Raffiche in corso: gruppo → fine della raffica
+        self.bursts = {}
+        # Valori aggiuntivi salvati insieme allo stato (es. orario dell'ultimo promemoria)
+        self.meta = {}
+        self.restock_hours = Counter()
+        if history is not None:
+            self.load_history(history)
+        if state_file:
+            self._load_state()
+
+    @classmethod
+    def from_config(cls, config, products, history=None, state_file=None):
+        """
+        Crea lo scheduler dalla sezione "scheduler" di config.json.
+        state_file: file dello stato (None: quello di config.json, '': nessun file)
+        """
+        settings = config.get('scheduler', {})
+        if state_file is None:
+            state_file = settings.get('state_file', DEFAULT_STATE_FILE)
+        return cls(
+            products,
+            base_interval=config.get('check_interval_minutes', 60) * 60,
+            min_interval=settings.get('min_interval_minutes', 5) * 60,
+            max_interval=settings.get('max_interval_minutes', 360) * 60,
+            hourly_budget=settings.get('hourly_budget', 12),
+            jitter=settings.get('jitter', 0.1),
+            stable_after_hours=settings.get('stable_after_hours', 72),
+            hot_window_min_restocks=settings.get('hot_window_min_restocks', 1),
+            burst_window=settings.get('burst', {}).get('window_minutes', 20) * 60,
+            burst_interval=settings.get('burst', {}).get('interval_seconds', 30),
+            history=history,
+            state_file=state_file,
+        )
+
+    def set_products(self, products):
+        """Aggiorna i prodotti pianificati (es. dopo la scoperta del catalogo): i nuovi sono subito in scadenza"""
+        self.products = list(products)
+        self.groups = {p['name']: product_group(p) for p in self.products}
+
+    # --- Stato ---
+
+    def _product_state(self, name):
+        return self.state.setdefault(name, {
+            'next_check': 0.0,
+            'errors': 0,
+            'status': None,
+            'last_change': None,
+        })
+
+    def load_history(self, history):
+        """Ricava dallo storico le ore dei restock e l'ultimo cambio di stato di ogni prodotto"""
+        self.restock_hours = Counter()
+        for product, when, before, status in _status_changes(history):
+            changed_at = _timestamp(when)
+            state = self._product_state(product)
+            state['status'] = status
+            state['last_change'] = changed_at
+            if status == 'AVAILABLE' and before is not None:
+                self.restock_hours[datetime.fromtimestamp(changed_at).hour] += 1
+
+    def update_states(self, states):
+        """Sovrascrive lo stato dei prodotti indicati (es. con quello condiviso tra più worker)"""
+        for name, state in states.items():
+            self._product_state(name).update(state)
+
+    def _load_state(self):
+        try:
+            with open(self.state_file, 'r') as f:
+                saved = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        for name, state in saved.get('products', {}).items():
+            self._product_state(name).update(state)
+        self.recent_checks = saved.get('recent_checks', [])
+        self.bursts = saved.get('bursts', {})
+        self.meta = saved.get('meta', {})
+
+    def save(self):
+        """Salva lo stato su file (scrittura atomica)"""
+        if not self.state_file:
+            return
+        data = {
+            'products': self.state,
+            'recent_checks': self.recent_checks,
+            'bursts': self.bursts,
+            'meta': self.meta,
+        }
+        tmp_file = f"{self.state_file}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_file, self.state_file)
+
+    # --- Pianificazione ---
+
+    def hot_weight(self, now):
+        """
+        Peso (0-1) della fascia oraria corrente in base ai restock passati.
+        Si guarda anche l'ora successiva per essere già rapidi all'inizio della fascia
+        """
+        if not self.restock_hours:
+            return 0.0
+        hour = datetime.fromtimestamp(now).hour
+        busiest = max(self.restock_hours.values())
+        counts = [self.restock_hours.get(h % 24, 0) for h in (hour, hour + 1)]
+        hot = [c for c in counts if c >= self.hot_window_min_restocks]
+        return max(hot) / busiest if hot else 0.0
+
+    # --- Raffiche dopo un cambio di stato ---
+
+    def in_burst(self, name, now=None):
+        """True se il gruppo del prodotto è in raffica"""
+        now = self.clock() if now is None else now
+        return self.bursts.get(self.groups.get(name), 0) > now
+
+    def burst_end(self, now=None):
+        """Fine dell'ultima raffica in corso (None se non ce ne sono)"""
+        now = self.clock() if now is None else now
+        active = [until for until in self.bursts.values() if until > now]
+        return max(active) if active else None
+
+    def _start_burst(self, name, now):
+        """Avvia (o prolunga) la raffica del gruppo: i prodotti correlati vanno controllati subito"""
+        if not self.burst_window:
+            return
+        group = self.groups.get(name)
+        self.bursts[group] = now + self.burst_window
+        for other, other_group in self.groups.items():
+            if other_group == group and other != name:
+                state = self._product_state(other)
+                state['next_check'] = min(state['next_check'], now)
+
+    def interval_for(self, name, now):
+        """Intervallo (senza jitter) fino al prossimo controllo del prodotto"""
+        if self.in_burst(name, now):
+            return self.burst_interval
+
+        state = self._product_state(name)
+        interval = self.base_interval
+
+        weight = self.hot_weight(now)
+        if weight > 0:
+            # Fascia calda: tra base_interval e min_interval in proporzione ai restock visti
+            interval = self.min_interval + (self.base_interval - self.min_interval) * (1 - weight)
+        elif state['last_change'] is not None and now - state['last_change'] > self.stable_after:
+            # Stabile da giorni: l'intervallo raddoppia per ogni giorno oltre la soglia
+            extra_days = int((now - state['last_change'] - self.stable_after) // 86400)
+            interval = self.base_interval * 2 ** min(extra_days + 1, 16)
+
+        if state['errors']:
+            interval *= 2 ** min(state['errors'], 16)
+
+        return max(self.min_interval, min(self.max_interval, interval))
+
+    def _next_hot_start(self, now, until):
+        """Inizio della prossima ora con peso > 0 prima di 'until' (None se non ce ne sono)"""
+        boundary = now - now % 3600 + 3600
+        while boundary < until:
+            if self.hot_weight(boundary) > 0:
+                return boundary
+            boundary += 3600
+        return None
+
+    def _schedule(self, name, now):
+        interval = self.interval_for(name, now)
+        interval *= 1 + self.rng.uniform(-self.jitter, self.jitter)
+        next_check = now + interval
+        if self.in_burst(name, now):
+            self._product_state(name)['next_check'] = next_check
+            return
+        # Un intervallo lungo non deve saltare una fascia calda
+        hot_start = self._next_hot_start(now, next_check)
+        if hot_start is not None:
+            next_check = hot_start + self.rng.uniform(0, self.jitter * self.min_interval)
+        self._product_state(name)['next_check'] = next_check
+
+    def _prune_budget(self, now):
+        self.recent_checks = [t for t in self.recent_checks if now - t < 3600]
+
+    def due(self, now=None):
+        """
+        Prodotti da controllare adesso, dal più in ritardo, entro il budget orario
+        (i prodotti in raffica sono sempre inclusi). Quelli esclusi per budget
+        restano in attesa e vengono ripresi appena possibile
+        """
+        now = self.clock() if now is None else now
+        self._prune_budget(now)
+
+        overdue = [p for p in self.products if self._product_state(p['name'])['next_check'] <= now]
+        overdue.sort(key=lambda p: self._product_state(p['name'])['next_check'])
+        bursting = [p for p in overdue if self.in_burst(p['name'], now)]
+        others = [p for p in overdue if not self.in_burst(p['name'], now)]
+
+        available_budget = max(0, self.hourly_budget - len(self.recent_checks))
+        return bursting + others[:available_budget]
+
+    def record(self, results, now=None):
+        """
+        Registra i risultati dei controlli eseguiti e pianifica i successivi.
+        Ritorna i cambi di stato rilevati: lista di (risultato, status precedente)
+        """
+        now = self.clock() if now is None else now
+        transitions = []
+        for result in results:
+            state = self._product_state(result['name'])
+            # I controlli in raffica sono fuori dal budget orario: non lo consumano
+            if not self.in_burst(result['name'], now):
+                self.recent_checks.append(now)
+
+            if result['status'] == 'ERROR':
+                state['errors'] += 1
+            else:
+                state['errors'] = 0
+
+            if result['status'] in _DEFINITE_STATUSES:
+                if state['status'] is not None and state['status'] != result['status']:
+                    state['last_change'] = now
+                    if result['status'] == 'AVAILABLE':
+                        self.restock_hours[datetime.fromtimestamp(now).hour] += 1
+                    transitions.append((result, state['status']))
+                    TRANSITIONS.inc(previous=state['status'], status=result['status'])
+                    self._start_burst(result['name'], now)
+                elif state['last_change'] is None:
+                    # Primo stato noto: la stabilità si conta da qui
+                    state['last_change'] = now
+                state['status'] = result['status']
+
+            self._schedule(result['name'], now)
+
+        # Raffiche concluse
+        self.bursts = {group: until for group, until in self.bursts.items() if until > now}
+        return transitions
+
+    def seconds_until_next(self, now=None):
+        """Secondi fino al prossimo controllo possibile (prodotto in scadenza o budget libero)"""
+        now = self.clock() if now is None else now
+        self._prune_budget(now)
+        waits = []
+        for p in self.products:
+            wait = self._product_state(p['name'])['next_check'] - now
+            if not self.in_burst(p['name'], now) and len(self.recent_checks) >= self.hourly_budget:
+                # Budget esaurito: si aspetta che il controllo più vecchio esca dalla finestra
+                wait = max(wait, self.recent_checks[0] + 3600 - now)
+            waits.append(wait)
+        return max(0.0, min(waits, default=0.0))
+
+    def describe(self, now=None):
+        """Prossimo controllo di ogni prodotto (per i log)"""
+        now = self.clock() if now is None else now
+        return {
+            p['name']: max(0.0, self._product_state(p['name'])['next_check'] - now)
+            for p in self.products
+        }
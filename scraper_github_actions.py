@@ -4,28 +4,47 @@ Netcup VPS ARM Availability Scraper - GitHub Actions Version
 Controlla la disponibilità e invia notifiche Telegram
 """
 
-import requests
-from bs4 import BeautifulSoup
 import json
 import os
+import time
 from datetime import datetime
 import sys
 
+from catalog_discovery import load_products
+from classifier import DEFAULT_CLASSIFIER_RULES, rules_from_config
+from history_store import history_store_from_config
+from http_session import configure_from_config, get_session, open_circuits
+import metrics
+from metrics import record_error, record_telegram, stage, timed_check
+from response_cache import ResponseCache, page_region_hash
+from scheduler import AdaptiveScheduler
+from stream_classifier import classify_html
+from structured_data import extract_availability
+from subscribers import notifier_from_config, registry_from_config
+
 # Configurazione
-PRODUCTS = [
-    {
-        "name": "VPS 1000 ARM G11",
-        "url": "https://www.netcup.com/en/server/arm-server/vps-1000-arm-g11-iv-mnz"
-    },
-    {
-        "name": "VPS 2000 ARM G11",
-        "url": "https://www.netcup.com/en/server/arm-server/vps-2000-arm-g11-iv-mnz"
-    },
-    {
-        "name": "VPS 3000 ARM G11",
-        "url": "https://www.netcup.com/en/server/arm-server/vps-3000-arm-g11-mnz"
-    }
-]
+# I prodotti vengono da config.json più quelli scoperti in catalog.json
+# (catalog_discovery.py, eseguito prima di questo script dal workflow)
+
+# Storico dei controlli, persistito tra le esecuzioni dei workflow (actions/cache).
+# Salva solo i cambi di stato: nessun troncamento, le transizioni restano tutte
+HISTORY_BACKEND = 'transitions'
+HISTORY_FILE = 'availability_history.db'
+LEGACY_HISTORY_FILE = 'availability_log.jsonl'
+
+# Cache delle risposte, persistita tra le esecuzioni dei workflow (actions/cache)
+RESPONSE_CACHE_FILE = 'response_cache.json'
+
+# Regole di classificazione e scheduler condivisi con gli altri scraper
+# (sezioni "classifier" e "scheduler" di config.json)
+CONFIG_FILE = 'config.json'
+
+# Stato dello scheduler adattivo, persistito tra le esecuzioni (actions/cache):
+# il cron parte spesso, ma ogni prodotto viene controllato solo quando è in scadenza
+SCHEDULE_STATE_FILE = 'schedule_state.json'
+
+# Chat che hanno chiesto /check (scritto da telegram_command_handler.py)
+CHECK_REQUESTS_FILE = 'check_requests.json'
 
 TELEGRAM_BOT_TOKEN = os.environ.get('TELEGRAM_BOT_TOKEN')
 TELEGRAM_CHAT_ID = os.environ.get('TELEGRAM_CHAT_ID')
@@ -37,77 +56,91 @@ HEADERS = {
 }
 
 
-def send_telegram_message(message, parse_mode='HTML'):
-    """Invia un messaggio su Telegram"""
-    if not TELEGRAM_BOT_TOKEN or not TELEGRAM_CHAT_ID:
+def send_telegram_message(message, parse_mode='HTML', chat_id=None):
+    """Invia un messaggio su Telegram (di default alla chat configurata)"""
+    chat_id = chat_id or TELEGRAM_CHAT_ID
+    if not TELEGRAM_BOT_TOKEN or not chat_id:
         print("⚠️ Token Telegram o Chat ID non configurati")
         return False
     
     url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
     payload = {
-        'chat_id': TELEGRAM_CHAT_ID,
+        'chat_id': chat_id,
         'text': message,
         'parse_mode': parse_mode,
         'disable_web_page_preview': True
     }
     
     try:
-        response = requests.post(url, json=payload, timeout=10)
+        with stage('telegram_send'):
+            response = get_session().post(url, json=payload, timeout=10)
         response.raise_for_status()
-        print("✅ Messaggio Telegram inviato con successo")
+        record_telegram(True)
+        print(f"✅ Messaggio Telegram inviato con successo a {chat_id}")
         return True
     except Exception as e:
         print(f"❌ Errore nell'invio del messaggio Telegram: {e}")
+        record_telegram(False)
         return False
 
 
-def check_availability(product):
+@timed_check
+def check_availability(product, cache=None, rules=None):
     """Controlla la disponibilità di un singolo prodotto"""
     try:
         print(f"Controllando {product['name']}...")
         
-        response = requests.get(product['url'], headers=HEADERS, timeout=15)
-        response.raise_for_status()
+        # GET condizionale: se la pagina non è cambiata il server risponde 304
+        headers = dict(HEADERS, **cache.conditional_headers(product['url'])) if cache else HEADERS
+        response = get_session().get(product['url'], headers=headers, timeout=15)
         
-        soup = BeautifulSoup(response.text, 'lxml')
-        page_text = soup.get_text().lower()
+        cached = cache.lookup(product['url'], response) if cache else None
+        region_hash = None
+        details = None
+        if cached is None:
+            response.raise_for_status()
+            # Prima i dati strutturati (JSON-LD / payload di idratazione), poi il testo
+            with stage('parse'):
+                details = extract_availability(response.text, product)
+            if details is None and cache:
+                region_hash = page_region_hash(response.text)
+                cached = cache.lookup(product['url'], response, region_hash)
         
-        # Determina disponibilità
-        if 'sold out' in page_text or 'product is sold out' in page_text:
-            available = False
-            status = "SOLD OUT"
-        elif 'add to shopping cart' in page_text or 'order now' in page_text:
-            available = True
-            status = "AVAILABLE"
+        if cached is not None:
+            # Pagina invariata: riusa la classificazione precedente senza parsing
+            available, status = cached['available'], cached['status']
+            details = cached.get('details')
+            cache.touch(product['url'], response)
+            print(f"  → {product['name']}: {status} (invariato, da cache)")
+        elif details is not None:
+            available, status = details.pop('available'), details.pop('status')
+            if cache:
+                cache.store(product['url'], response, None, available, status, details)
+            print(f"  → {product['name']}: {status} (dati strutturati: {details['source']})")
         else:
-            # Cerca nei button
-            buttons = soup.find_all('button')
-            available = None
-            status = "UNKNOWN"
-            
-            for button in buttons:
-                button_text = button.get_text().strip().lower()
-                if 'sold out' in button_text:
-                    available = False
-                    status = "SOLD OUT"
-                    break
-                elif 'add to' in button_text or 'cart' in button_text:
-                    available = True
-                    status = "AVAILABLE"
-                    break
-        
-        print(f"  → {product['name']}: {status}")
+            with stage('classify'):
+                available, status = classify_html(response.text, rules or DEFAULT_CLASSIFIER_RULES)
+            details = {'source': 'html'}
+            if cache:
+                cache.store(product['url'], response, region_hash, available, status, details)
+            print(f"  → {product['name']}: {status}")
         
-        return {
+        result = {
             'name': product['name'],
             'url': product['url'],
             'available': available,
             'status': status,
             'timestamp': datetime.now().isoformat()
         }
+        # Sorgente della classificazione ed eventuali prezzo/scorte
+        result.update(details or {})
+        if cached is not None:
+            result['cache_hit'] = True
+        return result
         
     except Exception as e:
         print(f"❌ Errore: {e}")
+        record_error(e)
         return {
             'name': product['name'],
             'url': product['url'],
@@ -118,44 +151,32 @@ def check_availability(product):
         }
 
 
-def load_previous_results():
-    """Carica i risultati precedenti se esistono"""
+def load_config(config_file=CONFIG_FILE):
+    """Carica config.json (vuoto se manca: valgono i default)"""
     try:
-        with open('availability_log.json', 'r') as f:
-            data = json.load(f)
-            if data:
-                return data[-1]['results']  # Ritorna l'ultimo check
-    except (FileNotFoundError, json.JSONDecodeError, IndexError, KeyError):
+        with open(config_file, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def load_previous_results(history):
+    """Carica i risultati dell'ultimo controllo (legge solo l'ultima voce dello storico)"""
+    try:
+        entry = history.latest()
+        if entry:
+            return entry['results']
+    except (KeyError, TypeError, ValueError):
         pass
     return None
 
 
-def save_results(results):
-    """Salva i risultati nel file di log"""
+def save_results(history, results):
+    """Salva i risultati nello storico (una sola scrittura in append)"""
     try:
-        # Leggi dati esistenti
-        try:
-            with open('availability_log.json', 'r') as f:
-                log_data = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            log_data = []
-        
-        # Aggiungi nuovi risultati
-        log_entry = {
-            'check_time': datetime.now().isoformat(),
-            'results': results
-        }
-        log_data.append(log_entry)
-        
-        # Mantieni solo gli ultimi 100 check per non far crescere troppo il file
-        if len(log_data) > 100:
-            log_data = log_data[-100:]
-        
-        # Salva
-        with open('availability_log.json', 'w') as f:
-            json.dump(log_data, f, indent=2)
-        
-        print("✅ Risultati salvati in availability_log.json")
+        with stage('history_write'):
+            history.append(results)
+        print(f"✅ Risultati salvati in {history.path}")
         
     except Exception as e:
         print(f"❌ Errore nel salvare i risultati: {e}")
@@ -193,6 +214,9 @@ def format_telegram_message(results, previous_results=None, manual_check=False):
         
         if result['available']:
             any_available = True
+            if result.get('price') is not None:
+                # Prezzo letto dai dati strutturati della pagina
+                message += f"   💶 {result['price']} {result.get('currency', '')}".rstrip() + "\n"
             message += f"   🔗 <a href='{result['url']}'>Ordina ora!</a>\n"
         
         message += "\n"
@@ -206,6 +230,77 @@ def format_telegram_message(results, previous_results=None, manual_check=False):
     return message, any_available, changes_detected
 
 
+def format_transition_message(result, previous_status):
+    """Messaggio breve per un singolo cambio di stato rilevato durante una raffica"""
+    now = datetime.now().strftime('%H:%M:%S UTC')
+    if result['available']:
+        message = f"🆕 <b>{result['name']}</b>: ORA DISPONIBILE! (era {previous_status})\n"
+        if result.get('price') is not None:
+            message += f"   💶 {result['price']} {result.get('currency', '')}".rstrip() + "\n"
+        message += f"   🔗 <a href='{result['url']}'>Ordina ora!</a>\n"
+    else:
+        message = f"⚠️ <b>{result['name']}</b>: {result['status']} (era {previous_status})\n"
+    message += f"⏰ {now}"
+    return message
+
+
+def load_check_requests():
+    """Chat che hanno chiesto /check (la chat configurata se il file manca)"""
+    try:
+        with open(CHECK_REQUESTS_FILE, 'r') as f:
+            return [str(chat_id) for chat_id in json.load(f)]
+    except (FileNotFoundError, json.JSONDecodeError):
+        return [str(TELEGRAM_CHAT_ID)] if TELEGRAM_CHAT_ID else []
+
+
+def notify_transitions(notifier, registry, transitions):
+    """Un messaggio per cambio di stato, solo agli iscritti che seguono il prodotto, in parallelo"""
+    per_chat = registry.split(transitions, key=lambda transition: transition[0]['name'])
+    return notifier.send({
+        chat_id: [format_transition_message(result, previous_status) for result, previous_status in items]
+        for chat_id, items in per_chat.items()
+    })
+
+
+def run_burst(scheduler, history, cache, rules, notifier, registry):
+    """
+    Raffica dopo un cambio di stato: il job resta attivo e controlla i prodotti
+    correlati ogni pochi secondi, notificando subito ogni nuova transizione.
+    Ritorna i risultati dei controlli eseguiti
+    """
+    results = []
+    burst_end = scheduler.burst_end()
+    if burst_end is None:
+        return results
+    print(f"\n⚡ Modalità raffica fino alle {datetime.fromtimestamp(burst_end).strftime('%H:%M:%S')}")
+    
+    while True:
+        burst_end = scheduler.burst_end()
+        if burst_end is None:
+            break
+        wait = scheduler.seconds_until_next()
+        if time.time() + wait >= burst_end:
+            break
+        time.sleep(wait)
+        
+        # Durante la raffica solo i prodotti correlati (gli altri restano al ritmo normale)
+        products = [p for p in scheduler.due() if scheduler.in_burst(p['name'])]
+        if not products:
+            continue
+        checked = [check_availability(product, cache, rules) for product in products]
+        save_results(history, checked)
+        transitions = scheduler.record(checked)
+        for result, previous_status in transitions:
+            print(f"🔔 {result['name']}: {previous_status} → {result['status']}")
+        notify_transitions(notifier, registry, transitions)
+        scheduler.save()
+        cache.save()
+        results.extend(checked)
+    
+    print("⏹️  Raffica conclusa, si torna alla cadenza normale")
+    return results
+
+
 def main():
     """Funzione principale"""
     # Controlla se è un check manuale (triggherato da comando)
@@ -221,32 +316,76 @@ def main():
     print()
     
     # Carica risultati precedenti
-    previous_results = load_previous_results()
+    config = load_config()
+    configure_from_config(config)
+    history = history_store_from_config({
+        'history_backend': HISTORY_BACKEND,
+        'log_file': HISTORY_FILE,
+        'legacy_log_file': LEGACY_HISTORY_FILE,
+    })
+    previous_results = load_previous_results(history)
+    all_products = load_products(config)
     
-    # Esegui check
+    # Lo scheduler decide quali prodotti sono in scadenza (un check manuale li controlla tutti)
+    scheduler = AdaptiveScheduler.from_config(config, all_products, history, state_file=SCHEDULE_STATE_FILE)
+    products = all_products if manual_check else scheduler.due()
+    if not products:
+        print("⏭️  Nessun prodotto in scadenza:")
+        for name, seconds in scheduler.describe().items():
+            print(f"   {name}: tra {seconds / 60:.1f} minuti")
+        scheduler.save()
+        sys.exit(0)
+    
+    # Esegui check (con GET condizionali grazie alla cache delle risposte)
+    rules = rules_from_config(config)
+    cache = ResponseCache(RESPONSE_CACHE_FILE, rules_fingerprint=rules.fingerprint)
     results = []
-    for product in PRODUCTS:
-        result = check_availability(product)
+    for product in products:
+        result = check_availability(product, cache, rules)
         results.append(result)
+    cache.save()
     
     # Salva risultati
-    save_results(results)
+    save_results(history, results)
+    transitions = scheduler.record(results)
     
-    # Prepara messaggio Telegram
-    message, any_available, changes_detected = format_telegram_message(results, previous_results, manual_check)
+    # Un solo diff, un messaggio per iscritto con i soli prodotti che segue.
+    # Ogni iscritto riceve la notifica solo se:
+    # 1. Ha chiesto lui il check manuale, OPPURE
+    # 2. C'è stato un cambio di stato tra i suoi prodotti, OPPURE
+    # 3. C'è almeno un suo prodotto disponibile e l'ultimo promemoria risale a più di
+    #    check_interval_minutes fa (i controlli ora possono essere più frequenti)
+    registry = registry_from_config(config, all_products, TELEGRAM_CHAT_ID)
+    notifier = notifier_from_config(config, send_telegram_message)
+    requesters = load_check_requests() if manual_check else []
+    now = time.time()
+    reminder_due = now - scheduler.meta.get('last_available_notice', 0) >= scheduler.base_interval
     
-    # Invia notifica Telegram solo se:
-    # 1. È un check manuale (invia sempre), OPPURE
-    # 2. C'è almeno un prodotto disponibile, OPPURE
-    # 3. C'è stato un cambio di stato
-    should_notify = manual_check or any_available or changes_detected
+    messages = {}
+    any_available = False
+    for chat_id, subset in registry.split(results).items():
+        message, chat_available, chat_changes = format_telegram_message(subset, previous_results, manual_check)
+        any_available = any_available or chat_available
+        if chat_id in requesters or chat_changes or (chat_available and reminder_due):
+            messages[chat_id] = [message]
     
-    if should_notify:
-        print("\n📱 Invio notifica Telegram...")
-        send_telegram_message(message)
+    if messages:
+        print(f"\n📱 Invio notifica Telegram a {len(messages)} chat...")
+        notifier.send(messages)
+        if any_available:
+            scheduler.meta['last_available_notice'] = now
     else:
+        message, _, _ = format_telegram_message(results, previous_results, manual_check)
         print("\n⏭️  Nessun cambio di stato, notifica saltata")
         print(f"💬 Messaggio che sarebbe stato inviato:\n{message}")
+    scheduler.save()
+    
+    # Dopo un cambio di stato i restock arrivano a ondate: il job resta attivo
+    # per la finestra della raffica invece di aspettare il prossimo cron
+    if transitions or scheduler.burst_end() is not None:
+        burst_results = run_burst(scheduler, history, cache, rules, notifier, registry)
+        # Per il riepilogo vale l'ultimo risultato di ogni prodotto
+        results = list({r['name']: r for r in results + burst_results}.values())
     
     # Mostra riepilogo
     print("\n" + "=" * 60)
@@ -254,8 +393,15 @@ def main():
     for result in results:
         emoji = "✅" if result['available'] else "❌" if result['available'] is False else "❓"
         print(f"  {emoji} {result['name']}: {result['status']}")
+    for host, until in open_circuits().items():
+        print(f"⛔ {host} in pausa fino alle {datetime.fromtimestamp(until).strftime('%H:%M:%S')} (troppi errori consecutivi)")
     print("=" * 60)
     
+    # Tempi per fase e contatori di questa esecuzione
+    summary = metrics.write_summary(config)
+    for stage_name, stats in summary['netcup_stage_seconds'].items():
+        print(f"⏱️  {stage_name}: {stats['count']} × {stats['mean_seconds'] * 1000:.1f} ms")
+    
     # Exit code: 0 se tutto ok, 1 se ci sono errori
     has_errors = any(r['status'] == 'ERROR' for r in results)
     sys.exit(1 if has_errors else 0)
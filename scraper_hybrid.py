@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Netcup VPS ARM Availability Scraper - Approccio Ibrido (HTTP → Browser)
+Controlla tutti i prodotti con la versione leggera e passa al browser (Selenium)
+solo quelli rimasti UNKNOWN o in ERROR (tranne gli errori già gestiti dal livello
+di resilienza: host in pausa, 429 e 5xx)
+"""
+
+import time
+from datetime import datetime
+import logging
+from urllib.parse import urlparse
+
+from http_session import open_circuits
+from scraper_light import NetcupScraperLight
+
+logger = logging.getLogger(__name__)
+
+# Status per cui la risposta HTTP non basta e serve il browser
+ESCALATION_STATUSES = ('UNKNOWN', 'ERROR')
+
+
+def needs_browser(result, paused_hosts=()):
+    """
+    True se il risultato HTTP va ricontrollato con il browser. Gli ERROR da blocco anti-bot
+    (403, connessione chiusa) sì; host in pausa, 429 e 5xx no: li gestisce già il livello di
+    resilienza, e il browser scaricherebbe la pagina fuori da tentativi e pause, aggiungendo
+    carico proprio all'host che ha appena rallentato o fallito
+    """
+    if result['status'] not in ESCALATION_STATUSES:
+        return False
+    if result['status'] == 'UNKNOWN':
+        return True
+    status_code = result.get('status_code')
+    if result.get('error_type') == 'CircuitOpenError' or urlparse(result['url']).netloc in paused_hosts:
+        return False
+    return not (status_code == 429 or (status_code is not None and status_code >= 500))
+
+
+class NetcupScraperHybrid:
+    def __init__(self, config_file='config.json', headless=True):
+        """Inizializza il livello HTTP; il browser viene avviato solo se serve"""
+        self.config_file = config_file
+        self.headless = headless
+        self.light = NetcupScraperLight(config_file)
+        
+        self.config = self.light.config
+        self.products = self.light.products
+        self.check_interval = self.light.check_interval
+        
+        self._browser = None
+        self._browser_unavailable = False
+        
+        # Statistiche di escalation dall'avvio
+        self.stats = {'checks': 0, 'escalated': 0, 'resolved_by_browser': 0}
+    
+    def _browser_engine(self):
+        """Crea lo scraper Selenium al primo bisogno (dipendenza opzionale)"""
+        if self._browser is None and not self._browser_unavailable:
+            try:
+                from scraper_selenium import NetcupScraperSelenium
+            except ImportError as e:
+                logger.warning(f"Selenium non disponibile, niente escalation al browser: {e}")
+                self._browser_unavailable = True
+                return None
+            self._browser = NetcupScraperSelenium(self.config_file, headless=self.headless)
+        return self._browser
+    
+    def check_products(self, products):
+        """
+        Livello 1: HTTP per tutti i prodotti.
+        Livello 2: browser solo per i risultati UNKNOWN/ERROR (vedi needs_browser).
+        Ogni risultato riporta in 'tier' il livello che ha risposto
+        """
+        results = self.light.check_products(products)
+        for result in results:
+            result['tier'] = 'http'
+        
+        paused_hosts = open_circuits()
+        escalate = [i for i, result in enumerate(results) if needs_browser(result, paused_hosts)]
+        self.stats['checks'] += len(results)
+        self.stats['escalated'] += len(escalate)
+        
+        browser = self._browser_engine() if escalate else None
+        if browser is not None:
+            logger.info(f"Escalation al browser per {len(escalate)}/{len(results)} prodotti")
+            browser_results = browser.check_products([products[i] for i in escalate])
+            for i, browser_result in zip(escalate, browser_results):
+                browser_result['tier'] = 'browser'
+                browser_result['http_status'] = results[i]['status']
+                if browser_result['status'] in ('AVAILABLE', 'SOLD OUT'):
+                    self.stats['resolved_by_browser'] += 1
+                results[i] = browser_result
+        
+        return results
+    
+    def close(self):
+        """Chiude i browser eventualmente aperti"""
+        if self._browser is not None:
+            self._browser.close()
+    
+    def run_check(self, keep_browsers=False):
+        """Esegue un singolo ciclo di controllo per tutti i prodotti"""
+        logger.info("=" * 60)
+        logger.info(f"Inizio controllo disponibilità (ibrido) - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        logger.info("=" * 60)
+        
+        try:
+            results = self.check_products(self.products)
+            self.light.save_results(results)
+            
+            # Mostra riepilogo
+            logger.info("\n" + "=" * 60)
+            logger.info("RIEPILOGO:")
+            for result in results:
+                status_emoji = "✅" if result['available'] else "❌" if result['available'] is False else "❓"
+                logger.info(f"  {status_emoji} {result['name']}: {result['status']} [{result['tier']}]")
+            
+            escalation_rate = self.stats['escalated'] / max(1, self.stats['checks']) * 100
+            logger.info(f"Escalation al browser: {self.stats['escalated']}/{self.stats['checks']} "
+                        f"({escalation_rate:.0f}%), risolte dal browser: {self.stats['resolved_by_browser']}")
+            logger.info("=" * 60 + "\n")
+            
+            return results
+            
+        finally:
+            if not keep_browsers:
+                self.close()
+    
+    def run_continuous(self):
+        """Esegue controlli continui ogni intervallo specificato"""
+        logger.info(f"Avvio monitoraggio continuo (controllo ogni {self.config['check_interval_minutes']} minuti)")
+        logger.info("Premi Ctrl+C per fermare\n")
+        
+        try:
+            while True:
+                self.run_check(keep_browsers=True)
+                logger.info(f"Prossimo controllo tra {self.config['check_interval_minutes']} minuti...\n")
+                time.sleep(self.check_interval)
+        except KeyboardInterrupt:
+            logger.info("\nMonitoraggio interrotto dall'utente")
+        finally:
+            self.close()
+
+
+def main():
+    """Funzione principale"""
+    scraper = NetcupScraperHybrid(headless=True)
+    
+    # Chiedi all'utente cosa vuole fare
+    print("\nNetcup VPS ARM Availability Scraper (Ibrido)")
+    print("=" * 50)
+    print("1. Controllo singolo")
+    print("2. Monitoraggio continuo (ogni ora)")
+    print("=" * 50)
+    
+    choice = input("\nScegli un'opzione (1 o 2): ").strip()
+    
+    if choice == "1":
+        scraper.run_check()
+    elif choice == "2":
+        scraper.run_continuous()
+    else:
+        print("Opzione non valida. Eseguo un controllo singolo.")
+        scraper.run_check()
+
+
+if __name__ == "__main__":
+    main()
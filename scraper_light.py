@@ -5,13 +5,24 @@ Controlla la disponibilità dei VPS ARM usando semplici richieste HTTP
 """
 
 import requests
-from bs4 import BeautifulSoup
 import json
 import time
 from datetime import datetime
 import logging
 import sys
 
+from async_engine import AsyncFetchEngine
+from catalog_discovery import CatalogCrawler, load_products
+from history_store import history_store_from_config
+from http_session import configure_from_config, get_session, open_circuits
+import metrics
+from metrics import record_error, stage, timed_check
+from response_cache import ResponseCache, page_region_hash
+from scheduler import AdaptiveScheduler
+from classifier import rules_from_config
+from stream_classifier import classify_html
+from structured_data import extract_availability
+
 # Configurazione logging
 logging.basicConfig(
     level=logging.INFO,
@@ -32,9 +43,29 @@ class NetcupScraperLight:
             self.config = json.load(f)
         
         self.log_file = self.config['log_file']
-        self.products = self.config['products']
+        # Prodotti di config.json più quelli scoperti dalla scansione del catalogo
+        self.products = load_products(self.config)
+        self.crawler = CatalogCrawler(self.config)
         self.check_interval = self.config['check_interval_minutes'] * 60
         
+        # Sessione HTTP condivisa (pool di connessioni keep-alive per host)
+        configure_from_config(self.config)
+        
+        # Motore concorrente: limite per host e pausa di cortesia al posto dello sleep globale
+        self.engine = AsyncFetchEngine(
+            max_per_host=self.config.get('max_concurrent_per_host', 2),
+            politeness_delay=self.config.get('politeness_delay_seconds', 1.0),
+        )
+        
+        # Regole di classificazione condivise (sezione "classifier" di config.json)
+        self.rules = rules_from_config(self.config)
+        
+        # Cache delle risposte (ETag/Last-Modified + hash della pagina)
+        self.cache = ResponseCache(
+            self.config.get('response_cache_file', 'response_cache.json'),
+            rules_fingerprint=self.rules.fingerprint,
+        )
+        
         # Headers per sembrare un browser normale
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
@@ -43,113 +74,124 @@ class NetcupScraperLight:
             'Connection': 'keep-alive',
         }
         
-        # Inizializza il file di log se non esiste
-        self._init_log_file()
-    
-    def _init_log_file(self):
-        """Inizializza il file di log JSON"""
-        try:
-            with open(self.log_file, 'r') as f:
-                json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            with open(self.log_file, 'w') as f:
-                json.dump([], f, indent=2)
+        # Storico dei controlli (append-only, JSONL o SQLite)
+        self.history = history_store_from_config(self.config)
     
+    @timed_check
     def check_availability(self, product):
         """Controlla la disponibilità di un singolo prodotto"""
         try:
             logger.info(f"Controllando {product['name']}...")
             
-            response = requests.get(product['url'], headers=self.headers, timeout=10)
-            response.raise_for_status()
+            # GET condizionale: se la pagina non è cambiata il server risponde 304
+            headers = dict(self.headers, **self.cache.conditional_headers(product['url']))
+            response = get_session().get(product['url'], headers=headers)
             
-            soup = BeautifulSoup(response.text, 'lxml')
+            cached = self.cache.lookup(product['url'], response)
+            region_hash = None
+            details = None
+            if cached is None:
+                response.raise_for_status()
+                # Prima i dati strutturati (JSON-LD / payload di idratazione): costano
+                # un'espressione regolare e un json.loads, e non dipendono dal layout
+                with stage('parse'):
+                    details = extract_availability(response.text, product)
+                if details is None:
+                    region_hash = page_region_hash(response.text)
+                    cached = self.cache.lookup(product['url'], response, region_hash)
             
-            # Cerca il pulsante di acquisto
-            # Possibili selettori da testare:
-            # 1. Cerca il testo "product is sold out" o "add to shopping cart"
-            # 2. Cerca button con classe o attributo specifico
-            
-            # Strategia 1: Cerca il testo direttamente
-            page_text = soup.get_text().lower()
-            
-            if 'sold out' in page_text or 'product is sold out' in page_text:
-                available = False
-                status = "SOLD OUT"
-            elif 'add to shopping cart' in page_text or 'order now' in page_text:
-                available = True
-                status = "AVAILABLE"
+            if cached is not None:
+                # Pagina invariata: riusa la classificazione precedente senza parsing
+                available, status = cached['available'], cached['status']
+                details = cached.get('details')
+                self.cache.touch(product['url'], response)
+                logger.info(f"  → {product['name']}: {status} (invariato, da cache)")
+            elif details is not None:
+                available, status = details.pop('available'), details.pop('status')
+                self.cache.store(product['url'], response, None, available, status, details)
+                logger.info(f"  → {product['name']}: {status} (dati strutturati: {details['source']})")
             else:
-                available = None
-                status = "UNKNOWN"
+                with stage('classify'):
+                    available, status = classify_html(response.text, self.rules)
+                details = {'source': 'html'}
+                self.cache.store(product['url'], response, region_hash, available, status, details)
+                logger.info(f"  → {product['name']}: {status}")
             
-            # Strategia 2: Cerca button specifici
-            buttons = soup.find_all('button')
-            for button in buttons:
-                button_text = button.get_text().strip().lower()
-                if 'sold out' in button_text:
-                    available = False
-                    status = "SOLD OUT"
-                    break
-                elif 'add to' in button_text or 'cart' in button_text:
-                    available = True
-                    status = "AVAILABLE"
-                    break
-            
-            logger.info(f"  → {product['name']}: {status}")
-            return {
+            result = {
                 'name': product['name'],
                 'url': product['url'],
                 'available': available,
                 'status': status,
                 'timestamp': datetime.now().isoformat()
             }
+            # Sorgente della classificazione ed eventuali prezzo/scorte
+            result.update(details or {})
+            if cached is not None:
+                result['cache_hit'] = True
+            return result
             
         except requests.RequestException as e:
             logger.error(f"Errore durante il controllo di {product['name']}: {e}")
-            return {
+            record_error(e)
+            result = {
                 'name': product['name'],
                 'url': product['url'],
                 'available': None,
                 'status': "ERROR",
                 'error': str(e),
+                'error_type': type(e).__name__,
                 'timestamp': datetime.now().isoformat()
             }
+            # Codice HTTP dell'errore (403, 429, 5xx...): decide l'escalation della versione ibrida
+            if e.response is not None:
+                result['status_code'] = e.response.status_code
+            return result
+    
+    def check_products(self, products):
+        """Controlla i prodotti in parallelo (risultati nello stesso ordine) e salva la cache"""
+        results = self.engine.run(products, self.check_availability)
+        try:
+            self.cache.save()
+        except OSError as e:
+            # La cache è solo un'ottimizzazione: i risultati valgono comunque
+            logger.warning(f"Cache delle risposte non salvata: {e}")
+        return results
     
     def save_results(self, results):
-        """Salva i risultati nel file di log"""
+        """Salva i risultati nello storico (una sola scrittura in append)"""
         try:
-            # Leggi i dati esistenti
-            with open(self.log_file, 'r') as f:
-                log_data = json.load(f)
-            
-            # Aggiungi i nuovi risultati
-            log_entry = {
-                'check_time': datetime.now().isoformat(),
-                'results': results
-            }
-            log_data.append(log_entry)
-            
-            # Salva tutto
-            with open(self.log_file, 'w') as f:
-                json.dump(log_data, f, indent=2)
-            
+            with stage('history_write'):
+                self.history.append(results)
             logger.info(f"Risultati salvati in {self.log_file}")
             
         except Exception as e:
             logger.error(f"Errore nel salvare i risultati: {e}")
     
-    def run_check(self):
-        """Esegue un singolo ciclo di controllo per tutti i prodotti"""
+    def refresh_catalog(self, force=False):
+        """
+        Scansiona il catalogo se è il momento (o se forzata);
+        ritorna True se l'elenco dei prodotti è cambiato
+        """
+        try:
+            diff = self.crawler.refresh(force)
+        except (OSError, ValueError) as e:
+            logger.error(f"Errore nella scansione del catalogo: {e}")
+            return False
+        if diff is None:
+            return False
+        new, missing = diff
+        for product in new:
+            logger.info(f"🆕 Nuovo prodotto nel catalogo: {product['name']} ({product['url']})")
+        self.products = load_products(self.config)
+        return bool(new or missing)
+    
+    def run_check(self, products=None):
+        """Esegue un singolo ciclo di controllo per tutti i prodotti (o per quelli indicati)"""
         logger.info("=" * 60)
         logger.info(f"Inizio controllo disponibilità - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
         logger.info("=" * 60)
         
-        results = []
-        for product in self.products:
-            result = self.check_availability(product)
-            results.append(result)
-            time.sleep(2)  # Pausa tra le richieste per non sovraccaricare il server
+        results = self.check_products(products or self.products)
         
         self.save_results(results)
         
@@ -159,17 +201,53 @@ class NetcupScraperLight:
         for result in results:
             status_emoji = "✅" if result['available'] else "❌" if result['available'] is False else "❓"
             logger.info(f"  {status_emoji} {result['name']}: {result['status']}")
+        for host, until in open_circuits().items():
+            logger.warning(f"  ⛔ {host} in pausa fino alle {datetime.fromtimestamp(until).strftime('%H:%M:%S')}")
         logger.info("=" * 60 + "\n")
         
         return results
     
+    def run_scheduled(self):
+        """Monitoraggio continuo con lo scheduler adattivo: ogni prodotto ha il suo intervallo"""
+        scheduler = AdaptiveScheduler.from_config(self.config, self.products, self.history)
+        self.start_metrics()
+        logger.info(f"Avvio monitoraggio adattivo (budget {scheduler.hourly_budget} controlli/ora)")
+        logger.info("Premi Ctrl+C per fermare\n")
+        
+        try:
+            while True:
+                if self.refresh_catalog():
+                    scheduler.set_products(self.products)
+                due = scheduler.due()
+                if due:
+                    # Un cambio di stato avvia la raffica sui prodotti correlati
+                    for result, previous_status in scheduler.record(self.run_check(due)):
+                        logger.warning(f"🔔 {result['name']}: {previous_status} → {result['status']}")
+                    scheduler.save()
+                    for name, seconds in scheduler.describe().items():
+                        logger.info(f"  Prossimo controllo di {name} tra {seconds / 60:.1f} minuti")
+                time.sleep(max(1.0, scheduler.seconds_until_next()))
+        except KeyboardInterrupt:
+            logger.info("\nMonitoraggio interrotto dall'utente")
+    
+    def start_metrics(self):
+        """Espone /metrics durante il monitoraggio continuo (sezione "metrics" di config.json)"""
+        server = metrics.start_from_config(self.config)
+        if server is not None:
+            logger.info(f"Metriche su http://localhost:{server.server_address[1]}/metrics")
+    
     def run_continuous(self):
         """Esegue controlli continui ogni intervallo specificato"""
+        if self.config.get('scheduler', {}).get('enabled'):
+            return self.run_scheduled()
+        
+        self.start_metrics()
         logger.info(f"Avvio monitoraggio continuo (controllo ogni {self.config['check_interval_minutes']} minuti)")
         logger.info("Premi Ctrl+C per fermare\n")
         
         try:
             while True:
+                self.refresh_catalog()
                 self.run_check()
                 logger.info(f"Prossimo controllo tra {self.config['check_interval_minutes']} minuti...\n")
                 time.sleep(self.check_interval)
@@ -190,13 +268,13 @@ def main():
     
     choice = input("\nScegli un'opzione (1 o 2): ").strip()
     
-    if choice == "1":
-        scraper.run_check()
-    elif choice == "2":
+    if choice == "2":
         scraper.run_continuous()
-    else:
+        return
+    if choice != "1":
         print("Opzione non valida. Eseguo un controllo singolo.")
-        scraper.run_check()
+    scraper.run_check()
+    metrics.write_summary(scraper.config)
 
 
 if __name__ == "__main__":
@@ -10,12 +10,27 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
+from selenium.common.exceptions import TimeoutException, WebDriverException
 from webdriver_manager.chrome import ChromeDriverManager
+import base64
 import json
 import time
 from datetime import datetime
 import logging
+import os
 import sys
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from api_poller import DEFAULT_ENDPOINT_FILE, ApiEndpoint
+from catalog_discovery import load_products
+from classifier import SELENIUM_BUTTON_MARKERS, rules_from_config
+from driver_pool import DriverPool
+from history_store import history_store_from_config
+from structured_data import availability_from_json
 
 # Configurazione logging
 logging.basicConfig(
@@ -29,6 +44,136 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+_LOWERCASE_TEXT = "translate(text(), 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz')"
+_LOWERCASE_STRING = "translate(., 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz')"
+
+
+def _xpath_literal(value):
+    """Stringa XPath 1.0 (gli apici singoli richiedono concat())"""
+    if "'" not in value:
+        return f"'{value}'"
+    parts = value.split("'")
+    return "concat(" + ", \"'\", ".join(f"'{part}'" for part in parts) + ")"
+
+
+def _xpath_contains_any(expression, markers):
+    """Condizione XPath vera se l'espressione contiene uno dei marcatori"""
+    if not markers:
+        return "false()"
+    return " or ".join(f"contains({expression}, {_xpath_literal(m)})" for m in markers)
+
+
+def build_xpaths(rules):
+    """
+    XPath derivati dalle regole di classificazione: ritorna (ready, sold_out, available).
+    La pagina è "pronta" quando compare un marcatore di esaurito o un pulsante di acquisto
+    (solo <button>: un link "Cart" nell'header non indica che il box d'acquisto è pronto)
+    """
+    text_markers = rules.markers['text']
+    sold_out_xpath = f"//*[{_xpath_contains_any(_LOWERCASE_TEXT, text_markers['sold_out'])}]"
+    available_xpath = f"//*[{_xpath_contains_any(_LOWERCASE_TEXT, text_markers['available'])}]"
+    ready_xpath = (
+        f"{sold_out_xpath}"
+        f" | //button[{_xpath_contains_any(_LOWERCASE_STRING, rules.markers['button']['available'])}]"
+    )
+    return ready_xpath, sold_out_xpath, available_xpath
+
+
+# Modalità "lean": risorse bloccate via CDP (immagini, font, media, tracker e analytics).
+# I fogli di stile restano caricati di default: la strategia 3 usa il cursor calcolato dal CSS
+DEFAULT_BLOCKED_URL_PATTERNS = [
+    '*.png', '*.jpg', '*.jpeg', '*.gif', '*.webp', '*.avif', '*.svg', '*.ico',
+    '*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot',
+    '*.mp4', '*.webm', '*.mp3',
+    '*google-analytics.com*', '*googletagmanager.com*', '*doubleclick.net*',
+    '*facebook.net*', '*hotjar.com*', '*matomo*', '*etracker*',
+]
+STYLESHEET_URL_PATTERNS = ['*.css']
+
+# Classificazione completa in un solo execute_script (un unico round trip WebDriver).
+# Riproduce le tre strategie originali con i marcatori e la precedenza delle regole
+# condivise (classifier.py) e restituisce i tempi di ciascuna
+CLASSIFY_SCRIPT = """
+const soldOutXPath = arguments[0];
+const availableXPath = arguments[1];
+const rules = arguments[2];
+const result = {available: null, status: 'UNKNOWN', button: null, errors: [], timings: {}};
+const t0 = performance.now();
+
+// Un'unica espressione regolare per lista di marcatori (un solo passaggio sul testo)
+const escape = (marker) => marker.replace(/[.*+?^${}()|[\\]\\\\]/g, '\\\\$&');
+const compile = (markers) => markers.length ? new RegExp(markers.map(escape).join('|')) : null;
+const matches = (regex, text) => regex !== null && regex.test(text);
+const textSoldOut = compile(rules.text.sold_out);
+const textAvailable = compile(rules.text.available);
+const buttonSoldOut = compile(rules.button.sold_out);
+const buttonAvailable = compile(rules.button.available);
+let textVerdict = null;
+let buttonVerdict = null;
+
+// Strategia 1: marcatori nel sorgente della pagina
+let t = performance.now();
+const source = document.documentElement.outerHTML.toLowerCase();
+if (matches(textSoldOut, source)) {
+    textVerdict = false;
+} else if (matches(textAvailable, source)) {
+    textVerdict = true;
+}
+result.timings.page_source_ms = performance.now() - t;
+
+// Strategia 2: elementi il cui testo contiene i marcatori
+t = performance.now();
+try {
+    const first = (xpath) => document.evaluate(
+        xpath, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+    if (first(soldOutXPath)) {
+        textVerdict = false;
+    }
+    if (textVerdict === null && first(availableXPath)) {
+        textVerdict = true;
+    }
+} catch (e) {
+    result.errors.push('xpath: ' + e);
+}
+result.timings.xpath_ms = performance.now() - t;
+
+// Strategia 3: cursor, testo visibile e stato disabled dei button
+t = performance.now();
+try {
+    for (const button of document.getElementsByTagName('button')) {
+        const style = window.getComputedStyle(button);
+        // Come WebElement.text: i button non visibili hanno testo vuoto
+        const visible = button.getClientRects().length > 0 && style.visibility !== 'hidden';
+        const text = visible ? button.innerText.toLowerCase() : '';
+        const info = {text: text.trim().slice(0, 80), cursor: style.cursor, disabled: button.disabled};
+
+        if (style.cursor === 'not-allowed' || matches(buttonSoldOut, text)) {
+            buttonVerdict = false; result.button = info;
+            break;
+        } else if ((style.cursor === 'pointer' || style.cursor === 'default')
+                   && matches(buttonAvailable, text)) {
+            buttonVerdict = true; result.button = info;
+        }
+    }
+} catch (e) {
+    result.errors.push('buttons: ' + e);
+}
+result.timings.buttons_ms = performance.now() - t;
+
+// Precedenza delle regole tra testo della pagina e button
+const order = rules.precedence === 'button' ? [buttonVerdict, textVerdict] : [textVerdict, buttonVerdict];
+const verdict = order.find((v) => v !== null);
+if (verdict !== undefined) {
+    result.available = verdict;
+    result.status = verdict ? 'AVAILABLE' : 'SOLD OUT';
+}
+if (buttonVerdict === null || verdict !== buttonVerdict) {
+    result.button = null;
+}
+result.timings.total_ms = performance.now() - t0;
+return result;
+"""
+
 
 class NetcupScraperSelenium:
     def __init__(self, config_file='config.json', headless=True):
@@ -37,24 +182,37 @@ class NetcupScraperSelenium:
             self.config = json.load(f)
         
         self.log_file = self.config['log_file']
-        self.products = self.config['products']
+        self.products = load_products(self.config)
         self.check_interval = self.config['check_interval_minutes'] * 60
         self.headless = headless
         
-        # Inizializza il file di log se non esiste
-        self._init_log_file()
+        # Storico dei controlli (append-only, JSONL o SQLite)
+        self.history = history_store_from_config(self.config)
+        
+        # Regole di classificazione condivise (sezione "classifier" di config.json),
+        # più i marcatori dei button che valgono solo con il controllo del cursor
+        self.rules = rules_from_config(self.config).with_button_markers(SELENIUM_BUTTON_MARKERS)
+        self.ready_xpath, self.sold_out_xpath, self.available_xpath = build_xpaths(self.rules)
+        
+        # Pool di browser: in run_continuous resta aperto tra un ciclo e l'altro
+        selenium_config = self.config.get('selenium', {})
+        self.pool_size = selenium_config.get('pool_size', 1)
+        self.tabs_per_browser = max(1, selenium_config.get('tabs_per_browser', 1))
+        self.max_pages_per_driver = selenium_config.get('max_pages_per_driver', 50)
+        self.page_ready_timeout = selenium_config.get('page_ready_timeout_seconds', 10)
+        self._driver_path = None
+        self.pool = None
+        
+        # Profilo "lean": blocco risorse, page load strategy eager, profilo e cache su disco persistenti
+        self.lean = selenium_config.get('lean', {})
+        self._free_profile_slots = list(range(max(1, self.pool_size)))
+        self._profile_lock = threading.Lock()
+        
+        # Usato dal benchmark: somma i byte trasferiti per ogni pagina (log di performance)
+        self.collect_network_stats = False
     
-    def _init_log_file(self):
-        """Inizializza il file di log JSON"""
-        try:
-            with open(self.log_file, 'r') as f:
-                json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            with open(self.log_file, 'w') as f:
-                json.dump([], f, indent=2)
-    
-    def _create_driver(self):
-        """Crea un'istanza del WebDriver"""
+    def _create_driver(self, performance_log=False):
+        """Crea un'istanza del WebDriver (performance_log: registra il traffico di rete)"""
         chrome_options = Options()
         
         if self.headless:
@@ -65,126 +223,376 @@ class NetcupScraperSelenium:
         chrome_options.add_argument('--disable-blink-features=AutomationControlled')
         chrome_options.add_argument('--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36')
         
-        service = Service(ChromeDriverManager().install())
-        driver = webdriver.Chrome(service=service, options=chrome_options)
+        profile_slot = None
+        if self.lean.get('enabled'):
+            profile_slot = self._apply_lean_options(chrome_options)
+        
+        if self.collect_network_stats or performance_log:
+            chrome_options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+        
+        # Il driver viene cercato/scaricato una sola volta per processo
+        if self._driver_path is None:
+            self._driver_path = ChromeDriverManager().install()
+        service = Service(self._driver_path)
+        try:
+            driver = webdriver.Chrome(service=service, options=chrome_options)
+        except Exception:
+            self._release_profile_slot(profile_slot)
+            raise
+        driver.profile_slot = profile_slot
+        
+        if self.lean.get('enabled'):
+            self._apply_url_blocking(driver)
         
         return driver
     
+    def _apply_lean_options(self, chrome_options):
+        """Opzioni del profilo lean; ritorna lo slot del profilo su disco assegnato al browser"""
+        # 'eager': driver.get() ritorna a DOM pronto, senza aspettare immagini e iframe
+        chrome_options.page_load_strategy = 'eager'
+        chrome_options.add_experimental_option('prefs', {
+            'profile.managed_default_content_settings.images': 2,
+        })
+        
+        user_data_dir = self.lean.get('user_data_dir')
+        if not user_data_dir:
+            return None
+        
+        # Due Chrome non possono usare lo stesso profilo: uno per ogni browser del pool
+        with self._profile_lock:
+            slot = self._free_profile_slots.pop(0) if self._free_profile_slots else None
+        if slot is None:
+            return None
+        profile_dir = os.path.abspath(os.path.join(user_data_dir, f"browser-{slot}"))
+        chrome_options.add_argument(f'--user-data-dir={profile_dir}')
+        chrome_options.add_argument(f"--disk-cache-size={int(self.lean.get('disk_cache_mb', 200)) * 1024 * 1024}")
+        return slot
+    
+    def _release_profile_slot(self, slot):
+        """Rende di nuovo disponibile il profilo di un browser chiuso"""
+        if slot is None:
+            return
+        with self._profile_lock:
+            self._free_profile_slots.append(slot)
+    
+    def _on_driver_discarded(self, driver):
+        """Chiamato dal pool quando un browser viene chiuso"""
+        self._release_profile_slot(getattr(driver, 'profile_slot', None))
+    
+    def _apply_url_blocking(self, driver):
+        """Blocca le risorse inutili nella scheda corrente (va ripetuto per ogni nuova scheda)"""
+        patterns = list(self.lean.get('blocked_url_patterns', DEFAULT_BLOCKED_URL_PATTERNS))
+        if self.lean.get('block_stylesheets'):
+            patterns += STYLESHEET_URL_PATTERNS
+        driver.execute_cdp_cmd('Network.enable', {})
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': patterns})
+    
+    def _network_bytes(self, driver):
+        """Byte ricevuti dall'ultima lettura dei log di performance"""
+        total = 0
+        for entry in driver.get_log('performance'):
+            message = json.loads(entry['message'])['message']
+            if message.get('method') == 'Network.loadingFinished':
+                total += message['params'].get('encodedDataLength', 0)
+        return total
+    
     def check_availability(self, product, driver):
         """Controlla la disponibilità di un singolo prodotto"""
+        logger.info(f"Controllando {product['name']}...")
+        started = time.monotonic()
         try:
-            logger.info(f"Controllando {product['name']}...")
-            
             driver.get(product['url'])
+        except Exception as e:
+            return self._error_result(product, e)
+        return self._classify_loaded_page(product, driver, started)
+    
+    def _error_result(self, product, error):
+        """Risultato di un controllo fallito"""
+        logger.error(f"Errore durante il controllo di {product['name']}: {error}")
+        return {
+            'name': product['name'],
+            'url': product['url'],
+            'available': None,
+            'status': "ERROR",
+            'error': str(error),
+            'timestamp': datetime.now().isoformat()
+        }
+    
+    def _wait_until_ready(self, driver, started):
+        """
+        Aspetta che compaia il pulsante di acquisto o il marcatore di esaurito,
+        al massimo page_ready_timeout secondi dall'inizio della navigazione.
+        Ritorna (secondi impiegati, True se scaduto il timeout)
+        """
+        remaining = max(0.0, self.page_ready_timeout - (time.monotonic() - started))
+        timed_out = False
+        try:
+            WebDriverWait(driver, remaining, poll_frequency=0.1).until(
+                EC.presence_of_element_located((By.XPATH, self.ready_xpath))
+            )
+        except TimeoutException:
+            timed_out = True
+        return time.monotonic() - started, timed_out
+    
+    def _classify_loaded_page(self, product, driver, started):
+        """Classifica la pagina aperta nella scheda corrente (navigazione iniziata a 'started')"""
+        try:
+            # Aspetta l'elemento decisivo invece di una pausa fissa
+            ready_seconds, timed_out = self._wait_until_ready(driver, started)
+            if timed_out:
+                logger.warning(f"  {product['name']}: nessun elemento decisivo dopo {ready_seconds:.1f}s")
             
-            # Aspetta che la pagina si carichi
-            time.sleep(3)
-            
-            # Strategia 1: Cerca il testo "sold out" o "add to shopping cart"
-            page_source = driver.page_source.lower()
-            
-            available = None
-            status = "UNKNOWN"
-            
-            if 'sold out' in page_source or 'product is sold out' in page_source:
-                available = False
-                status = "SOLD OUT"
-            elif 'add to shopping cart' in page_source or 'add to cart' in page_source:
-                available = True
-                status = "AVAILABLE"
+            # Strategie 1-3 eseguite nel browser con un solo round trip
+            script_started = time.monotonic()
+            classification = driver.execute_script(
+                CLASSIFY_SCRIPT, self.sold_out_xpath, self.available_xpath, self.rules.to_dict()
+            )
+            roundtrip_ms = (time.monotonic() - script_started) * 1000
             
-            # Strategia 2: Cerca button specifici tramite XPath/CSS
-            try:
-                # Cerca button con testo "sold out"
-                sold_out_buttons = driver.find_elements(By.XPATH, "//*[contains(translate(text(), 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz'), 'sold out')]")
-                if sold_out_buttons:
-                    available = False
-                    status = "SOLD OUT"
-                
-                # Cerca button con testo "add to cart" o "order"
-                cart_buttons = driver.find_elements(By.XPATH, "//*[contains(translate(text(), 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz'), 'add to') or contains(translate(text(), 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz'), 'cart')]")
-                if cart_buttons and available is None:
-                    available = True
-                    status = "AVAILABLE"
-            except Exception as e:
-                logger.warning(f"Errore nella ricerca dei button: {e}")
+            for error in classification.get('errors', []):
+                logger.warning(f"Errore nella classificazione di {product['name']}: {error}")
             
-            # Strategia 3: Controlla la proprietà cursor dei button
-            try:
-                buttons = driver.find_elements(By.TAG_NAME, "button")
-                for button in buttons:
-                    cursor = button.value_of_css_property('cursor')
-                    button_text = button.text.lower()
-                    
-                    if cursor == 'not-allowed' or 'sold out' in button_text:
-                        available = False
-                        status = "SOLD OUT"
-                        break
-                    elif (cursor == 'pointer' or cursor == 'default') and ('cart' in button_text or 'order' in button_text):
-                        available = True
-                        status = "AVAILABLE"
-            except Exception as e:
-                logger.warning(f"Errore nel controllo cursor: {e}")
+            available = classification['available']
+            status = classification['status']
+            timings = {name: round(value, 2) for name, value in classification['timings'].items()}
+            timings['roundtrip_ms'] = round(roundtrip_ms, 2)
             
-            logger.info(f"  → {product['name']}: {status}")
+            logger.info(f"  → {product['name']}: {status} (pronta in {ready_seconds:.2f}s, "
+                        f"classificata in {timings['roundtrip_ms']:.1f}ms)")
             
-            return {
+            result = {
                 'name': product['name'],
                 'url': product['url'],
                 'available': available,
                 'status': status,
+                'page_ready_seconds': round(ready_seconds, 3),
+                'page_ready_timeout': timed_out,
+                'decisive_button': classification.get('button'),
+                'timings': timings,
                 'timestamp': datetime.now().isoformat()
             }
+            if self.collect_network_stats:
+                result['bytes_transferred'] = self._network_bytes(driver)
+            return result
             
         except Exception as e:
-            logger.error(f"Errore durante il controllo di {product['name']}: {e}")
-            return {
-                'name': product['name'],
-                'url': product['url'],
-                'available': None,
-                'status': "ERROR",
-                'error': str(e),
-                'timestamp': datetime.now().isoformat()
-            }
+            return self._error_result(product, e)
     
-    def save_results(self, results):
-        """Salva i risultati nel file di log"""
+    def _check_in_tabs(self, batch, driver, usage=None):
+        """
+        Apre i prodotti del batch in schede diverse dello stesso browser: la
+        navigazione parte in tutte le schede insieme, poi si classificano una per una.
+        Alla fine restano solo la scheda originale e il browser torna al pool pulito
+        """
+        original_handle = driver.current_window_handle
+        opened = []
         try:
-            # Leggi i dati esistenti
-            with open(self.log_file, 'r') as f:
-                log_data = json.load(f)
+            for product in batch:
+                logger.info(f"Controllando {product['name']} (scheda {len(opened) + 1}/{len(batch)})...")
+                started = time.monotonic()
+                try:
+                    driver.switch_to.new_window('tab')
+                    handle = driver.current_window_handle
+                    if self.lean.get('enabled'):
+                        self._apply_url_blocking(driver)
+                    # Navigazione non bloccante: driver.get() aspetterebbe il caricamento
+                    driver.execute_script("window.location.href = arguments[0];", product['url'])
+                    opened.append((product, handle, started, None))
+                except Exception as e:
+                    opened.append((product, None, started, e))
             
-            # Aggiungi i nuovi risultati
-            log_entry = {
-                'check_time': datetime.now().isoformat(),
-                'results': results
-            }
-            log_data.append(log_entry)
+            results = []
+            for product, handle, started, error in opened:
+                if error is not None:
+                    results.append(self._error_result(product, error))
+                    continue
+                try:
+                    driver.switch_to.window(handle)
+                    results.append(self._classify_loaded_page(product, driver, started))
+                except Exception as e:
+                    results.append(self._error_result(product, e))
+            return results
+        finally:
+            self._close_tabs(driver, original_handle, usage)
+    
+    def _close_tabs(self, driver, original_handle, usage=None):
+        """
+        Chiude tutte le schede tranne quella originale (anche quelle aperte da un
+        passaggio fallito a metà) e torna alla scheda originale. Se non ci riesce
+        il browser viene segnato come guasto e il pool non lo riusa
+        """
+        try:
+            for handle in driver.window_handles:
+                if handle == original_handle:
+                    continue
+                try:
+                    driver.switch_to.window(handle)
+                    driver.close()
+                except WebDriverException as e:
+                    logger.warning(f"Scheda non chiusa: {e}")
+            driver.switch_to.window(original_handle)
+            if len(driver.window_handles) > 1 and usage is not None:
+                usage['broken'] = True
+        except WebDriverException as e:
+            logger.warning(f"Schede del browser non ripristinate, browser da ricreare: {e}")
+            if usage is not None:
+                usage['broken'] = True
+    
+    def _check_batch(self, batch):
+        """Controlla un gruppo di prodotti con un browser preso dal pool"""
+        try:
+            with self.pool.driver() as (driver, usage):
+                usage['pages'] = len(batch)
+                if len(batch) == 1:
+                    return [self.check_availability(batch[0], driver)]
+                return self._check_in_tabs(batch, driver, usage)
+        except Exception as e:
+            # Browser non avviabile o andato in crash durante il batch
+            return [self._error_result(product, e) for product in batch]
+    
+    def _open_pool(self):
+        """Crea il pool di browser se non esiste già"""
+        if self.pool is None:
+            self.pool = DriverPool(
+                self._create_driver,
+                size=self.pool_size,
+                max_pages_per_driver=self.max_pages_per_driver,
+                on_discard=self._on_driver_discarded,
+            )
+        return self.pool
+    
+    def close(self):
+        """Chiude tutti i browser del pool"""
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
+    
+    def check_products(self, products):
+        """
+        Controlla i prodotti in parallelo sui browser del pool (aperto se necessario).
+        I risultati sono nello stesso ordine dei prodotti
+        """
+        if not products:
+            return []
+        self._open_pool()
+        # Prodotti divisi in batch (uno per scheda) e controllati in parallelo sui browser del pool
+        batches = [
+            products[i:i + self.tabs_per_browser]
+            for i in range(0, len(products), self.tabs_per_browser)
+        ]
+        with ThreadPoolExecutor(max_workers=max(1, min(self.pool_size, len(batches)))) as executor:
+            return [result for batch_results in executor.map(self._check_batch, batches)
+                    for result in batch_results]
+    
+    def _recorded_json_responses(self, driver):
+        """
+        Legge dai log di performance le risposte JSON delle chiamate XHR/fetch.
+        Genera (richiesta, testo della risposta)
+        """
+        requests_by_id = {}
+        json_responses = []
+        for entry in driver.get_log('performance'):
+            message = json.loads(entry['message'])['message']
+            params = message.get('params', {})
+            if message.get('method') == 'Network.requestWillBeSent':
+                requests_by_id[params['requestId']] = params['request']
+            elif message.get('method') == 'Network.responseReceived':
+                if params.get('type') in ('XHR', 'Fetch') and 'json' in params['response'].get('mimeType', ''):
+                    json_responses.append(params['requestId'])
+        
+        for request_id in json_responses:
+            request = requests_by_id.get(request_id)
+            if request is None:
+                continue
+            try:
+                # Il corpo resta disponibile finché la pagina è aperta
+                body = driver.execute_cdp_cmd('Network.getResponseBody', {'requestId': request_id})
+            except WebDriverException:
+                continue
+            text = body['body']
+            if body.get('base64Encoded'):
+                text = base64.b64decode(text).decode('utf-8', errors='replace')
+            yield request, text
+    
+    def discover_api(self, product=None, endpoint_file=DEFAULT_ENDPOINT_FILE):
+        """
+        Modalità scoperta: apre la pagina registrando il traffico di rete, cerca
+        la risposta JSON che contiene la disponibilità del prodotto e la salva
+        come modello di richiesta per api_poller.py. Ritorna l'ApiEndpoint o None
+        """
+        product = product or self.products[0]
+        logger.info(f"Scoperta dell'endpoint API da {product['name']}...")
+        
+        driver = self._create_driver(performance_log=True)
+        try:
+            started = time.monotonic()
+            driver.get(product['url'])
+            page = self._classify_loaded_page(product, driver, started)
+            # Senza uno stato certo della pagina nessuna risposta si può verificare
+            if page['status'] not in ('AVAILABLE', 'SOLD OUT'):
+                logger.warning(f"Stato della pagina {page['status']}: endpoint non verificabile, nessun salvataggio")
+                return None
             
-            # Salva tutto
-            with open(self.log_file, 'w') as f:
-                json.dump(log_data, f, indent=2)
+            candidates = []
+            for request, text in self._recorded_json_responses(driver):
+                try:
+                    details = availability_from_json(json.loads(text), product)
+                except ValueError:
+                    continue
+                if details is None:
+                    continue
+                # La risposta deve nominare il prodotto e concordare con quanto mostra la pagina
+                if details['status'] != page['status']:
+                    logger.info(f"  Scartato {request['url']}: {details['status']} invece di {page['status']}")
+                    continue
+                endpoint = ApiEndpoint.from_request(request, product)
+                # Preferiti i modelli per prodotto, poi le risposte più piccole
+                candidates.append((not endpoint.per_product, len(text), endpoint))
+        finally:
+            try:
+                driver.quit()
+            finally:
+                self._on_driver_discarded(driver)
+        
+        for _, size, endpoint in sorted(candidates, key=lambda c: c[:2]):
+            # Verifica: l'endpoint deve rispondere anche senza browser (niente cookie)
+            try:
+                details = availability_from_json(endpoint.fetch(product), product)
+            except (requests.RequestException, ValueError) as e:
+                logger.info(f"  Scartato {endpoint.url_template}: non riproducibile senza browser ({e})")
+                continue
+            if details is None or details['status'] != page['status']:
+                logger.info(f"  Scartato {endpoint.url_template}: risposta diversa senza browser")
+                continue
             
+            endpoint.save(endpoint_file)
+            logger.info(f"Endpoint trovato ({size} byte): {endpoint.method} {endpoint.url_template}")
+            logger.info(f"Salvato in {endpoint_file}: avvia il polling con python api_poller.py")
+            return endpoint
+        
+        logger.warning("Nessuna risposta JSON con la disponibilità del prodotto: resta il controllo delle pagine")
+        return None
+    
+    def save_results(self, results):
+        """Salva i risultati nello storico (una sola scrittura in append)"""
+        try:
+            self.history.append(results)
             logger.info(f"Risultati salvati in {self.log_file}")
             
         except Exception as e:
             logger.error(f"Errore nel salvare i risultati: {e}")
     
-    def run_check(self):
-        """Esegue un singolo ciclo di controllo per tutti i prodotti"""
+    def run_check(self, keep_browsers=False):
+        """
+        Esegue un singolo ciclo di controllo per tutti i prodotti.
+        Con keep_browsers=True i browser restano aperti per il ciclo successivo
+        """
         logger.info("=" * 60)
         logger.info(f"Inizio controllo disponibilità - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
         logger.info("=" * 60)
         
-        driver = None
         try:
-            driver = self._create_driver()
-            results = []
-            
-            for product in self.products:
-                result = self.check_availability(product, driver)
-                results.append(result)
-                time.sleep(2)  # Pausa tra le richieste
+            results = self.check_products(self.products)
             
             self.save_results(results)
             
@@ -199,8 +607,8 @@ class NetcupScraperSelenium:
             return results
             
         finally:
-            if driver:
-                driver.quit()
+            if not keep_browsers:
+                self.close()
     
     def run_continuous(self):
         """Esegue controlli continui ogni intervallo specificato"""
@@ -209,11 +617,13 @@ class NetcupScraperSelenium:
         
         try:
             while True:
-                self.run_check()
+                self.run_check(keep_browsers=True)
                 logger.info(f"Prossimo controllo tra {self.config['check_interval_minutes']} minuti...\n")
                 time.sleep(self.check_interval)
         except KeyboardInterrupt:
             logger.info("\nMonitoraggio interrotto dall'utente")
+        finally:
+            self.close()
 
 
 def main():
@@ -225,14 +635,17 @@ def main():
     print("=" * 50)
     print("1. Controllo singolo")
     print("2. Monitoraggio continuo (ogni ora)")
+    print("3. Scoperta endpoint API (per il polling con api_poller.py)")
     print("=" * 50)
     
-    choice = input("\nScegli un'opzione (1 o 2): ").strip()
+    choice = input("\nScegli un'opzione (1, 2 o 3): ").strip()
     
     if choice == "1":
         scraper.run_check()
     elif choice == "2":
         scraper.run_continuous()
+    elif choice == "3":
+        scraper.discover_api()
     else:
         print("Opzione non valida. Eseguo un controllo singolo.")
         scraper.run_check()
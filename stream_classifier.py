@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Classificatore in streaming per le pagine prodotto
+Analizza l'HTML a eventi (parser lxml con target) senza costruire il DOM né
+materializzare tutto il testo, e smette di elaborare appena trova un marcatore
+decisivo.
+
+Riproduce esattamente le regole di BeautifulSoup(html, 'lxml').get_text() e
+find_all('button') usate dagli scraper:
+- il testo dentro script/style/template/rt/rp viene ignorato
+- i nodi di soli spazi ASCII valgono ' ' (o '\\n'), tranne dentro pre/textarea
+- i marcatori possono attraversare più nodi di testo (get_text() li concatena)
+
+Marcatori e precedenza vengono dalle regole condivise (classifier.py)
+"""
+
+from lxml import etree
+
+from classifier import AVAILABLE, DEFAULT_CLASSIFIER_RULES, SOLD_OUT, VERDICTS
+
+# Stessi insiemi usati da BeautifulSoup per l'HTML
+_EXCLUDED_TEXT_TAGS = frozenset(('script', 'style', 'template', 'rt', 'rp'))
+_PRESERVE_WHITESPACE_TAGS = frozenset(('pre', 'textarea'))
+_ASCII_SPACES = frozenset('\x20\x0a\x09\x0c\x0d')
+
+
+class _MarkerTarget:
+    """Target del parser lxml: riceve gli eventi e cerca i marcatori"""
+
+    def __init__(self, rules):
+        self.rules = rules
+        self._tail_length = max(0, rules.text.max_length - 1)
+        self.decided = False
+        self.text_sold_out = False
+        self.text_available = False
+        self.button_verdict = None
+        self._tail = ''
+        self._pending = []
+        self._excluded_depth = 0
+        self._preserve_depth = 0
+        self._button_depth = 0
+        self._button_text = []
+
+    # --- Eventi del parser ---
+
+    def start(self, tag, attrib):
+        if self.decided:
+            return
+        self._flush()
+        if tag in _EXCLUDED_TEXT_TAGS:
+            self._excluded_depth += 1
+        if tag in _PRESERVE_WHITESPACE_TAGS:
+            self._preserve_depth += 1
+        if tag == 'button':
+            self._button_depth += 1
+
+    def end(self, tag):
+        if self.decided:
+            return
+        self._flush()
+        if tag in _EXCLUDED_TEXT_TAGS:
+            self._excluded_depth -= 1
+        if tag in _PRESERVE_WHITESPACE_TAGS:
+            self._preserve_depth -= 1
+        if tag == 'button':
+            self._button_depth -= 1
+            # Il testo del button più esterno contiene quello dei button annidati,
+            # e find_all() lo restituisce per primo: basta valutare quello
+            if self._button_depth == 0:
+                self._end_button()
+
+    def data(self, data):
+        if not self.decided:
+            self._pending.append(data)
+
+    def comment(self, text):
+        # BeautifulSoup chiude il nodo di testo corrente prima di un commento
+        if not self.decided:
+            self._flush()
+
+    def close(self):
+        if not self.decided:
+            self._flush()
+
+    # --- Logica di classificazione ---
+
+    def _flush(self):
+        """Chiude il nodo di testo corrente (come BeautifulSoup.endData)"""
+        if not self._pending:
+            return
+        text = ''.join(self._pending)
+        self._pending = []
+
+        if not self._preserve_depth and all(c in _ASCII_SPACES for c in text):
+            text = '\n' if '\n' in text else ' '
+        if self._excluded_depth:
+            return
+
+        lowered = text.lower()
+        if self._button_depth:
+            self._button_text.append(lowered)
+
+        # La coda del testo precedente permette di trovare i marcatori a cavallo tra nodi
+        window = self._tail + lowered
+        found = self.rules.text.scan(window)
+        if SOLD_OUT in found:
+            self.text_sold_out = True
+            if self.rules.precedence == 'text':
+                # Nel testo "sold out" prevale su tutto
+                self.decided = True
+                return
+        if AVAILABLE in found:
+            self.text_available = True
+        self._tail = window[-self._tail_length:] if self._tail_length else ''
+
+    def _end_button(self):
+        button_text = ''.join(self._button_text)
+        self._button_text = []
+        if self.button_verdict is not None:
+            return
+
+        self.button_verdict = self.rules.button.verdict(button_text)
+        if self.button_verdict is None:
+            return
+
+        if self.rules.precedence == 'button':
+            # Il primo button decisivo prevale sul testo della pagina
+            self.decided = True
+
+    def result(self):
+        """Applica la precedenza delle regole"""
+        if self.text_sold_out:
+            text_verdict = VERDICTS[SOLD_OUT]
+        elif self.text_available:
+            text_verdict = VERDICTS[AVAILABLE]
+        else:
+            text_verdict = None
+        return self.rules.combine(text_verdict, self.button_verdict)
+
+
+def classify_html(html, rules=None):
+    """Classifica una pagina prodotto con le regole date: ritorna (available, status)"""
+    target = _MarkerTarget(rules or DEFAULT_CLASSIFIER_RULES)
+    parser = etree.HTMLParser(target=target, strip_cdata=False, recover=True)
+    try:
+        # Un solo feed() come fa BeautifulSoup: il push parser di libxml2 genera
+        # eventi diversi se lo stesso documento viene spezzato in più blocchi.
+        # Non si interrompe libxml2 con un'eccezione (con alcuni commenti resta
+        # in loop): dopo la decisione i callback ritornano subito e il resto
+        # del documento viene solo tokenizzato in C
+        parser.feed(html)
+        parser.close()
+    except etree.LxmlError:
+        # Documento vuoto o illeggibile: vale quanto visto finora
+        pass
+
+    return target.result()
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+Estrazione della disponibilità dai dati strutturati della pagina
+Cerca con un'espressione regolare i payload JSON incorporati (JSON-LD schema.org,
+__NEXT_DATA__ di Next.js, __NUXT_DATA__ di Nuxt 3) e legge disponibilità,
+prezzo e scorte direttamente dal JSON, senza DOM e senza browser.
+Se nessun payload è conclusivo gli scraper usano le euristiche sul testo.
+La stessa analisi vale per le risposte JSON delle API (availability_from_json)
+"""
+
+import json
+import re
+from urllib.parse import urlparse
+
+from classifier import AVAILABLE, SOLD_OUT, VERDICTS
+
+# Solo i tag <script> che contengono un payload: gli altri non vengono letti
+_PAYLOAD_SCRIPT = re.compile(
+    r'<script\b(?=[^>]*(?:application/ld\+json|__NEXT_DATA__|__NUXT_DATA__))([^>]*)>(.*?)</script\s*>',
+    re.IGNORECASE | re.DOTALL,
+)
+
+# Ordine di preferenza delle sorgenti
+SOURCES = ('json-ld', 'next-data', 'nuxt-data')
+
+# Nomi dei campi confrontati in minuscolo e senza '_' (inStock, in_stock, isInStock...)
+_AVAILABLE_FLAGS = frozenset(('available', 'isavailable', 'instock', 'isinstock',
+                              'orderable', 'isorderable', 'purchasable', 'ispurchasable'))
+_SOLD_OUT_FLAGS = frozenset(('soldout', 'issoldout', 'outofstock', 'isoutofstock'))
+_AVAILABILITY_FIELDS = frozenset(('availability', 'availabilitystatus', 'stockstatus'))
+_STOCK_FIELDS = frozenset(('stock', 'stocklevel', 'stockquantity', 'inventorylevel', 'availablequantity'))
+_PRICE_FIELDS = ('price', 'lowprice', 'priceamount')
+_CURRENCY_FIELDS = ('pricecurrency', 'currency', 'currencycode')
+
+# Valori di availability (schema.org o testuali), senza prefisso URL e punteggiatura
+_AVAILABLE_VALUES = frozenset(('instock', 'limitedavailability', 'onlineonly', 'instoreonly',
+                               'preorder', 'presale', 'backorder', 'available'))
+_SOLD_OUT_VALUES = frozenset(('outofstock', 'soldout', 'discontinued', 'unavailable', 'notavailable'))
+
+# Tipi schema.org che, al primo livello del JSON-LD, descrivono il prodotto della pagina
+_MAIN_ENTITY_TYPES = frozenset(('product', 'individualproduct', 'productmodel', 'offer', 'aggregateoffer'))
+
+# Limite ai nodi visitati in un payload (protezione da payload enormi)
+MAX_NODES = 200000
+
+# Indici speciali del formato devalue usato da Nuxt 3
+_DEVALUE_CONSTANTS = {-1: None, -2: None, -3: float('nan'), -4: float('inf'), -5: float('-inf'), -6: -0.0}
+_DEVALUE_WRAPPERS = frozenset(('Reactive', 'ShallowReactive', 'Ref', 'ShallowRef', 'NuxtError', 'Island', 'Object'))
+
+
+def _normalize_key(key):
+    return key.replace('_', '').replace('-', '').lower() if isinstance(key, str) else ''
+
+
+def _availability_value(value):
+    """Interpreta un valore di availability: True, False o None se sconosciuto"""
+    if isinstance(value, bool):
+        return value
+    if not isinstance(value, str):
+        return None
+    # "https://schema.org/InStock" → "instock"
+    token = re.sub(r'[^a-z]', '', value.rstrip('/').rsplit('/', 1)[-1].lower())
+    if token in _AVAILABLE_VALUES:
+        return True
+    if token in _SOLD_OUT_VALUES:
+        return False
+    return None
+
+
+def _number(value):
+    """Numero da un valore JSON (anche stringa "5,26" o oggetto {"value": ...})"""
+    if isinstance(value, dict):
+        value = value.get('value', value.get('amount'))
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return value
+    try:
+        return float(str(value).replace(',', '.'))
+    except ValueError:
+        return None
+
+
+def _offer_fields(node):
+    """
+    Legge disponibilità, prezzo, valuta e scorte da un oggetto JSON.
+    Ritorna None se l'oggetto non dice nulla sulla disponibilità
+    """
+    available = None
+    stock = None
+    fields = {_normalize_key(key): value for key, value in node.items()}
+
+    for key, value in fields.items():
+        if key in _STOCK_FIELDS:
+            stock = _number(value)
+        elif available is not None:
+            continue
+        elif key in _AVAILABILITY_FIELDS:
+            available = _availability_value(value)
+        elif key in _AVAILABLE_FLAGS and isinstance(value, bool):
+            available = value
+        elif key in _SOLD_OUT_FLAGS and isinstance(value, bool):
+            available = not value
+
+    if available is None and stock is None:
+        return None
+    if available is None:
+        available = stock > 0
+
+    details = {'available': available}
+    if stock is not None:
+        details['stock'] = stock
+
+    for key in _PRICE_FIELDS:
+        price = fields.get(key)
+        if isinstance(price, dict):
+            # Es. {"price": {"amount": 5.26, "currency": "EUR"}}
+            currency = price.get('currency') or price.get('currencyCode')
+            if currency:
+                details['currency'] = currency
+        if _number(price) is not None:
+            details['price'] = _number(price)
+            break
+    for key in _CURRENCY_FIELDS:
+        if isinstance(fields.get(key), str):
+            details['currency'] = fields[key]
+            break
+    return details
+
+
+def _mentions_product(node, product_keys):
+    """True se uno dei valori stringa dell'oggetto contiene slug o nome del prodotto"""
+    for value in node.values():
+        if isinstance(value, str):
+            lowered = value.lower()
+            if any(key in lowered for key in product_keys):
+                return True
+    return False
+
+
+def _main_entities(payload):
+    """
+    Id degli oggetti Product/Offer di primo livello di un JSON-LD (anche in @graph)
+    e delle loro offerte: descrivono il prodotto della pagina anche senza nominarlo
+    """
+    roots = payload if isinstance(payload, list) else [payload]
+    nodes = []
+    for root in roots:
+        if isinstance(root, dict):
+            nodes.append(root)
+            if isinstance(root.get('@graph'), list):
+                nodes.extend(root['@graph'])
+
+    stack = []
+    for node in nodes:
+        if not isinstance(node, dict):
+            continue
+        types = node.get('@type')
+        types = types if isinstance(types, list) else [types]
+        if any(isinstance(t, str) and t.rsplit('/', 1)[-1].lower() in _MAIN_ENTITY_TYPES for t in types):
+            stack.append(node)
+
+    trusted = set()
+    while stack:
+        node = stack.pop()
+        if not isinstance(node, dict) or id(node) in trusted:
+            continue
+        trusted.add(id(node))
+        # Product → offers → AggregateOffer → offers: restano del prodotto della pagina
+        offers = node.get('offers')
+        stack.extend(offers if isinstance(offers, list) else [offers])
+    return trusted
+
+
+def _find_offers(payload, product_keys, trusted=frozenset()):
+    """
+    Visita il JSON e raccoglie gli oggetti con informazioni di disponibilità.
+    trusted: id degli oggetti che valgono per il prodotto anche senza nominarlo
+    """
+    candidates = []
+    # Ogni elemento: (nodo, oggetti antenati più vicini)
+    stack = [(payload, ())]
+    # I payload devalue possono contenere riferimenti circolari
+    seen = set()
+    while stack and len(seen) < MAX_NODES:
+        node, ancestors = stack.pop()
+        if id(node) in seen:
+            continue
+        seen.add(id(node))
+        if isinstance(node, dict):
+            details = _offer_fields(node)
+            if details is not None:
+                # Il prodotto può essere nominato nell'offerta o nell'oggetto che la contiene
+                details['_matches'] = id(node) in trusted or (bool(product_keys) and any(
+                    _mentions_product(owner, product_keys) for owner in (node,) + ancestors
+                ))
+                candidates.append(details)
+            children = node.values()
+            ancestors = (node,) + ancestors[:1]
+        elif isinstance(node, list):
+            children = node
+        else:
+            continue
+        for child in reversed(list(children)):
+            if isinstance(child, (dict, list)):
+                stack.append((child, ancestors))
+    return candidates
+
+
+def _choose(candidates):
+    """
+    Sceglie l'offerta del prodotto tra quelle che lo nominano (o che descrivono la pagina):
+    un flag "available" qualsiasi (lingue, altri prodotti) non decide lo stato.
+    Se le offerte rimaste non concordano il payload non è conclusivo
+    """
+    chosen = [c for c in candidates if c['_matches']]
+    if not chosen:
+        return None
+    if len({c['available'] for c in chosen}) > 1:
+        return None
+    # A parità di esito, la prima offerta con il prezzo è la più informativa
+    best = next((c for c in chosen if 'price' in c), chosen[0])
+    return {key: value for key, value in best.items() if key != '_matches'}
+
+
+def _devalue_unflatten(values):
+    """Ricostruisce un payload Nuxt 3 (formato devalue: array piatto con riferimenti per indice)"""
+    hydrated = {}
+
+    def hydrate(index):
+        if index in _DEVALUE_CONSTANTS:
+            return _DEVALUE_CONSTANTS[index]
+        if index in hydrated:
+            return hydrated[index]
+        value = values[index]
+        if isinstance(value, list) and value and isinstance(value[0], str):
+            kind = value[0]
+            if kind in _DEVALUE_WRAPPERS:
+                result = hydrate(value[1])
+            elif kind == 'Set':
+                result = hydrated[index] = []
+                result.extend(hydrate(i) for i in value[1:])
+            elif kind in ('Map', 'null'):
+                result = hydrated[index] = {}
+                for i in range(1, len(value) - 1, 2):
+                    key = value[i] if kind == 'null' else hydrate(value[i])
+                    result[str(key)] = hydrate(value[i + 1])
+            elif kind in ('Date', 'BigInt', 'RegExp'):
+                result = value[1]
+            else:
+                result = None
+        elif isinstance(value, list):
+            result = hydrated[index] = []
+            result.extend(hydrate(i) for i in value)
+        elif isinstance(value, dict):
+            result = hydrated[index] = {}
+            for key, i in value.items():
+                result[key] = hydrate(i)
+        else:
+            result = value
+        hydrated[index] = result
+        return result
+
+    return hydrate(0)
+
+
+def _payloads(html):
+    """Genera (sorgente, JSON) per ogni payload incorporato nella pagina"""
+    for match in _PAYLOAD_SCRIPT.finditer(html):
+        attributes, body = match.group(1), match.group(2).strip()
+        if 'ld+json' in attributes.lower():
+            source = 'json-ld'
+        elif '__NEXT_DATA__' in attributes:
+            source = 'next-data'
+        else:
+            source = 'nuxt-data'
+        try:
+            payload = json.loads(body)
+            if source == 'nuxt-data':
+                payload = _devalue_unflatten(payload)
+        except (ValueError, IndexError, TypeError, KeyError, RecursionError):
+            continue
+        yield source, payload
+
+
+def _product_keys(product):
+    """Slug dell'URL e nome del prodotto, usati per riconoscerne l'offerta"""
+    if not product:
+        return ()
+    keys = []
+    slug = urlparse(product.get('url', '')).path.rstrip('/').rsplit('/', 1)[-1]
+    if slug:
+        keys.append(slug.lower())
+    if product.get('name'):
+        keys.append(product['name'].lower())
+    return tuple(keys)
+
+
+def _finalize(details, source):
+    details['status'] = VERDICTS[AVAILABLE if details['available'] else SOLD_OUT][1]
+    details['source'] = source
+    return details
+
+
+def availability_from_json(payload, product=None, source='api'):
+    """
+    Disponibilità da un documento JSON già decodificato (es. risposta di un'API).
+    Contano solo gli oggetti che nominano il prodotto: una risposta che non lo nomina
+    (o senza product) non è conclusiva. Stesso formato di extract_availability; None
+    se il JSON non è conclusivo
+    """
+    details = _choose(_find_offers(payload, _product_keys(product)))
+    return _finalize(details, source) if details is not None else None
+
+
+def extract_availability(html, product=None):
+    """
+    Estrae la disponibilità dai dati strutturati della pagina.
+    Ritorna un dizionario con available, status, source e, se presenti, price,
+    currency e stock; None se la pagina non contiene un payload conclusivo
+    """
+    product_keys = _product_keys(product)
+    found = {}
+    for source, payload in _payloads(html):
+        trusted = _main_entities(payload) if source == 'json-ld' else frozenset()
+        found.setdefault(source, []).extend(_find_offers(payload, product_keys, trusted))
+
+    for source in SOURCES:
+        details = _choose(found.get(source, []))
+        if details is not None:
+            return _finalize(details, source)
+    return None
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Iscritti alle notifiche Telegram e invio in parallelo
+Ogni chat può iscriversi a tutti i prodotti o solo ad alcuni (/subscribe).
+Da un solo controllo (un solo diff) si calcola il messaggio di ogni iscritto;
+i messaggi partono in parallelo sulla sessione HTTP condivisa, rispettando i
+limiti di Telegram con un token bucket globale e uno per chat
+"""
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+DEFAULT_SUBSCRIBERS_FILE = 'subscribers.json'
+
+# Limiti di Telegram: circa 30 messaggi al secondo in totale, 1 al secondo per chat
+# (brevi raffiche tollerate)
+GLOBAL_RATE = 30
+PER_CHAT_RATE = 1
+PER_CHAT_BURST = 3
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity=None, clock=time.monotonic, sleep=time.sleep):
+        """rate: gettoni al secondo; capacity: raffica massima (default: rate)"""
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self.tokens = self.capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.updated = clock()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """
+        Prenota un gettone e ritorna i secondi da attendere prima di usarlo.
+        Le prenotazioni si accodano: chi arriva dopo aspetta di più
+        """
+        with self._lock:
+            now = self.clock()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return max(0.0, -self.tokens / self.rate)
+
+    def acquire(self):
+        """Attende il proprio turno (subito se il bucket non è vuoto)"""
+        wait = self.reserve()
+        if wait > 0:
+            self.sleep(wait)
+
+
+class SubscriberRegistry:
+    def __init__(self, path=DEFAULT_SUBSCRIBERS_FILE, products=(), owner_chat_id=None):
+        """
+        products: prodotti monitorati (per risolvere i filtri di /subscribe).
+        owner_chat_id: chat configurata (TELEGRAM_CHAT_ID), iscritta a tutto finché
+        non sceglie dei filtri
+        """
+        self.path = path
+        self.products = list(products)
+        self.owner = str(owner_chat_id) if owner_chat_id else None
+        self.subscribers = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def save(self):
+        """Salva gli iscritti (scrittura atomica)"""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.subscribers, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def _entry(self, chat_id):
+        """Iscrizione della chat: products None = tutti i prodotti, [] = nessuno"""
+        chat_id = str(chat_id)
+        entry = self.subscribers.get(chat_id)
+        if entry is None and chat_id == self.owner:
+            return {'products': None}
+        return entry
+
+    def is_subscribed(self, chat_id):
+        return self._entry(chat_id) is not None
+
+    def chats(self):
+        """Chat iscritte, la chat configurata per prima"""
+        chats = [self.owner] if self.owner else []
+        return chats + [chat_id for chat_id in self.subscribers if chat_id != self.owner]
+
+    def match_products(self, query):
+        """
+        Nomi dei prodotti indicati nel testo del comando: ogni parola seleziona
+        i prodotti che la contengono (es. "1000 2000")
+        """
+        tokens = query.lower().split()
+        return [p['name'] for p in self.products if any(token in p['name'].lower() for token in tokens)]
+
+    def products_for(self, chat_id):
+        """Nomi dei prodotti seguiti dalla chat"""
+        entry = self._entry(chat_id)
+        if entry is None:
+            return []
+        if entry['products'] is None:
+            return [p['name'] for p in self.products]
+        return list(entry['products'])
+
+    def wants(self, chat_id, name):
+        entry = self._entry(chat_id)
+        return entry is not None and (entry['products'] is None or name in entry['products'])
+
+    def subscribe(self, chat_id, names=None):
+        """Iscrive la chat a tutti i prodotti (names=None) o aggiunge quelli indicati al suo filtro"""
+        entry = self._entry(chat_id)
+        if names is None or entry is None or entry['products'] is None:
+            products = None if names is None else list(names)
+        else:
+            products = entry['products'] + [name for name in names if name not in entry['products']]
+        self.subscribers[str(chat_id)] = {
+            'products': products,
+            'since': (entry or {}).get('since') or datetime.now().isoformat(),
+        }
+
+    def unsubscribe(self, chat_id, names=None):
+        """Toglie i prodotti indicati dal filtro della chat, o la disiscrive del tutto (names=None)"""
+        chat_id = str(chat_id)
+        remaining = [] if names is None else [n for n in self.products_for(chat_id) if n not in names]
+        if remaining or chat_id == self.owner:
+            # La chat configurata resta registrata (anche senza prodotti) per non tornare a "tutti"
+            entry = self._entry(chat_id) or {}
+            self.subscribers[chat_id] = {'products': remaining, 'since': entry.get('since')}
+        else:
+            self.subscribers.pop(chat_id, None)
+
+    def split(self, items, key=lambda item: item['name']):
+        """
+        Divide gli elementi di un solo diff tra gli iscritti.
+        Ritorna chat → elementi dei prodotti che segue (le chat senza elementi sono escluse)
+        """
+        per_chat = {}
+        for chat_id in self.chats():
+            wanted = [item for item in items if self.wants(chat_id, key(item))]
+            if wanted:
+                per_chat[chat_id] = wanted
+        return per_chat
+
+
+class Notifier:
+    def __init__(self, send_fn, global_rate=GLOBAL_RATE, per_chat_rate=PER_CHAT_RATE,
+                 per_chat_burst=PER_CHAT_BURST, max_workers=8):
+        """send_fn(message, chat_id=...) → True se consegnato (es. send_telegram_message)"""
+        self.send_fn = send_fn
+        self.global_bucket = TokenBucket(global_rate)
+        self.per_chat_rate = per_chat_rate
+        self.per_chat_burst = per_chat_burst
+        self.max_workers = max(1, int(max_workers))
+        self._chat_buckets = {}
+        self._lock = threading.Lock()
+
+    def _chat_bucket(self, chat_id):
+        with self._lock:
+            if chat_id not in self._chat_buckets:
+                self._chat_buckets[chat_id] = TokenBucket(self.per_chat_rate, self.per_chat_burst)
+            return self._chat_buckets[chat_id]
+
+    def _deliver(self, chat_id, messages):
+        """Invia i messaggi di una chat nell'ordine dato; ritorna quanti sono stati consegnati"""
+        delivered = 0
+        for message in messages:
+            self._chat_bucket(chat_id).acquire()
+            self.global_bucket.acquire()
+            if self.send_fn(message, chat_id=chat_id):
+                delivered += 1
+        return delivered
+
+    def send(self, messages):
+        """
+        Invia in parallelo: messages è un dizionario chat → lista di messaggi.
+        Le chat procedono in parallelo, i messaggi della stessa chat in ordine.
+        Ritorna il numero di messaggi consegnati
+        """
+        if not messages:
+            return 0
+        workers = min(self.max_workers, len(messages))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return sum(executor.map(lambda item: self._deliver(*item), messages.items()))
+
+
+def registry_from_config(config, products, owner_chat_id=None):
+    """Registro degli iscritti dalla sezione "telegram" della configurazione"""
+    path = config.get('telegram', {}).get('subscribers_file', DEFAULT_SUBSCRIBERS_FILE)
+    return SubscriberRegistry(path, products, owner_chat_id)
+
+
+def notifier_from_config(config, send_fn):
+    """Notifier con i limiti della sezione "telegram" della configurazione"""
+    telegram_config = config.get('telegram', {})
+    return Notifier(
+        send_fn,
+        global_rate=telegram_config.get('global_rate_per_second', GLOBAL_RATE),
+        per_chat_rate=telegram_config.get('per_chat_rate_per_second', PER_CHAT_RATE),
+    )
@@ -4,18 +4,52 @@ Bot Telegram Command Handler
 Controlla se l'utente ha inviato comandi e li processa
 """
 
-import requests
 import json
 import os
 import sys
 from datetime import datetime
 
+from catalog_discovery import load_products
+from history_store import open_history_store
+from http_session import get_session
+from metrics import record_telegram, stage
+from recent_results import DEFAULT_CHECK_TTL, RecentResults
+from subscribers import registry_from_config
+
 TELEGRAM_BOT_TOKEN = os.environ.get('TELEGRAM_BOT_TOKEN')
 TELEGRAM_CHAT_ID = os.environ.get('TELEGRAM_CHAT_ID')
 
 # File per salvare l'ultimo update_id processato
 LAST_UPDATE_FILE = 'last_update_id.txt'
 
+# Update massimi restituiti da una chiamata a getUpdates e lunghezza massima di un messaggio
+UPDATES_PAGE_LIMIT = 100
+MAX_MESSAGE_LENGTH = 4096
+
+# Storico di scraper_github_actions.py (ripristinato con actions/cache prima dei comandi):
+# un /check con risultati più giovani del TTL riceve subito quelli, senza nuovo scraping
+CONFIG_FILE = 'config.json'
+HISTORY_FILE = 'availability_history.db'
+
+# Chat che hanno chiesto /check: scraper_github_actions.py manda il risultato a loro
+CHECK_REQUESTS_FILE = 'check_requests.json'
+
+# Comandi accettati anche da chi non è ancora iscritto
+PUBLIC_COMMANDS = ('/start', '/help', '/subscribe')
+
+HELP_MESSAGE = """
+🤖 <b>Comandi disponibili:</b>
+
+/check - Controlla subito la disponibilità dei VPS
+/help - Mostra questo messaggio
+/status - Mostra lo stato del monitoraggio
+/subscribe [prodotti] - Ricevi le notifiche (di tutti i prodotti o solo di quelli indicati, es. /subscribe 1000 2000)
+/unsubscribe [prodotti] - Smetti di ricevere le notifiche (di tutti o dei prodotti indicati)
+/subscriptions - Mostra i prodotti che segui
+
+Il bot controlla automaticamente ogni ora e ti notifica quando cambia qualcosa!
+"""
+
 
 def get_last_update_id():
     """Legge l'ultimo update_id processato"""
@@ -27,50 +61,61 @@ def get_last_update_id():
 
 
 def save_last_update_id(update_id):
-    """Salva l'ultimo update_id processato"""
-    with open(LAST_UPDATE_FILE, 'w') as f:
+    """Salva l'ultimo update_id processato (scrittura atomica)"""
+    tmp_file = f"{LAST_UPDATE_FILE}.tmp"
+    with open(tmp_file, 'w') as f:
         f.write(str(update_id))
+    os.replace(tmp_file, LAST_UPDATE_FILE)
 
 
-def send_telegram_message(message, parse_mode='HTML'):
-    """Invia un messaggio su Telegram"""
-    if not TELEGRAM_BOT_TOKEN or not TELEGRAM_CHAT_ID:
+def send_telegram_message(message, parse_mode='HTML', chat_id=None):
+    """Invia un messaggio su Telegram (di default alla chat configurata)"""
+    chat_id = chat_id or TELEGRAM_CHAT_ID
+    if not TELEGRAM_BOT_TOKEN or not chat_id:
         print("⚠️ Token Telegram o Chat ID non configurati")
         return False
     
     url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
     payload = {
-        'chat_id': TELEGRAM_CHAT_ID,
+        'chat_id': chat_id,
         'text': message,
         'parse_mode': parse_mode,
         'disable_web_page_preview': True
     }
     
     try:
-        response = requests.post(url, json=payload, timeout=10)
+        with stage('telegram_send'):
+            response = get_session().post(url, json=payload, timeout=10)
         response.raise_for_status()
+        record_telegram(True)
         return True
     except Exception as e:
         print(f"❌ Errore nell'invio del messaggio Telegram: {e}")
+        record_telegram(False)
         return False
 
 
-def get_new_messages():
-    """Recupera i nuovi messaggi da Telegram"""
+def get_new_messages(last_update_id=None, timeout=10, limit=UPDATES_PAGE_LIMIT):
+    """
+    Recupera i nuovi messaggi da Telegram (long polling fino a timeout secondi).
+    Ritorna None in caso di errore, così chi fa polling continuo può aspettare
+    """
     if not TELEGRAM_BOT_TOKEN:
         print("⚠️ Token Telegram non configurato")
         return []
     
-    last_update_id = get_last_update_id()
+    if last_update_id is None:
+        last_update_id = get_last_update_id()
     url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/getUpdates"
     
     params = {
         'offset': last_update_id + 1,
-        'timeout': 10
+        'timeout': timeout,
+        'limit': limit
     }
     
     try:
-        response = requests.get(url, params=params, timeout=15)
+        response = get_session().get(url, params=params, timeout=timeout + 5)
         response.raise_for_status()
         data = response.json()
         
@@ -79,65 +124,82 @@ def get_new_messages():
         return []
     except Exception as e:
         print(f"❌ Errore nel recupero dei messaggi: {e}")
-        return []
+        return None
 
 
-def process_commands():
-    """Processa i comandi ricevuti"""
-    messages = get_new_messages()
-    
-    if not messages:
-        print("ℹ️ Nessun nuovo messaggio")
-        return False
-    
-    print(f"📬 Trovati {len(messages)} nuovi messaggi")
-    
-    check_requested = False
-    last_update_id = get_last_update_id()
-    
-    for update in messages:
-        update_id = update['update_id']
-        
-        # Aggiorna l'ultimo update_id
-        if update_id > last_update_id:
-            last_update_id = update_id
-        
-        # Controlla se è un messaggio
-        if 'message' not in update:
-            continue
-        
-        message = update['message']
-        
-        # Verifica che sia dal chat_id corretto
-        if str(message['chat']['id']) != str(TELEGRAM_CHAT_ID):
-            print(f"⚠️ Messaggio ignorato da chat_id diverso: {message['chat']['id']}")
+def drain_updates(last_update_id):
+    """
+    Scarica tutto l'arretrato pagina per pagina, senza long polling.
+    Dopo un errore ritorna le pagine già lette: il resto arriva alla prossima esecuzione
+    """
+    updates = []
+    while True:
+        page = get_new_messages(last_update_id, timeout=0)
+        if not page:
+            break
+        updates.extend(page)
+        last_update_id = max(update['update_id'] for update in page)
+        if len(page) < UPDATES_PAGE_LIMIT:
+            break
+    return updates
+
+
+def parse_command(text):
+    """Separa comando e argomenti ("/subscribe@bot 1000" → ("/subscribe", "1000"))"""
+    command, _, args = text.strip().partition(' ')
+    return command.split('@', 1)[0].lower(), args.strip()
+
+
+def is_authorized(chat_id, command, registry=None):
+    """True se la chat può usare il comando: la chat configurata e gli iscritti usano tutto"""
+    if str(chat_id) == str(TELEGRAM_CHAT_ID) or command in PUBLIC_COMMANDS:
+        return True
+    return registry is not None and registry.is_subscribed(chat_id)
+
+
+def group_commands(updates, last_update_id=0):
+    """
+    Raggruppa i comandi per chat, senza ripetizioni e nell'ordine del primo invio.
+    Ritorna (dizionario chat_id → lista di comandi, ultimo update_id visto)
+    """
+    commands = {}
+    for update in updates:
+        last_update_id = max(last_update_id, update['update_id'])
+        message = update.get('message')
+        if not message:
             continue
         
-        # Estrai il testo del messaggio
+        chat_id = message['chat']['id']
         text = message.get('text', '').strip().lower()
-        
-        print(f"💬 Messaggio ricevuto: '{text}'")
-        
-        # Processa i comandi
-        if text == '/check':
-            print("✅ Comando /check ricevuto!")
-            check_requested = True
-            send_telegram_message("🔍 Controllo disponibilità in corso...\nRiceverai i risultati tra pochi secondi.")
-        
-        elif text == '/help':
-            help_message = """
-🤖 <b>Comandi disponibili:</b>
+        print(f"💬 Messaggio ricevuto da {chat_id}: '{text}'")
+        if text.startswith('/'):
+            chat_commands = commands.setdefault(chat_id, [])
+            if text not in chat_commands:
+                chat_commands.append(text)
+    return commands, last_update_id
 
-/check - Controlla subito la disponibilità dei VPS
-/help - Mostra questo messaggio
-/status - Mostra lo stato del monitoraggio
 
-Il bot controlla automaticamente ogni ora e ti notifica quando cambia qualcosa!
-"""
-            send_telegram_message(help_message)
-        
-        elif text == '/status':
-            status_message = f"""
+def batch_messages(messages, limit=MAX_MESSAGE_LENGTH):
+    """Unisce le risposte in meno messaggi possibile, ognuno entro il limite di Telegram"""
+    batches = []
+    for message in messages:
+        message = message.strip()
+        if batches and len(batches[-1]) + 2 + len(message) <= limit:
+            batches[-1] += "\n\n" + message
+        else:
+            batches.append(message)
+    return batches
+
+
+def send_replies(chat_id, replies):
+    """Invia le risposte di una chat raggruppate (una sola sendMessage se stanno nel limite)"""
+    for message in batch_messages(replies):
+        send_telegram_message(message, chat_id=chat_id)
+
+
+def status_message():
+    """Stato del bot (versione GitHub Actions)"""
+    return f"""
 📊 <b>Status del Bot</b>
 
 ✅ Bot attivo e funzionante
@@ -148,17 +210,144 @@ Ultimo controllo messaggi: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
 
 Usa /check per un controllo immediato.
 """
-            send_telegram_message(status_message)
+
+
+def subscription_reply(registry, chat_id, command, args):
+    """
+    Gestisce /subscribe, /unsubscribe e /subscriptions.
+    Ritorna il testo della risposta, None se il comando non riguarda le iscrizioni
+    """
+    names = None
+    if command in ('/subscribe', '/unsubscribe') and args:
+        names = registry.match_products(args)
+        if not names:
+            return f"❓ Nessun prodotto corrisponde a '{args}'.\n\nUsa /subscriptions per vedere i nomi dei prodotti."
+    
+    if command == '/subscribe':
+        registry.subscribe(chat_id, names)
+        registry.save()
+    elif command == '/unsubscribe':
+        registry.unsubscribe(chat_id, names)
+        registry.save()
+    elif command != '/subscriptions':
+        return None
+    
+    followed = registry.products_for(chat_id)
+    if not followed:
+        return "🔕 Non ricevi notifiche. Usa /subscribe per iscriverti."
+    message = "🔔 <b>Notifiche attive per:</b>\n"
+    message += "".join(f"   • {name}\n" for name in followed)
+    others = [p['name'] for p in registry.products if p['name'] not in followed]
+    if others:
+        message += "\nAltri prodotti: " + ", ".join(others)
+    return message
+
+
+def load_config():
+    """Carica config.json (vuoto se manca: valgono i default)"""
+    try:
+        with open(CONFIG_FILE, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def set_github_output(name, value):
+    """Espone un valore agli step successivi del workflow (se eseguito su GitHub Actions)"""
+    output_file = os.environ.get('GITHUB_OUTPUT')
+    if output_file:
+        with open(output_file, 'a') as f:
+            f.write(f"{name}={value}\n")
+
+
+def load_recent_results(config):
+    """Ultimi risultati dallo storico, con il TTL della sezione "telegram" di config.json"""
+    ttl = config.get('telegram', {}).get('check_ttl_seconds', DEFAULT_CHECK_TTL)
+    if not os.path.exists(HISTORY_FILE):
+        return RecentResults(ttl)
+    return RecentResults.from_history(open_history_store('transitions', HISTORY_FILE), ttl)
+
+
+def format_recent_results(results, age):
+    """Risposta a /check con i risultati di un controllo recente"""
+    message = "🔍 <b>Netcup VPS ARM Check</b> (risultati recenti)\n"
+    message += f"♻️ Controllo di {age:.0f} secondi fa\n\n"
+    for result in results:
+        emoji = "✅" if result['available'] else "❌" if result['available'] is False else "❓"
+        message += f"{emoji} <b>{result['name']}</b>: {result['status']}\n"
+        if result['available']:
+            message += f"   🔗 <a href='{result['url']}'>Ordina ora!</a>\n"
+    return message
+
+
+def process_commands():
+    """Processa tutto l'arretrato dei comandi; ritorna True se serve un controllo"""
+    # L'offset viene letto una volta sola e salvato una volta sola alla fine
+    saved_update_id = get_last_update_id()
+    updates = drain_updates(saved_update_id)
+    
+    if not updates:
+        print("ℹ️ Nessun nuovo messaggio")
+        return False
+    
+    print(f"📬 Trovati {len(updates)} nuovi messaggi")
+    
+    commands, last_update_id = group_commands(updates, saved_update_id)
+    config = load_config()
+    registry = registry_from_config(config, load_products(config), TELEGRAM_CHAT_ID)
+    registry_before = json.dumps(registry.subscribers, sort_keys=True)
+    check_requesters = []
+    recent = None
+    
+    for chat_id, texts in commands.items():
+        replies = []
+        for text in texts:
+            command, args = parse_command(text)
+            if not is_authorized(chat_id, command, registry):
+                print(f"⚠️ Comando {command} ignorato da chat non iscritta: {chat_id}")
+                replies.append("🔒 Usa /subscribe per iscriverti alle notifiche e usare gli altri comandi.")
+                continue
+            
+            if command == '/check':
+                print("✅ Comando /check ricevuto!")
+                if recent is None:
+                    recent = load_recent_results(config)
+                # Solo i prodotti seguiti dalla chat (tutti quelli noti se config.json non li elenca)
+                followed = [p for p in registry.products if registry.wants(chat_id, p['name'])]
+                fresh, stale = recent.fresh(followed or None)
+                if fresh and not stale:
+                    print("♻️ Risultati recenti: risposta dalla cache, nessun nuovo controllo")
+                    replies.append(format_recent_results(fresh, recent.oldest_age(fresh)))
+                else:
+                    # Tutti i /check dell'esecuzione condividono un solo controllo
+                    check_requesters.append(str(chat_id))
+                    replies.append("🔍 Controllo disponibilità in corso...\nRiceverai i risultati tra pochi secondi.")
+            
+            elif command in ('/help', '/start'):
+                replies.append(HELP_MESSAGE)
+            
+            elif command == '/status':
+                replies.append(status_message())
+            
+            else:
+                reply = subscription_reply(registry, chat_id, command, args)
+                replies.append(reply or f"❓ Comando '{text}' non riconosciuto.\n\nUsa /help per vedere i comandi disponibili.")
         
-        elif text.startswith('/'):
-            send_telegram_message(f"❓ Comando '{text}' non riconosciuto.\n\nUsa /help per vedere i comandi disponibili.")
+        send_replies(chat_id, replies)
+    
+    if check_requesters:
+        with open(CHECK_REQUESTS_FILE, 'w') as f:
+            json.dump(check_requesters, f)
+    # Le iscrizioni vanno salvate nello stato del workflow solo se sono cambiate
+    subscriptions_changed = json.dumps(registry.subscribers, sort_keys=True) != registry_before
+    set_github_output('subscriptions_changed', str(subscriptions_changed).lower())
     
     # Salva l'ultimo update_id processato
-    if last_update_id > get_last_update_id():
+    if last_update_id > saved_update_id:
         save_last_update_id(last_update_id)
         print(f"💾 Salvato update_id: {last_update_id}")
     
-    return check_requested
+    return bool(check_requesters)
 
 
 def main():
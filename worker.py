@@ -0,0 +1,433 @@
+#!/usr/bin/env python3
+"""
+Netcup VPS ARM Availability Scraper - Worker
+Più processi (anche su macchine diverse che condividono lo stesso file SQLite)
+si dividono i prodotti con lease a tempo: ogni worker prende in carico un
+gruppo di prodotti in scadenza, li controlla, scrive i risultati nello storico
+condiviso e li rilascia con il prossimo controllo pianificato. Se un worker
+muore, i suoi lease scadono e i prodotti passano a un altro.
+I controlli al minuto crescono con il numero di worker
+
+Uso:
+    python worker.py [--config config.json] [--workers 4]
+    python worker.py --status
+"""
+
+import argparse
+import json
+import logging
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import time
+from contextlib import closing
+from datetime import datetime
+
+import metrics
+from http_session import close_session
+from scheduler import AdaptiveScheduler
+from scraper_github_actions import notify_transitions
+from scraper_light import NetcupScraperLight
+from subscribers import notifier_from_config, registry_from_config
+from telegram_command_handler import TELEGRAM_CHAT_ID, send_telegram_message
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STATE_FILE = 'worker_state.db'
+DEFAULT_LEASE_SECONDS = 300
+DEFAULT_BATCH_SIZE = 5
+# Storici scrivibili da più processi; con "transitions" latest() unisce i prodotti dei vari controlli
+SHARED_HISTORY_BACKENDS = ('transitions', 'sqlite')
+
+
+def require_shared_history(config):
+    """Il JSONL non ha lock tra processi e ogni riga conterrebbe solo i prodotti di un worker"""
+    backend = config.get('history_backend', 'jsonl')
+    if backend not in SHARED_HISTORY_BACKENDS:
+        raise ValueError(
+            f"history_backend \"{backend}\" non utilizzabile con i worker: "
+            f"impostare {' o '.join(SHARED_HISTORY_BACKENDS)} in config.json"
+        )
+
+
+class LeaseStore:
+    """
+    Stato condiviso dei worker in SQLite: per ogni prodotto il prossimo controllo,
+    lo stato dello scheduler e il lease corrente (worker e scadenza)
+    """
+
+    def __init__(self, path=DEFAULT_STATE_FILE, lease_seconds=DEFAULT_LEASE_SECONDS, clock=time.time):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.clock = clock
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS products ("
+                " name TEXT PRIMARY KEY,"
+                " product TEXT NOT NULL,"
+                " next_check REAL NOT NULL DEFAULT 0,"
+                " state TEXT NOT NULL DEFAULT '{}',"
+                " owner TEXT,"
+                " lease_until REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_products_next ON products (next_check)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS workers ("
+                " id TEXT PRIMARY KEY,"
+                " heartbeat REAL NOT NULL,"
+                " checks INTEGER NOT NULL DEFAULT 0)"
+            )
+            # Lock a tempo per i compiti da eseguire una volta sola (es. scansione del catalogo)
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS locks ("
+                " name TEXT PRIMARY KEY,"
+                " owner TEXT NOT NULL,"
+                " until REAL NOT NULL)"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+    def _connect(self):
+        # Una connessione per operazione, come lo storico: il file è condiviso da più processi
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def sync_products(self, products, prune=False):
+        """
+        Aggiunge i prodotti nuovi (subito in scadenza) e aggiorna gli altri.
+        prune: toglie i prodotti che non sono più nell'elenco
+        """
+        with closing(self._connect()) as conn, conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for product in products:
+                conn.execute(
+                    "INSERT INTO products (name, product) VALUES (?, ?)"
+                    " ON CONFLICT(name) DO UPDATE SET product = excluded.product",
+                    (product['name'], json.dumps(product))
+                )
+            if prune:
+                names = [p['name'] for p in products]
+                conn.execute(
+                    f"DELETE FROM products WHERE name NOT IN ({','.join('?' * len(names))})", names
+                )
+
+    def products(self):
+        with closing(self._connect()) as conn:
+            return [json.loads(row['product']) for row in conn.execute("SELECT product FROM products ORDER BY name")]
+
+    def claim(self, worker_id, limit):
+        """
+        Prende in carico fino a limit prodotti in scadenza, dal più in ritardo, tra quelli
+        liberi o con il lease scaduto (worker morto). Ritorna i prodotti presi
+        """
+        now = self.clock()
+        with closing(self._connect()) as conn, conn:
+            # BEGIN IMMEDIATE: due worker non possono prendere lo stesso prodotto
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(
+                "SELECT name, product FROM products"
+                " WHERE next_check <= ? AND (owner IS NULL OR lease_until < ?)"
+                " ORDER BY next_check LIMIT ?",
+                (now, now, limit)
+            ).fetchall()
+            conn.executemany(
+                "UPDATE products SET owner = ?, lease_until = ? WHERE name = ?",
+                [(worker_id, now + self.lease_seconds, row['name']) for row in rows]
+            )
+        return [json.loads(row['product']) for row in rows]
+
+    def states(self):
+        """Stato dello scheduler di ogni prodotto, con il prossimo controllo"""
+        with closing(self._connect()) as conn:
+            rows = conn.execute("SELECT name, next_check, state FROM products").fetchall()
+        return {row['name']: dict(json.loads(row['state']), next_check=row['next_check']) for row in rows}
+
+    def bursts(self):
+        return json.loads(self._meta('bursts') or '{}')
+
+    def _meta(self, key):
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row['value'] if row is not None else None
+
+    def _set_meta(self, key, value):
+        with closing(self._connect()) as conn, conn:
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def last_crawl(self):
+        """Ultima scansione del catalogo fatta da un worker qualsiasi (epoch, 0 se mai)"""
+        return float(self._meta('last_crawl') or 0)
+
+    def set_last_crawl(self, when):
+        self._set_meta('last_crawl', repr(when))
+
+    def complete(self, worker_id, checked, others, bursts):
+        """
+        Rilascia i prodotti controllati con il loro nuovo stato.
+        others: prossimo controllo degli altri prodotti, anticipato se è partita una raffica
+        (un controllo già più vicino non viene mai posticipato)
+        """
+        with closing(self._connect()) as conn, conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for name, state in checked.items():
+                state = dict(state)
+                next_check = state.pop('next_check')
+                # Anche con il lease scaduto il risultato vale: il nuovo proprietario lo ritrova
+                conn.execute(
+                    "UPDATE products SET next_check = ?, state = ?,"
+                    " owner = CASE WHEN owner = ? THEN NULL ELSE owner END,"
+                    " lease_until = CASE WHEN owner = ? THEN NULL ELSE lease_until END"
+                    " WHERE name = ?",
+                    (next_check, json.dumps(state), worker_id, worker_id, name)
+                )
+            conn.executemany(
+                "UPDATE products SET next_check = MIN(next_check, ?) WHERE name = ?",
+                [(next_check, name) for name, next_check in others.items()]
+            )
+            # Raffiche: vale la fine più lontana tra quelle viste dai vari worker
+            row = conn.execute("SELECT value FROM meta WHERE key = 'bursts'").fetchone()
+            merged = json.loads(row['value']) if row is not None else {}
+            for group, until in bursts.items():
+                merged[group] = max(until, merged.get(group, 0))
+            now = self.clock()
+            conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('bursts', ?)",
+                (json.dumps({group: until for group, until in merged.items() if until > now}),)
+            )
+            conn.execute(
+                "INSERT INTO workers (id, heartbeat, checks) VALUES (?, ?, ?)"
+                " ON CONFLICT(id) DO UPDATE SET heartbeat = excluded.heartbeat, checks = checks + excluded.checks",
+                (worker_id, self.clock(), len(checked))
+            )
+
+    def release(self, worker_id, names):
+        """Rilascia i lease senza risultati (controllo fallito): i prodotti tornano subito liberi"""
+        with closing(self._connect()) as conn, conn:
+            conn.executemany(
+                "UPDATE products SET owner = NULL, lease_until = NULL WHERE name = ? AND owner = ?",
+                [(name, worker_id) for name in names]
+            )
+
+    def heartbeat(self, worker_id):
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT INTO workers (id, heartbeat) VALUES (?, ?)"
+                " ON CONFLICT(id) DO UPDATE SET heartbeat = excluded.heartbeat",
+                (worker_id, self.clock())
+            )
+
+    def acquire(self, name, worker_id, seconds):
+        """Lock a tempo: True se il worker lo ottiene (libero, scaduto o già suo)"""
+        now = self.clock()
+        with closing(self._connect()) as conn, conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT owner, until FROM locks WHERE name = ?", (name,)).fetchone()
+            if row is not None and row['owner'] != worker_id and row['until'] > now:
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO locks (name, owner, until) VALUES (?, ?, ?)",
+                (name, worker_id, now + seconds)
+            )
+            return True
+
+    def seconds_until_next(self):
+        """Secondi fino al prossimo prodotto in scadenza (o al primo lease che scade)"""
+        now = self.clock()
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT MIN(MAX(next_check, COALESCE(lease_until, 0))) FROM products"
+            ).fetchone()
+        return max(0.0, row[0] - now) if row[0] is not None else None
+
+    def status(self):
+        """Worker (ultimo heartbeat e controlli) e prodotti con proprietario e prossimo controllo"""
+        with closing(self._connect()) as conn:
+            workers = [dict(row) for row in conn.execute("SELECT * FROM workers ORDER BY id")]
+            products = [dict(row) for row in conn.execute(
+                "SELECT name, next_check, owner, lease_until FROM products ORDER BY next_check")]
+        return workers, products
+
+
+class Worker:
+    def __init__(self, config_file='config.json', worker_id=None, index=0):
+        """
+        worker_id: nome del worker nello stato condiviso (default: host:pid).
+        index: posizione tra i worker avviati insieme (porta delle metriche)
+        """
+        with open(config_file, 'r') as f:
+            require_shared_history(json.load(f))
+        self.scraper = NetcupScraperLight(config_file)
+        self.config = self.scraper.config
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.index = index
+
+        settings = self.config.get('worker', {})
+        self.store = LeaseStore(
+            settings.get('state_file', DEFAULT_STATE_FILE),
+            settings.get('lease_seconds', DEFAULT_LEASE_SECONDS),
+        )
+        self.batch_size = settings.get('batch_size', DEFAULT_BATCH_SIZE)
+        self.idle_poll = settings.get('idle_poll_seconds', 30)
+
+        # Scheduler solo in memoria: lo stato vero è nel LeaseStore, condiviso
+        self.scheduler = AdaptiveScheduler.from_config(self.config, self.scraper.products,
+                                                       self.scraper.history, state_file='')
+        self.registry = registry_from_config(self.config, self.scraper.products, TELEGRAM_CHAT_ID)
+        self.notifier = notifier_from_config(self.config, send_telegram_message)
+
+    def _catalog_due(self):
+        crawler = self.scraper.crawler
+        last_crawl = max(self.store.last_crawl(), crawler.catalog.get('last_crawl', 0))
+        return crawler.enabled and time.time() - last_crawl >= crawler.refresh_interval
+
+    def refresh_catalog(self):
+        """
+        Un solo worker per refresh_hours scansiona il catalogo e pubblica i prodotti nuovi.
+        L'ultima scansione è nello stato condiviso (il catalog.json di ogni worker non viene
+        riletto) e si ricontrolla dopo aver preso il lock: un altro worker può averla appena fatta
+        """
+        if not self._catalog_due():
+            return
+        if not self.store.acquire('catalog', self.worker_id, self.store.lease_seconds) or not self._catalog_due():
+            return
+        changed = self.scraper.refresh_catalog(force=True)
+        self.store.set_last_crawl(time.time())
+        if changed:
+            self.store.sync_products(self.scraper.products, prune=True)
+
+    def run_once(self):
+        """Prende in carico un gruppo di prodotti e li controlla; ritorna quanti"""
+        products = self.store.claim(self.worker_id, self.batch_size)
+        if not products:
+            return 0
+        logger.info(f"[{self.worker_id}] Presi in carico: {', '.join(p['name'] for p in products)}")
+
+        # Lo scheduler locale riparte dallo stato condiviso (altri worker, raffiche in corso)
+        all_products = self.store.products()
+        self.scheduler.set_products(all_products)
+        self.registry.products = all_products
+        shared = self.store.states()
+        self.scheduler.update_states(shared)
+        self.scheduler.bursts = self.store.bursts()
+
+        try:
+            results = self.scraper.check_products(products)
+        except Exception as e:
+            # Il worker resta vivo e i prodotti non aspettano la scadenza del lease
+            logger.error(f"[{self.worker_id}] Controllo fallito, lease rilasciati: {e}")
+            self.store.release(self.worker_id, [p['name'] for p in products])
+            return len(products)
+        self.scraper.save_results(results)
+        transitions = self.scheduler.record(results)
+        # Niente budget orario condiviso: il carico dipende dagli intervalli dei prodotti
+        self.scheduler.recent_checks.clear()
+
+        checked = {p['name']: self.scheduler.state[p['name']] for p in products}
+        others = {
+            name: state['next_check'] for name, state in self.scheduler.state.items()
+            if name not in checked and name in shared and state['next_check'] < shared[name]['next_check']
+        }
+        self.store.complete(self.worker_id, checked, others, self.scheduler.bursts)
+
+        for result, previous_status in transitions:
+            logger.warning(f"🔔 {result['name']}: {previous_status} → {result['status']}")
+        if transitions:
+            notify_transitions(self.notifier, self.registry, transitions)
+        return len(products)
+
+    def run(self):
+        """Ciclo del worker: prende lavoro finché ce n'è, altrimenti dorme fino alla prossima scadenza"""
+        port = self.config.get('metrics', {}).get('port')
+        if port:
+            # Un endpoint per worker sulla stessa macchina: porta + indice
+            metrics.start_metrics_server(port + self.index, self.config['metrics'].get('host', '0.0.0.0'))
+
+        self.store.sync_products(self.scraper.products, prune=True)
+        logger.info(f"Avvio worker {self.worker_id} (stato condiviso in {self.store.path})")
+        try:
+            while True:
+                self.refresh_catalog()
+                if self.run_once():
+                    continue
+                self.store.heartbeat(self.worker_id)
+                wait = self.store.seconds_until_next()
+                time.sleep(max(1.0, min(self.idle_poll, wait if wait is not None else self.idle_poll)))
+        except KeyboardInterrupt:
+            logger.info(f"\nWorker {self.worker_id} interrotto dall'utente")
+        finally:
+            self.scraper.cache.save()
+            close_session()
+
+
+def run_workers(config_file, count):
+    """Avvia count worker come processi separati sulla stessa macchina e li attende"""
+    host = socket.gethostname()
+    processes = [
+        subprocess.Popen([sys.executable, os.path.abspath(__file__), '--config', config_file,
+                          '--worker-id', f"{host}:{i}", '--index', str(i)])
+        for i in range(count)
+    ]
+    try:
+        for process in processes:
+            process.wait()
+    except KeyboardInterrupt:
+        # Ctrl+C arriva anche ai figli; chi non si ferma viene terminato
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.terminate()
+
+
+def print_status(config_file):
+    """Stato dei worker e dei lease"""
+    with open(config_file, 'r') as f:
+        config = json.load(f)
+    store = LeaseStore(config.get('worker', {}).get('state_file', DEFAULT_STATE_FILE))
+    workers, products = store.status()
+    now = time.time()
+
+    print("👷 Worker:")
+    for worker in workers:
+        heartbeat = datetime.fromtimestamp(worker['heartbeat']).strftime('%H:%M:%S')
+        print(f"   {worker['id']}: {worker['checks']} controlli, ultimo segnale alle {heartbeat}")
+    print("📦 Prodotti:")
+    for product in products:
+        owner = ""
+        if product['owner'] and product['lease_until'] > now:
+            owner = f" (in carico a {product['owner']})"
+        print(f"   {product['name']}: tra {max(0.0, product['next_check'] - now) / 60:.1f} minuti{owner}")
+
+
+def main():
+    """Funzione principale"""
+    parser = argparse.ArgumentParser(description="Worker che si dividono i controlli con lease condivisi")
+    parser.add_argument('--config', default='config.json')
+    parser.add_argument('--workers', type=int, default=1, help="Worker da avviare su questa macchina")
+    parser.add_argument('--worker-id', help="Nome del worker (default: host:pid)")
+    parser.add_argument('--index', type=int, default=0, help=argparse.SUPPRESS)
+    parser.add_argument('--status', action='store_true', help="Mostra worker e lease ed esce")
+    args = parser.parse_args()
+
+    if args.status:
+        print_status(args.config)
+        return
+
+    with open(args.config, 'r') as f:
+        config = json.load(f)
+    try:
+        require_shared_history(config)
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    if args.workers > 1:
+        run_workers(args.config, args.workers)
+    else:
+        Worker(args.config, args.worker_id, args.index).run()
+
+
+if __name__ == "__main__":
+    main()